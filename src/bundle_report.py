@@ -0,0 +1,238 @@
+"""
+Build-time helpers for conda.exe.spec to keep the bundle small and quick to extract.
+
+Imported by the spec only; not part of the conda-standalone binary.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import stat
+import zipfile
+from collections import defaultdict
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Iterable
+
+# Modules inside packages with these names are only needed to test the bundled packages
+TEST_MODULE_NAMES = frozenset({"test", "tests", "testing", "conftest"})
+ROOT_GROUP = "<root>"
+
+
+def is_runtime_module(name: str) -> bool:
+    """Filter for ``collect_submodules`` that skips test modules and packages."""
+    return TEST_MODULE_NAMES.isdisjoint(name.split("."))
+
+
+def load_traced_modules(trace_dir: str | os.PathLike) -> set[str]:
+    """
+    Return the names of all modules imported in the startup profiles inside ``trace_dir``.
+
+    The profiles are the JSON files written by conda-standalone when
+    ``CONDA_STANDALONE_STARTUP_PROFILE`` is set, one per traced command.
+    """
+    modules = set()
+    profiles = sorted(Path(trace_dir).glob("*.json"))
+    if not profiles:
+        raise FileNotFoundError(f"No startup profiles found in {trace_dir}.")
+    for profile in profiles:
+        report = json.loads(profile.read_text())
+        nodes = [node for thread_nodes in report["imports"].values() for node in thread_nodes]
+        while nodes:
+            node = nodes.pop()
+            modules.add(node["module"])
+            nodes.extend(node["children"])
+    return modules
+
+
+def trim_hiddenimports(
+    hiddenimports: list[str], traced_modules: set[str]
+) -> tuple[list[str], list[str]]:
+    """
+    Split the hidden imports into those imported by a traced command and the rest.
+
+    Modules found by the import analysis of PyInstaller are bundled either way,
+    so only modules that are loaded dynamically and were not traced are dropped.
+    """
+    kept = []
+    dropped = []
+    for name in hiddenimports:
+        module = name.removesuffix(".__init__")
+        (kept if module in traced_modules else dropped).append(name)
+    return kept, dropped
+
+
+def _group(name: str, typecode: str) -> str:
+    if typecode == "PYMODULE":
+        return name.split(".")[0]
+    parts = Path(name).parts
+    return parts[0] if len(parts) > 1 else ROOT_GROUP
+
+
+def size_report(tocs: dict[str, list[tuple]], traced_modules: set[str] | None = None) -> dict:
+    """
+    Sum up the size of the bundled files per top-level package.
+
+    ``tocs`` maps a kind (e.g. ``modules``, ``binaries``, ``datas``) to a PyInstaller TOC.
+    The sizes are those of the source files before compression. If ``traced_modules``
+    is given, the report also contains the size of the modules that were not traced.
+    """
+    packages: dict[str, dict[str, int]] = defaultdict(lambda: defaultdict(int))
+    for kind, toc in tocs.items():
+        for name, path, typecode in toc:
+            try:
+                size = os.path.getsize(path)
+            except (OSError, TypeError):
+                continue
+            package = packages[_group(name, typecode)]
+            package[f"{kind}_bytes"] += size
+            package["total_bytes"] += size
+            if typecode == "PYMODULE":
+                package["modules"] += 1
+                if traced_modules is not None:
+                    if name in traced_modules:
+                        package["traced_modules"] += 1
+                    else:
+                        package["untraced_module_bytes"] += size
+    return {
+        "total_bytes": sum(package["total_bytes"] for package in packages.values()),
+        "traced": traced_modules is not None,
+        "packages": {
+            name: dict(package)
+            for name, package in sorted(
+                packages.items(), key=lambda item: item[1]["total_bytes"], reverse=True
+            )
+        },
+    }
+
+
+def format_report(report: dict, limit: int = 25) -> str:
+    lines = [f"{'package':<32} {'total MB':>10} {'modules':>8} {'untraced MB':>12}"]
+    for name, package in list(report["packages"].items())[:limit]:
+        untraced = (
+            f"{package.get('untraced_module_bytes', 0) / 1e6:>12.2f}" if report["traced"] else ""
+        )
+        lines.append(
+            f"{name:<32} {package['total_bytes'] / 1e6:>10.2f} "
+            f"{package.get('modules', 0):>8} {untraced}".rstrip()
+        )
+    lines.append(f"{'total':<32} {report['total_bytes'] / 1e6:>10.2f}")
+    return "\n".join(lines)
+
+
+def check_size_budget(report: dict, budget: int) -> None:
+    """Fail the build if the bundled files are larger than ``budget`` bytes."""
+    if report["total_bytes"] > budget:
+        largest = ", ".join(
+            f"{name} ({package['total_bytes'] / 1e6:.1f} MB)"
+            for name, package in list(report["packages"].items())[:5]
+        )
+        raise SystemExit(
+            f"ERROR: The bundle is {report['total_bytes'] / 1e6:.1f} MB, which exceeds "
+            f"the size budget of {budget / 1e6:.1f} MB. Largest packages: {largest}."
+        )
+
+
+def _matches(dest_name: str, prefixes: Iterable[str]) -> bool:
+    dest_name = Path(dest_name).as_posix()
+    return any(dest_name == prefix or dest_name.startswith(f"{prefix}/") for prefix in prefixes)
+
+
+def _dependency_closure(roots: Iterable[str], dependencies: dict[str, set[str]]) -> set[str]:
+    closure = set()
+    todo = list(roots)
+    while todo:
+        name = todo.pop()
+        if name not in closure:
+            closure.add(name)
+            todo.extend(dependencies.get(name, ()))
+    return closure
+
+
+def split_lazy_components(
+    binaries: list[tuple],
+    datas: list[tuple],
+    components: dict[str, tuple[str, ...]],
+    get_imports: Callable[[str], Iterable[tuple[str, str | None]]],
+) -> tuple[list[tuple], list[tuple], dict[str, list[tuple]]]:
+    """
+    Move the files of components that are extracted on first use out of the TOCs.
+
+    ``components`` maps the name of a component to the destination directories of its files.
+    Shared libraries that were only collected because the binaries of a component link to them
+    are moved with it. Extension modules and libraries that no other binary links to, e.g.
+    those loaded with ctypes, are kept unless they belong to the component.
+    ``get_imports`` returns the names and resolved paths of the libraries a binary links to.
+    Returns the remaining binaries and datas and the TOC of each component.
+    """
+    files_by_path: dict[str, set[str]] = defaultdict(set)
+    for name, path, typecode in binaries:
+        if typecode != "SYMLINK":
+            files_by_path[os.path.realpath(path)].add(name)
+    dependencies: dict[str, set[str]] = {}
+    for name, path, typecode in binaries:
+        if typecode != "SYMLINK":
+            dependencies[name] = {
+                dependency
+                for _, dependency_path in get_imports(path)
+                if dependency_path
+                for dependency in files_by_path.get(os.path.realpath(dependency_path), ())
+            }
+    linked = set().union(*dependencies.values())
+    extensions = {name for name, _, typecode in binaries if typecode == "EXTENSION"}
+    roots = extensions | (set(dependencies) - linked)
+    lazy_binaries = {}
+    for component, prefixes in components.items():
+        component_roots = {name for name in dependencies if _matches(name, prefixes)}
+        lazy_binaries[component] = _dependency_closure(
+            component_roots, dependencies
+        ) - _dependency_closure(roots - component_roots, dependencies)
+
+    tocs: dict[str, list[tuple]] = {component: [] for component in components}
+    kept_binaries = []
+    for entry in binaries:
+        name, path, typecode = entry
+        if typecode == "SYMLINK":
+            target = os.path.normpath(os.path.join(os.path.dirname(name), path))
+        else:
+            target = name
+        for component, names in lazy_binaries.items():
+            if target in names:
+                tocs[component].append(entry)
+                break
+        else:
+            kept_binaries.append(entry)
+    kept_datas = []
+    for entry in datas:
+        for component, prefixes in components.items():
+            if _matches(entry[0], prefixes):
+                tocs[component].append(entry)
+                break
+        else:
+            kept_datas.append(entry)
+    return kept_binaries, kept_datas, tocs
+
+
+def write_component_archive(
+    toc: list[tuple], archive: str | os.PathLike, process_binary: Callable[[str, str, str], str]
+) -> None:
+    """
+    Write the files of a component into a ZIP archive, keeping file modes and symbolic links.
+
+    ``process_binary`` prepares a binary like PyInstaller does before bundling it,
+    e.g. by stripping it, and returns the path of the processed file.
+    """
+    with zipfile.ZipFile(archive, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for name, path, typecode in sorted(toc):
+            arcname = Path(name).as_posix()
+            if typecode == "SYMLINK":
+                info = zipfile.ZipInfo(arcname)
+                info.external_attr = (stat.S_IFLNK | 0o777) << 16
+                zf.writestr(info, Path(path).as_posix())
+                continue
+            if typecode in ("BINARY", "EXTENSION"):
+                path = process_binary(path, name, typecode)
+            zf.write(path, arcname)
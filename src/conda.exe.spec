@@ -1,12 +1,20 @@
 # -*- mode: python ; coding: utf-8 -*-
+import json
 import os
 import platform
 import site
 import sys
+from importlib.metadata import distributions
 
 import conda.plugins.manager
 from conda import __version__ as conda_version
+from conda.plugins.hookspec import spec_name
 from menuinst.platforms.base import SCHEMA_VERSION
+from PyInstaller import __version__ as pyinstaller_version
+from PyInstaller.archive.writers import CArchiveWriter
+from PyInstaller.building.utils import process_collected_binary
+from PyInstaller.config import CONF
+from PyInstaller.depend.bindepend import get_imports
 from PyInstaller.utils.hooks import collect_data_files, collect_submodules, copy_metadata
 
 from PyInstaller.utils.hooks import collect_submodules, copy_metadata
@@ -37,7 +45,26 @@ for arg in sys.argv:
 else:
     HERE = os.path.join(os.path.getcwd(), "src")
 
+# Build helpers and conda_constructor live next to this file
+sys.path.insert(0, HERE)
+from bundle_report import (
+    check_size_budget,
+    format_report,
+    is_runtime_module,
+    load_traced_modules,
+    size_report,
+    split_lazy_components,
+    trim_hiddenimports,
+    write_component_archive,
+)
+from conda_constructor.background import parse_size
+from conda_constructor.lazy_components import archive_name, supports_package_format
+from conda_constructor.plugin_cache import describe_plugin
+
 block_cipher = None
+# Bytecode optimization level of the bundled modules and the interpreter:
+# 1 removes assert statements and 2 also removes docstrings
+optimize = int(os.environ.get("PYINSTALLER_OPTIMIZE", 0))
 sitepackages = os.environ.get(
     "SP_DIR",  # site-packages in conda-build's host environment
     # if not defined, get running Python's site-packages
@@ -108,7 +135,7 @@ packages = [
 for package in packages:
     # collect_submodules does not look at __init__
     hiddenimports.append(f"{package}.__init__")
-    hiddenimports.extend(collect_submodules(package))
+    hiddenimports.extend(collect_submodules(package, filter=is_runtime_module))
 
 # Add .condarc file to bundle to configure channels
 # during the package building stage
@@ -127,7 +154,7 @@ for name, module in conda_plugin_manager.list_name_plugin():
     if module.__name__.startswith("conda."):
         continue
     package_name = module.__name__.split(".")[0]
-    hiddenimports.extend(collect_submodules(package_name))
+    hiddenimports.extend(collect_submodules(package_name, filter=is_runtime_module))
     # collect_submodules does not look at __init__
     hiddenimports.append(f"{package_name}.__init__")
     if package_name == "menuinst":
@@ -137,6 +164,69 @@ for name, module in conda_plugin_manager.list_name_plugin():
     # metadata is needed for conda to find the plug-in
     datas.extend(copy_metadata(package_name))
 
+# Startup profiles of representative commands, see CONDA_STANDALONE_STARTUP_PROFILE.
+# With PYINSTALLER_TRIM_UNTRACED=1, collected modules that none of them imports are dropped.
+traced_modules = None
+if os.environ.get("PYINSTALLER_IMPORT_TRACES"):
+    traced_modules = load_traced_modules(os.environ["PYINSTALLER_IMPORT_TRACES"])
+    if os.environ.get("PYINSTALLER_TRIM_UNTRACED") == "1":
+        hiddenimports, dropped_imports = trim_hiddenimports(hiddenimports, traced_modules)
+        print(f"Dropped {len(dropped_imports)} collected modules that no traced command imports.")
+
+# Write the entry points of the conda plug-ins so that the frozen binary
+# does not need to scan the package metadata to find them.
+# Same order as in CondaPluginManager.load_entrypoints.
+plugin_entry_points = [
+    (entry_point.name, entry_point.value)
+    for dist in distributions()
+    for entry_point in dist.entry_points
+    if entry_point.group == spec_name
+]
+# Plug-ins that are expensive to import are only imported when one of their solvers or
+# subcommands is used, see conda_constructor.plugin_cache.
+DEFERRED_PLUGINS = ["conda-libmamba-solver"]
+deferred_plugins = {}
+for name, value in plugin_entry_points:
+    plugin = conda_plugin_manager.get_plugin(value)
+    if name not in DEFERRED_PLUGINS or plugin is None:
+        continue
+    description = describe_plugin(plugin)
+    if description is None:
+        print(f"WARNING: cannot defer loading plug-in {name}.", file=sys.stderr)
+        continue
+    deferred_plugins[name] = description
+with open(os.path.join(HERE, "_plugins.py"), "w") as f:
+    f.write(f"ENTRY_POINTS = {plugin_entry_points!r}\n")
+    f.write(f"DEFERRED_PLUGINS = {deferred_plugins!r}\n")
+datas.append((os.path.join(HERE, "_plugins.py"), "conda_constructor"))
+
+# Components that only some commands use are not extracted at every start of the
+# single-file binary. Their files are stored in secondary archives instead, which are
+# unpacked when one of the modules is imported, see conda_constructor.lazy_components.
+# Maps each component to the modules that need it and the destination directories of its files.
+LAZY_COMPONENTS = {
+    "libmambapy": (["libmambapy"], ["libmambapy"]),
+    "menuinst": (["menuinst"], ["menuinst"]),
+    "shell": (["conda.activate", "conda.core.initialize"], ["conda/shell"]),
+}
+lazy_components = []
+if os.environ.get("variant", "") != "onedir":
+    lazy_components = os.environ.get(
+        "PYINSTALLER_LAZY_COMPONENTS", ",".join(LAZY_COMPONENTS)
+    ).split(",")
+    lazy_components = [component for component in lazy_components if component]
+if lazy_components and not supports_package_format(pyinstaller_version, CArchiveWriter):
+    # The bootloader extracts all files instead
+    print(
+        f"WARNING: The package format of PyInstaller {pyinstaller_version} is not supported "
+        "by conda_constructor.lazy_components, all components are extracted at startup."
+    )
+    lazy_components = []
+lazy_modules = {component: LAZY_COMPONENTS[component][0] for component in lazy_components}
+with open(os.path.join(HERE, "_lazy.py"), "w") as f:
+    f.write(f"COMPONENTS = {lazy_modules!r}\n")
+datas.append((os.path.join(HERE, "_lazy.py"), "conda_constructor"))
+
 # Write version file to capture the package version since
 # conda-standalone may have postN releases.
 version = os.environ.get("PKG_VERSION", conda_version)
@@ -157,7 +247,51 @@ a = Analysis(['entry_point.py'],
              win_no_prefer_redirects=False,
              win_private_assemblies=False,
              cipher=block_cipher,
-             noarchive=False)
+             noarchive=False,
+             optimize=optimize)
+
+# Report the size of the bundle per package and enforce the size budget if set
+bundle_report = size_report(
+    {"modules": a.pure, "binaries": a.binaries, "datas": a.datas}, traced_modules
+)
+print(format_report(bundle_report))
+if os.environ.get("PYINSTALLER_BUNDLE_REPORT"):
+    with open(os.environ["PYINSTALLER_BUNDLE_REPORT"], "w") as f:
+        json.dump(bundle_report, f, indent=2)
+if os.environ.get("PYINSTALLER_SIZE_BUDGET"):
+    check_size_budget(bundle_report, parse_size(os.environ["PYINSTALLER_SIZE_BUDGET"]))
+
+lazy_archives = []
+if lazy_components:
+    lazy_binaries, lazy_datas, lazy_tocs = split_lazy_components(
+        a.binaries,
+        a.datas,
+        {component: LAZY_COMPONENTS[component][1] for component in lazy_components},
+        get_imports,
+    )
+    for component, toc in lazy_tocs.items():
+        archive = os.path.join(workpath, f"{component}.zip")
+        # Prepare binaries like EXE does for the files it extracts
+        write_component_archive(
+            toc,
+            archive,
+            lambda path, name, typecode: process_collected_binary(
+                path,
+                name,
+                use_strip=(sys.platform != "win32"),
+                use_upx=CONF["upx_available"],
+                strict_arch_validation=(typecode == "EXTENSION"),
+            ),
+        )
+        print(
+            f"Moved {len(toc)} files of {component} into a secondary archive of "
+            f"{os.path.getsize(archive) / 1e6:.1f} MB."
+        )
+        # PKG entries are embedded in the executable but not extracted by the bootloader
+        lazy_archives.append((archive_name(component), archive, "PKG"))
+else:
+    lazy_binaries, lazy_datas = a.binaries, a.datas
+
 pyz = PYZ(a.pure, a.zipped_data,
              cipher=block_cipher)
 
@@ -165,10 +299,14 @@ if os.environ.get("variant", "") == "onedir":
     variant_args = ()
     extra_exe_kwargs["exclude_binaries"] = True
 else:
-    variant_args = (a.binaries, a.zipfiles, a.datas, [])
+    variant_args = (lazy_binaries, a.zipfiles, lazy_datas, lazy_archives)
+
+# The interpreter runs with the same optimization level as the bundled bytecode
+python_options = [("O", None, "OPTION")] * optimize
 
 exe = EXE(pyz,
           a.scripts,
+          python_options,
           *variant_args,
           name='conda.exe',
           icon=os.path.join(HERE, "icon.ico"),
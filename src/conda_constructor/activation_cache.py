@@ -0,0 +1,253 @@
+"""Run ``conda.exe run`` commands without a wrapper script if possible.
+
+conda runs every command through a temporary shell script that loads the shell hook of conda,
+activates the environment and then runs the command. Loading the hook and activating each
+start conda-standalone again. Unless the environment has activation scripts, the only thing
+activation does is changing environment variables, so conda-standalone computes these changes
+in-process with the activator of conda and runs the command directly.
+
+The changes are cached per environment, keyed by the environment variables that activation
+reads. A cache entry is invalid once ``conda-meta`` or the activation scripts of the
+environment change, or once a configuration file in the search path of conda is created or
+changes. With a valid entry, conda-standalone runs the command without importing conda at all.
+``CONDA_STANDALONE_ACTIVATION_CACHE`` overrides the location of the cache.
+
+Commands that need the wrapper script, e.g. multi-line scripts, environments with activation
+or deactivation scripts, or runs with ``--dev`` or ``--debug-wrapper-scripts``, use it as usual.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import sys
+from typing import TYPE_CHECKING
+
+from .cache_entries import (
+    KEY_ENV_PREFIXES,
+    SYS_PREFIX_PLACEHOLDER,
+    config_stamps,
+    directory_stamps,
+    load_entry,
+    stamp,
+    write_entry,
+)
+
+if TYPE_CHECKING:
+    from argparse import ArgumentParser, Namespace
+    from collections.abc import Sequence
+
+CACHE_ENV_VAR = "CONDA_STANDALONE_ACTIVATION_CACHE"
+
+# The environment before conda-standalone changes it for conda run
+_key_environ: dict[str, str] | None = None
+
+
+def record_environment() -> None:
+    """Remember the environment variables that the cache entries are keyed by.
+
+    Must be called before conda-standalone sets up the environment for conda run, which adds
+    paths that are different for every run of the single-file binary.
+    """
+    global _key_environ
+
+    _key_environ = {
+        name: value.replace(sys.prefix, SYS_PREFIX_PLACEHOLDER)
+        for name, value in os.environ.items()
+        if name == "PATH"
+        or (name.startswith(KEY_ENV_PREFIXES) and not name.startswith("CONDA_STANDALONE_"))
+    }
+
+
+def _cache_path(prefix: str) -> str | None:
+    if _key_environ is None:
+        return None
+    import hashlib
+
+    # A new conda-standalone may activate environments differently
+    key = json.dumps(
+        [prefix, sys.executable, stamp(sys.executable), sorted(_key_environ.items())],
+        separators=(",", ":"),
+    )
+    cache_dir = os.environ.get(CACHE_ENV_VAR)
+    if not cache_dir:
+        from platformdirs import user_cache_dir
+
+        cache_dir = os.path.join(user_cache_dir("conda-standalone", appauthor=False), "activation")
+    return os.path.join(cache_dir, f"{hashlib.sha256(key.encode()).hexdigest()}.json")
+
+
+def _stamps(prefix: str) -> dict[str, int | None]:
+    """Return the modification times of the files that activation depends on."""
+    stamps = {
+        **config_stamps([prefix]),
+        os.path.join(prefix, "conda-meta"): stamp(os.path.join(prefix, "conda-meta")),
+        # Environment variables set with `conda env config vars`
+        os.path.join(prefix, "conda-meta", "state"): stamp(
+            os.path.join(prefix, "conda-meta", "state")
+        ),
+        **directory_stamps(os.path.join(prefix, "etc", "conda", "activate.d")),
+    }
+    # The environment that is active now is deactivated first
+    old_prefix = os.environ.get("CONDA_PREFIX")
+    if old_prefix and old_prefix != prefix:
+        stamps.update(directory_stamps(os.path.join(old_prefix, "etc", "conda", "deactivate.d")))
+    return stamps
+
+
+def _activate(prefix: str) -> dict:
+    """Compute the changes activating ``prefix`` makes to the environment variables."""
+    from conda.activate import CmdExeActivator, PosixActivator
+
+    activator = CmdExeActivator() if sys.platform == "win32" else PosixActivator()
+    # Read the files before activating, so that changes in between invalidate the entry
+    stamps = _stamps(prefix)
+    changes = activator.build_activate(prefix)
+    return {
+        "stamps": stamps,
+        "direct": not changes["activate_scripts"] and not changes["deactivate_scripts"],
+        "export_vars": {
+            name: str(value).replace(sys.prefix, SYS_PREFIX_PLACEHOLDER)
+            for name, value in changes["export_vars"].items()
+        },
+        "unset_vars": list(changes["unset_vars"]),
+    }
+
+
+def _run_directly(
+    entry: dict, executable_call: Sequence[str], cwd: str, capture_output: bool
+) -> int | None:
+    """Run the command with the environment of an activated environment.
+
+    Returns None if the executable cannot be found, e.g. because it is a shell builtin.
+    """
+    import shutil
+    import subprocess
+
+    env = os.environ.copy()
+    for name in entry["unset_vars"]:
+        env.pop(name, None)
+    env.update(
+        (name, value.replace(SYS_PREFIX_PLACEHOLDER, sys.prefix))
+        for name, value in entry["export_vars"].items()
+    )
+    if sys.platform == "win32":
+        # Like the wrapper script of conda
+        env.update(PYTHONIOENCODING="utf-8", PYTHONUTF8="1")
+    # Search the PATH of the environment, which Windows would not do for the child process
+    executable = shutil.which(executable_call[0], path=env.get("PATH"))
+    if executable is None:
+        return None
+    pipe = subprocess.PIPE if capture_output else None
+    process = subprocess.Popen(
+        [executable, *executable_call[1:]],
+        cwd=os.path.abspath(cwd),
+        stdin=pipe,
+        stdout=pipe,
+        stderr=pipe,
+        env=env,
+        text=True,
+        errors="replace",
+    )
+    stdout, stderr = process.communicate()
+    # Print the output like conda run does
+    if stdout:
+        print(stdout, file=sys.stdout)
+    if stderr:
+        print(stderr, file=sys.stderr)
+    if process.returncode != 0:
+        print(
+            f"ERROR conda.cli.main_run:execute: `conda run {' '.join(executable_call)}` failed. "
+            "(See above for error)",
+            file=sys.stderr,
+        )
+    return process.returncode
+
+
+def _parse_run_args(argv: Sequence[str]) -> tuple[str, str, bool, list[str]] | None:
+    """Parse the arguments of ``conda run`` that a run without conda supports.
+
+    Returns None if conda has to handle the arguments, e.g. to look up an environment by name.
+    Options of conda-standalone, like --profile, are not supported either, unless they belong
+    to the command that is run.
+    """
+    prefix = None
+    cwd = os.getcwd()
+    capture_output = True
+    args = list(argv)
+    while args and args[0].startswith("-"):
+        option, has_value, value = args.pop(0).partition("=")
+        if option in ("-p", "--prefix", "--cwd"):
+            if not has_value:
+                if not args:
+                    return None
+                value = args.pop(0)
+            if option == "--cwd":
+                cwd = value
+            else:
+                prefix = value
+        elif option in ("--no-capture-output", "--live-stream") and not has_value:
+            capture_output = False
+        else:
+            return None
+    if prefix is None or not args or any("\n" in arg for arg in args):
+        return None
+    return os.path.abspath(os.path.expanduser(prefix)), cwd, capture_output, args
+
+
+def run_cached(argv: Sequence[str]) -> int | None:
+    """Run ``conda run <argv>`` from a cache entry without importing conda.
+
+    Returns None if there is no valid cache entry that allows running the command directly.
+    """
+    parsed = _parse_run_args(argv)
+    if parsed is None:
+        return None
+    prefix, cwd, capture_output, executable_call = parsed
+    cache_path = _cache_path(prefix)
+    if cache_path is None or prefix == sys.prefix:
+        return None
+    entry = load_entry(cache_path)
+    if entry is None or not entry["direct"]:
+        return None
+    from . import startup_profile
+
+    with startup_profile.span("run from activation cache"):
+        return _run_directly(entry, executable_call, cwd, capture_output)
+
+
+def use_activation_cache() -> None:
+    """Make ``conda run`` compute the activation in-process and run commands directly."""
+    from conda.cli import main_run
+
+    original_execute = main_run.execute
+
+    def execute(args: Namespace, parser: ArgumentParser) -> int:
+        from conda.base.context import context
+        from conda.common.path import paths_equal
+
+        prefix = context.target_prefix
+        if (
+            args.dev
+            or args.debug_wrapper_scripts
+            or not args.executable_call
+            or any("\n" in arg for arg in args.executable_call)
+            or paths_equal(prefix, sys.prefix)
+            or not os.path.isdir(os.path.join(prefix, "conda-meta"))
+        ):
+            return original_execute(args, parser)
+        cache_path = _cache_path(prefix)
+        entry = load_entry(cache_path) if cache_path else None
+        if entry is None:
+            entry = _activate(prefix)
+            if cache_path:
+                write_entry(cache_path, entry)
+        if entry["direct"]:
+            return_code = _run_directly(
+                entry, args.executable_call, args.cwd, not args.no_capture_output
+            )
+            if return_code is not None:
+                return return_code
+        return original_execute(args, parser)
+
+    main_run.execute = execute
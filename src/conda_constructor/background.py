@@ -0,0 +1,117 @@
+"""Helpers to keep installer operations from competing with foreground work."""
+
+from __future__ import annotations
+
+import ctypes
+import logging
+import os
+import platform
+import sys
+import time
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from typing import BinaryIO
+
+logger = logging.getLogger(__name__)
+
+BACKGROUND_NICENESS = 19
+# Linux: see linux/ioprio.h
+IOPRIO_WHO_PROCESS = 1
+IOPRIO_CLASS_BE = 2
+IOPRIO_CLASS_SHIFT = 13
+IOPRIO_LOWEST_BE_LEVEL = 7
+IOPRIO_SET_SYSCALLS = {
+    "x86_64": 251,
+    "aarch64": 30,
+    "arm64": 30,
+    "ppc64le": 273,
+    "s390x": 282,
+}
+# macOS: see sys/resource.h
+IOPOL_TYPE_DISK = 0
+IOPOL_SCOPE_PROCESS = 0
+IOPOL_THROTTLE = 3
+# Windows: lowers CPU, I/O, and memory priority of the process
+PROCESS_MODE_BACKGROUND_BEGIN = 0x00100000
+SIZE_SUFFIXES = {"K": 1024, "M": 1024**2, "G": 1024**3}
+
+
+def _set_io_priority() -> None:
+    if sys.platform == "linux":
+        syscall_number = IOPRIO_SET_SYSCALLS.get(platform.machine())
+        if syscall_number is None:
+            raise OSError(f"ioprio_set is not supported on {platform.machine()}")
+        libc = ctypes.CDLL(None, use_errno=True)
+        ioprio = (IOPRIO_CLASS_BE << IOPRIO_CLASS_SHIFT) | IOPRIO_LOWEST_BE_LEVEL
+        if libc.syscall(syscall_number, IOPRIO_WHO_PROCESS, 0, ioprio) != 0:
+            raise OSError(ctypes.get_errno(), "ioprio_set failed")
+    elif sys.platform == "darwin":
+        libc = ctypes.CDLL("libc.dylib", use_errno=True)
+        if libc.setiopolicy_np(IOPOL_TYPE_DISK, IOPOL_SCOPE_PROCESS, IOPOL_THROTTLE) != 0:
+            raise OSError(ctypes.get_errno(), "setiopolicy_np failed")
+
+
+def set_background_priority() -> None:
+    """Lower the CPU and I/O priority of the current process.
+
+    Failures are logged but not raised since the operation itself can still succeed.
+    This function is also used as the initializer of worker processes.
+    """
+    if sys.platform == "win32":
+        kernel32 = ctypes.windll.kernel32
+        if not kernel32.SetPriorityClass(
+            kernel32.GetCurrentProcess(), PROCESS_MODE_BACKGROUND_BEGIN
+        ):
+            logger.warning("Could not lower the priority of the process.")
+        return
+    try:
+        os.nice(BACKGROUND_NICENESS - os.nice(0))
+    except OSError as exc:
+        logger.warning("Could not lower the CPU priority of the process.", exc_info=exc)
+    try:
+        _set_io_priority()
+    except (AttributeError, OSError) as exc:
+        logger.warning("Could not lower the I/O priority of the process.", exc_info=exc)
+
+
+def parse_size(value: str) -> int:
+    """Convert a size like ``512K``, ``10M``, or ``1G`` into bytes."""
+    value = value.strip().upper().removesuffix("B")
+    multiplier = 1
+    if value and value[-1] in SIZE_SUFFIXES:
+        multiplier = SIZE_SUFFIXES[value[-1]]
+        value = value[:-1]
+    size = int(float(value) * multiplier)
+    if size <= 0:
+        raise ValueError("Size must be positive.")
+    return size
+
+
+class Throttle:
+    """Cap the average throughput of an operation at a number of bytes per second."""
+
+    def __init__(self, max_bytes_per_second: int):
+        self.max_bytes_per_second = max_bytes_per_second
+        self._start = time.monotonic()
+        self._consumed = 0
+
+    def consume(self, num_bytes: int) -> None:
+        """Account for processed bytes and sleep until they fit within the cap."""
+        self._consumed += num_bytes
+        delay = self._start + self._consumed / self.max_bytes_per_second - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+
+class ThrottledReader:
+    """File-like wrapper that caps the read throughput of a binary stream."""
+
+    def __init__(self, stream: BinaryIO, throttle: Throttle):
+        self._stream = stream
+        self._throttle = throttle
+
+    def read(self, size: int = -1) -> bytes:
+        data = self._stream.read(size)
+        self._throttle.consume(len(data))
+        return data
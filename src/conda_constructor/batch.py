@@ -0,0 +1,86 @@
+"""Run a sequence of conda-standalone commands in one process."""
+
+from __future__ import annotations
+
+import json
+import os
+import shlex
+import sys
+import time
+from typing import TYPE_CHECKING
+
+from .commands import run_conda, run_request
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+    from pathlib import Path
+
+
+def _read_steps(script: str) -> list[list[str]]:
+    """Read one command per line. Empty lines and comments starting with ``#`` are skipped.
+
+    Lines are split like in a POSIX shell, so backslashes in Windows paths
+    must be quoted with single quotes.
+    """
+    if script == "-":
+        lines = sys.stdin.read().splitlines()
+    else:
+        with open(script) as f:
+            lines = f.read().splitlines()
+    steps = []
+    for line_number, line in enumerate(lines, start=1):
+        try:
+            args = shlex.split(line, comments=True)
+        except ValueError as exc:
+            raise ValueError(f"Could not parse line {line_number} of {script}: {exc}") from exc
+        if args:
+            steps.append(args)
+    return steps
+
+
+def batch(
+    script: str,
+    report: Path | None = None,
+    run_command: Callable[[], object] | None = None,
+) -> int:
+    """
+    Run the commands in ``script`` one after another and stop at the first failure.
+
+    Each command runs with a fresh copy of the environment and a reset conda
+    configuration. The time of each step is printed to stderr and written to
+    ``report`` as JSON. Returns the exit code of the failed step or 0.
+    """
+    steps = _read_steps(script)
+    run_command = run_command or run_conda
+    results = []
+    exit_code = 0
+    for step_number, args in enumerate(steps, start=1):
+        command = shlex.join(args)
+        start = time.perf_counter()
+        exit_code = run_request(
+            {"argv": args, "env": dict(os.environ), "cwd": os.getcwd()}, run_command
+        )
+        seconds = time.perf_counter() - start
+        results.append({"command": command, "exit_code": exit_code, "seconds": seconds})
+        print(
+            f"[{step_number}/{len(steps)}] {seconds:.3f} s (exit code {exit_code}): {command}",
+            file=sys.stderr,
+            flush=True,
+        )
+        if exit_code:
+            skipped = len(steps) - step_number
+            if skipped:
+                print(f"Skipped the remaining {skipped} step(s).", file=sys.stderr)
+            break
+    if report:
+        report.write_text(
+            json.dumps(
+                {
+                    "steps": results,
+                    "skipped": [shlex.join(args) for args in steps[len(results) :]],
+                    "exit_code": exit_code,
+                },
+                indent=2,
+            )
+        )
+    return exit_code
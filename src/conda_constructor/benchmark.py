@@ -0,0 +1,429 @@
+"""Measure the performance of installer operations on the target machine.
+
+All payloads are generated locally, so no network access is required.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from itertools import repeat
+from pathlib import Path
+from random import Random
+from tempfile import TemporaryDirectory
+from typing import TYPE_CHECKING
+
+from conda import __version__ as conda_version
+from conda.base.constants import PREFIX_MAGIC_FILE
+from conda_package_handling import api
+
+from .constants import DEFAULT_NUM_PACKAGES, DEFAULT_PACKAGE_SIZE, DEFAULT_REPEAT
+from .extract import CPU_COUNT, DEFAULT_NUM_PROCESSORS, _extract_conda_pkgs
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Iterator
+
+BENCHMARK_FORMATS = (".conda", ".tar.bz2")
+FILES_PER_PACKAGE = 32
+# Worker counts are considered equivalent if they are within this fraction of the fastest one.
+# The lowest equivalent worker count is recommended to keep the load on the machine low.
+RECOMMENDATION_TOLERANCE = 0.05
+
+
+def _conda_exe_command() -> list[str]:
+    """Return the command to run conda-standalone in a subprocess."""
+    if getattr(sys, "frozen", False):
+        return [sys.executable]
+    # Running from source, e.g. CONDA_STANDALONE=src/entry_point.py
+    return [sys.executable, os.path.abspath(sys.argv[0])]
+
+
+def _summarize(timings: list[float]) -> dict[str, float]:
+    return {
+        "min": min(timings),
+        "median": statistics.median(timings),
+        "max": max(timings),
+    }
+
+
+def _time(func: Callable[[], object], repeat: int) -> list[float]:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def _worker_counts(max_workers: int) -> list[int]:
+    counts = {1, min(DEFAULT_NUM_PROCESSORS, max_workers), max_workers}
+    count = 2
+    while count < max_workers:
+        counts.add(count)
+        count *= 2
+    return sorted(counts)
+
+
+def _create_payload(path: Path, size: int, rng: Random) -> None:
+    """Create a file that is about half text and half random data to mimic real packages."""
+    text_size = size // 2
+    line = b"def function_%d(argument):\n    return argument * 2\n\n"
+    text = b"".join(line % i for i in range(text_size // len(line) + 1))[:text_size]
+    path.write_bytes(text + rng.randbytes(size - text_size))
+
+
+def _create_package(
+    output_dir: Path, name: str, package_size: int, formats: tuple[str, ...]
+) -> int:
+    """Create a synthetic package in all formats and return its payload size in bytes."""
+    rng = Random(name)
+    file_size = package_size * 1024 // FILES_PER_PACKAGE
+    with TemporaryDirectory() as tmp:
+        source = Path(tmp)
+        (source / "info").mkdir()
+        (source / "info" / "index.json").write_text(
+            json.dumps(
+                {
+                    "name": name,
+                    "version": "1.0",
+                    "build": "0",
+                    "build_number": 0,
+                    "depends": [],
+                }
+            )
+        )
+        files = ["info/index.json"]
+        (source / "lib").mkdir()
+        for file_num in range(FILES_PER_PACKAGE):
+            _create_payload(source / "lib" / f"module_{file_num}.py", file_size, rng)
+            files.append(f"lib/module_{file_num}.py")
+        for fmt in formats:
+            api.create(str(source), files, f"{name}-1.0-0{fmt}", out_folder=str(output_dir))
+    return file_size * FILES_PER_PACKAGE
+
+
+def _create_packages(
+    output_dir: Path, num_packages: int, package_size: int, formats: tuple[str, ...]
+) -> int:
+    """Create synthetic packages in all formats and return the total payload size in bytes.
+
+    The packages are created in worker processes because the compressors may start
+    threads, which must not be running when the extraction workers are forked.
+    """
+    with ProcessPoolExecutor() as executor:
+        return sum(
+            executor.map(
+                _create_package,
+                repeat(output_dir),
+                (f"benchmark-pkg-{pkg_num}" for pkg_num in range(num_packages)),
+                repeat(package_size),
+                repeat(formats),
+            )
+        )
+
+
+def _time_extraction(workdir: Path, archives: list[Path], repeat: int, **kwargs) -> list[float]:
+    timings = []
+    for _ in range(repeat):
+        prefix = workdir / "prefix"
+        if prefix.exists():
+            shutil.rmtree(prefix)
+        (prefix / "pkgs").mkdir(parents=True)
+        for archive in archives:
+            shutil.copy(archive, prefix / "pkgs")
+        start = time.perf_counter()
+        _extract_conda_pkgs(prefix, **kwargs)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def _benchmark_extraction(
+    workdir: Path,
+    archives_dir: Path,
+    total_size: int,
+    max_workers: int,
+    repeat: int,
+) -> list[dict]:
+    results = []
+    for fmt in BENCHMARK_FORMATS:
+        archives = list(archives_dir.glob(f"*{fmt}"))
+        for num_workers in _worker_counts(max_workers):
+            summary = _summarize(
+                _time_extraction(workdir, archives, repeat, max_workers=num_workers)
+            )
+            results.append(
+                {
+                    "format": fmt,
+                    "num_processors": num_workers,
+                    "seconds": summary,
+                    "throughput_mb_s": total_size / summary["median"] / 1e6,
+                }
+            )
+    return results
+
+
+def _benchmark_background(
+    workdir: Path, archives_dir: Path, num_workers: int, repeat: int
+) -> list[dict]:
+    """Measure the extraction throughput with the settings of the --background mode.
+
+    The throughput cap is set to half of the throughput measured without it.
+    """
+    archives = list(archives_dir.glob(f"*{BENCHMARK_FORMATS[0]}"))
+    archive_size = sum(archive.stat().st_size for archive in archives)
+
+    def measure(background: bool, max_bytes_per_second: int | None) -> dict:
+        setting = {"background": background, "max_bytes_per_second": max_bytes_per_second}
+        summary = _summarize(
+            _time_extraction(workdir, archives, repeat, max_workers=num_workers, **setting)
+        )
+        return {
+            **setting,
+            "seconds": summary,
+            "archive_throughput_mb_s": archive_size / summary["median"] / 1e6,
+        }
+
+    results = [measure(False, None), measure(True, None)]
+    throughput = archive_size / results[-1]["seconds"]["median"]
+    results.append(measure(True, int(throughput / 2)))
+    return results
+
+
+# Run by conda-standalone to measure the files extracted by the bootloader at startup
+EXTRACTION_DIR_USAGE_SCRIPT = """
+import json, os, sys
+files = [os.path.join(root, name) for root, _, names in os.walk(sys._MEIPASS) for name in names]
+print(json.dumps({"files": len(files), "bytes": sum(map(os.path.getsize, files))}))
+"""
+
+
+def _profile_command(cmd: list[str], profile: Path) -> dict:
+    """Run a command with the startup profile enabled and return its peak memory and imports."""
+    from .startup_profile import PROFILE_ENV_VAR
+
+    env = os.environ.copy()
+    env[PROFILE_ENV_VAR] = str(profile)
+    subprocess.run(cmd, check=True, capture_output=True, env=env)
+    report = json.loads(profile.read_text())
+    modules = set()
+    nodes = [node for thread_nodes in report["imports"].values() for node in thread_nodes]
+    while nodes:
+        node = nodes.pop()
+        modules.add(node["module"])
+        nodes.extend(node["children"])
+    peak_rss = report.get("peak_rss_bytes")
+    return {
+        "peak_rss_mb": peak_rss / 1e6 if peak_rss is not None else None,
+        "imports_solver": "libmambapy" in modules,
+    }
+
+
+def _benchmark_startup(workdir: Path, repeat: int) -> dict[str, dict]:
+    """Measure the startup time and memory of commands that do not solve."""
+    prefix = workdir / "startup-env"
+    (prefix / "conda-meta").mkdir(parents=True)
+    (prefix / PREFIX_MAGIC_FILE).touch()
+    commands = {
+        "--version": ["--version"],
+        "constructor --help": ["constructor", "--help"],
+        "list": ["list", "--prefix", str(prefix)],
+    }
+    results = {}
+    for label, args in commands.items():
+        cmd = [*_conda_exe_command(), *args]
+        results[label] = {
+            "seconds": _summarize(
+                _time(
+                    lambda: subprocess.run(cmd, check=True, capture_output=True),
+                    repeat,
+                )
+            ),
+            **_profile_command(cmd, workdir / "startup-profile.json"),
+        }
+    return results
+
+
+def _benchmark_run(workdir: Path, repeat: int) -> dict[str, dict]:
+    """Measure the latency of `conda.exe run` with a cold and a warm activation cache."""
+    from .activation_cache import CACHE_ENV_VAR
+
+    prefix = workdir / "run-env"
+    (prefix / "conda-meta").mkdir(parents=True)
+    (prefix / PREFIX_MAGIC_FILE).touch()
+    if sys.platform == "win32":
+        executable = prefix / "Scripts" / "noop.bat"
+        content = "@exit /b 0\n"
+    else:
+        executable = prefix / "bin" / "noop"
+        content = "#!/bin/sh\n"
+    executable.parent.mkdir()
+    executable.write_text(content)
+    executable.chmod(0o755)
+    cache_dir = workdir / "activation-cache"
+    env = {**os.environ, CACHE_ENV_VAR: str(cache_dir)}
+    cmd = [*_conda_exe_command(), "run", "--prefix", str(prefix), "noop"]
+
+    def run() -> None:
+        subprocess.run(cmd, check=True, capture_output=True, env=env)
+
+    cold = []
+    for _ in range(repeat):
+        shutil.rmtree(cache_dir, ignore_errors=True)
+        cold.extend(_time(run, 1))
+    direct = _time(lambda: subprocess.run([executable], check=True, capture_output=True), repeat)
+    return {
+        "direct": {"seconds": _summarize(direct)},
+        "cold_cache": {"seconds": _summarize(cold)},
+        "warm_cache": {"seconds": _summarize(_time(run, repeat))},
+    }
+
+
+def _extraction_dir_usage() -> dict[str, int] | None:
+    """Return the number and total size of the files extracted at startup by single-file builds.
+
+    Components that are unpacked on first use are not included.
+    """
+    from .startup_profile import _is_onefile
+
+    if not _is_onefile():
+        return None
+    process = subprocess.run(
+        [*_conda_exe_command(), "python", "-c", EXTRACTION_DIR_USAGE_SCRIPT],
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    return json.loads(process.stdout)
+
+
+def _create_installation(prefix: Path, num_envs: int, files_per_env: int) -> int:
+    """Create a synthetic installation that mimics the layout of a conda installation."""
+    num_files = 0
+    env_prefixes = [prefix, *(prefix / "envs" / f"env{num}" for num in range(num_envs))]
+    for env_prefix in env_prefixes:
+        (env_prefix / "conda-meta").mkdir(parents=True)
+        (env_prefix / PREFIX_MAGIC_FILE).touch()
+        for file_num in range(files_per_env):
+            directory = env_prefix / "lib" / "site-packages" / f"pkg{file_num // 100}"
+            directory.mkdir(parents=True, exist_ok=True)
+            (directory / f"module{file_num}.py").touch()
+            num_files += 1
+    for file_num in range(files_per_env * 2):
+        directory = prefix / "pkgs" / f"pkg{file_num // 100}" / "lib"
+        directory.mkdir(parents=True, exist_ok=True)
+        (directory / f"module{file_num}.py").touch()
+        num_files += 1
+    return num_files
+
+
+def _benchmark_uninstall_scan(workdir: Path, repeat: int) -> dict:
+    from .uninstall import _find_prefixes
+
+    num_envs = 8
+    prefix = workdir / "installation"
+    num_files = _create_installation(prefix, num_envs=num_envs, files_per_env=2000)
+    return {
+        "num_files": num_files,
+        "num_environments": num_envs + 1,
+        "seconds": _summarize(_time(lambda: _find_prefixes(prefix), repeat)),
+        # Walking the whole installation, for comparison
+        "glob_seconds": _summarize(
+            _time(lambda: list(prefix.glob(f"**/{PREFIX_MAGIC_FILE}")), repeat)
+        ),
+    }
+
+
+def _recommend(extraction: list[dict]) -> dict:
+    best = min(extraction, key=lambda result: result["seconds"]["median"])
+    threshold = best["seconds"]["median"] * (1 + RECOMMENDATION_TOLERANCE)
+    recommended = min(
+        (
+            result
+            for result in extraction
+            if result["format"] == best["format"] and result["seconds"]["median"] <= threshold
+        ),
+        key=lambda result: result["num_processors"],
+    )
+    return {
+        "format": recommended["format"],
+        "num_processors": recommended["num_processors"],
+    }
+
+
+@contextmanager
+def _quiet() -> Iterator[None]:
+    """Disable progress bars while benchmarking."""
+    quiet = os.environ.get("CONDA_QUIET")
+    os.environ["CONDA_QUIET"] = "1"
+    try:
+        yield
+    finally:
+        if quiet is None:
+            del os.environ["CONDA_QUIET"]
+        else:
+            os.environ["CONDA_QUIET"] = quiet
+
+
+def benchmark(
+    prefix: Path | None = None,
+    num_packages: int = DEFAULT_NUM_PACKAGES,
+    package_size: int = DEFAULT_PACKAGE_SIZE,
+    max_workers: int | None = None,
+    repeat: int = DEFAULT_REPEAT,
+    output: Path | None = None,
+) -> None:
+    """
+    Benchmark package extraction, startup, `conda run`, and uninstallation scans.
+
+    The results are printed as a JSON report that contains a recommended configuration.
+    Temporary files are created inside ``prefix`` so that the disk used
+    by the installation can be benchmarked.
+    """
+    if max_workers is None:
+        max_workers = CPU_COUNT or 1
+    if prefix is not None:
+        prefix.mkdir(parents=True, exist_ok=True)
+    with _quiet(), TemporaryDirectory(dir=prefix) as tmp:
+        workdir = Path(tmp)
+        archives_dir = workdir / "archives"
+        archives_dir.mkdir()
+        total_size = _create_packages(archives_dir, num_packages, package_size, BENCHMARK_FORMATS)
+        extraction = _benchmark_extraction(workdir, archives_dir, total_size, max_workers, repeat)
+        recommendation = _recommend(extraction)
+        report = {
+            "system": {
+                "platform": sys.platform,
+                "machine": platform.machine(),
+                "cpu_count": CPU_COUNT,
+                "python": platform.python_version(),
+                "conda": conda_version,
+                "frozen": getattr(sys, "frozen", False),
+            },
+            "parameters": {
+                "num_packages": num_packages,
+                "package_size_kib": package_size,
+                "max_workers": max_workers,
+                "repeat": repeat,
+            },
+            "startup": _benchmark_startup(workdir, repeat),
+            "run": _benchmark_run(workdir, repeat),
+            "extraction_dir": _extraction_dir_usage(),
+            "extract": extraction,
+            "background": _benchmark_background(
+                workdir, archives_dir, recommendation["num_processors"], repeat
+            ),
+            "uninstall_scan": _benchmark_uninstall_scan(workdir, repeat),
+            "recommendation": recommendation,
+        }
+    report_json = json.dumps(report, indent=2)
+    if output:
+        output.write_text(report_json)
+    print(report_json)
@@ -0,0 +1,100 @@
+"""Cache entries shared by the activation cache and the shell cache.
+
+An entry is a JSON file with the modification times of the files it depends on under
+``stamps``. It is only used while none of these files has changed. Paths inside the
+bundled files are stored with a placeholder, since single-file builds are extracted
+to a new directory on every start.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable
+
+# Environment variables that activation reads, besides PATH
+KEY_ENV_PREFIXES = ("CONDA", "_CONDA", "__CONDA", "_CE_")
+# The bundled files of single-file builds are extracted to a new directory on every start
+SYS_PREFIX_PLACEHOLDER = "<sys.prefix>"
+
+
+def stamp(path: str) -> int | None:
+    """Return the modification time of ``path``, or None if it does not exist."""
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def directory_stamps(directory: str) -> dict[str, int | None]:
+    """Return the stamps of a directory and the files in it.
+
+    The stamp of the directory changes when files are added or removed.
+    """
+    stamps = {directory: stamp(directory)}
+    try:
+        entries = os.scandir(directory)
+    except OSError:
+        return stamps
+    with entries:
+        for entry in entries:
+            stamps[entry.path] = stamp(entry.path)
+    return stamps
+
+
+def config_stamps(prefixes: Iterable[str] = ()) -> dict[str, int | None]:
+    """Return the stamps of all paths in the search path of the configuration files of conda.
+
+    Paths that do not exist are stamped too, so that an entry becomes invalid once a
+    configuration file is created, e.g. by ``conda config``. ``$CONDA_PREFIX`` is expanded
+    both from the environment and to each of ``prefixes``, like conda does for the target
+    prefix of a command.
+    """
+    from conda.base.constants import SEARCH_PATH
+    from conda.common.configuration import custom_expandvars
+
+    stamps = {}
+    for template in SEARCH_PATH:
+        for prefix in (None, *prefixes):
+            kwargs = {"CONDA_PREFIX": prefix} if prefix else {}
+            path = os.path.expanduser(custom_expandvars(template, os.environ, **kwargs))
+            # Variables that are not set, e.g. $CONDARC
+            if "$" in path or path in stamps:
+                continue
+            if os.path.isdir(path):
+                # condarc.d directories
+                stamps.update(directory_stamps(path))
+            else:
+                stamps[path] = stamp(path)
+    return stamps
+
+
+def load_entry(cache_path: str) -> dict | None:
+    """Return the entry stored at ``cache_path`` if it exists and is still valid."""
+    try:
+        with open(cache_path) as f:
+            entry = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if any(stamp(path) != value for path, value in entry["stamps"].items()):
+        return None
+    return entry
+
+
+def write_entry(cache_path: str, entry: dict) -> None:
+    """Store an entry atomically, ignoring errors since the caches are optional."""
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        with open(tmp_path, "w") as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        # The cache is optional, e.g. if the directory is read-only
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
@@ -1,15 +1,81 @@
 from __future__ import annotations
 
 import sys
+from argparse import (
+    Action,
+    ArgumentError,
+    ArgumentParser,
+    ArgumentTypeError,
+    RawDescriptionHelpFormatter,
+)
 from pathlib import Path
 from typing import TYPE_CHECKING
 
-from .extract import DEFAULT_NUM_PROCESSORS, ExtractType, _NumProcessorsAction
+from . import tracing
+from .background import parse_size
+from .constants import (
+    DEFAULT_IDLE_TIMEOUT,
+    DEFAULT_NUM_PACKAGES,
+    DEFAULT_PACKAGE_SIZE,
+    DEFAULT_REPEAT,
+    SERVER_ENV_VAR,
+)
+from .extract import (
+    DEFAULT_NUM_PROCESSORS,
+    DEFAULT_POLL_INTERVAL,
+    DEFAULT_SENTINEL,
+    ExtractType,
+    _NumProcessorsAction,
+)
 
 if TYPE_CHECKING:
-    from argparse import ArgumentParser, Namespace
+    from argparse import Namespace
     from collections.abc import Callable
 
+SUMMARY = "A subcommand to provide installer helper functions to `constructor`."
+# Subcommands that are parsed before the conda CLI is loaded
+STANDALONE_SUBCOMMANDS = ("extract", "batch", "server")
+# Destinations of the extract options that cannot be used with --tar-from-stdin
+PACKAGES_ONLY_OPTIONS = ("watch", "pkgs_from_stdin", "urls_from", "reuse_pkgs_dirs")
+
+
+def _size(value: str) -> int:
+    try:
+        return parse_size(value)
+    except ValueError as exc:
+        raise ArgumentTypeError(f"invalid size: '{value}'") from exc
+
+
+def _positive_int(value: str) -> int:
+    try:
+        number = int(value)
+    except ValueError:
+        number = 0
+    if number < 1:
+        raise ArgumentTypeError(f"must be a positive integer: '{value}'")
+    return number
+
+
+class _PackagesOnlyAction(Action):
+    """Store an option of extract and reject combinations of --tar-from-stdin with options
+    that only apply to --conda-pkgs, which would be ignored otherwise.
+
+    Options without a value store ``const``. The action of whichever option comes second
+    sees the value of the first one, so both orders are rejected.
+    """
+
+    def __call__(self, parser, namespace, values, option_string=None):
+        if self.const == ExtractType.TAR:
+            conflicts = [dest for dest in PACKAGES_ONLY_OPTIONS if getattr(namespace, dest, None)]
+        elif getattr(namespace, "pkg_format", None) == ExtractType.TAR:
+            conflicts = ["tar_from_stdin"]
+        else:
+            conflicts = []
+        if conflicts:
+            other = "--" + conflicts[0].replace("_", "-")
+            raise ArgumentError(self, f"not allowed with argument {other}")
+        setattr(namespace, self.dest, self.const if self.nargs == 0 else values)
+
 
 def _add_prefix(parser: ArgumentParser) -> None:
     # Prefix must be string or it will break conda's context initializer
@@ -33,7 +99,8 @@ def _add_extract(parser: ArgumentParser) -> None:
     )
     extract_group.add_argument(
         "--tar-from-stdin",
-        action="store_const",
+        action=_PackagesOnlyAction,
+        nargs=0,
         const=ExtractType.TAR,
         dest="pkg_format",
         help="extract tarball from stdin",
@@ -47,6 +114,84 @@ def _add_extract(parser: ArgumentParser) -> None:
         "Value must be int between 0 (auto) and the number of processors. "
         f"Defaults to {DEFAULT_NUM_PROCESSORS}.",
     )
+    streaming_group = parser.add_mutually_exclusive_group()
+    streaming_group.add_argument(
+        "--watch",
+        action=_PackagesOnlyAction,
+        nargs=0,
+        const=True,
+        default=False,
+        help="Keep extracting conda packages as they appear in prefix/pkgs until the sentinel "
+        "file is created inside that directory. Requires --conda-pkgs. "
+        "Packages should be moved into prefix/pkgs once they are fully written.",
+    )
+    streaming_group.add_argument(
+        "--pkgs-from-stdin",
+        action=_PackagesOnlyAction,
+        nargs=0,
+        const=True,
+        default=False,
+        help="Extract the conda packages whose paths are read from stdin, one per line, "
+        "until stdin is closed or the sentinel line is read. Relative paths are resolved "
+        "against prefix/pkgs. Requires --conda-pkgs.",
+    )
+    streaming_group.add_argument(
+        "--urls-from",
+        action=_PackagesOnlyAction,
+        metavar="FILE",
+        help="Download the conda packages listed in FILE ('-' for stdin) into prefix/pkgs "
+        "and extract each package as soon as its download finishes. Each line must have "
+        "the form <url>#<sha256>, as in explicit environment files. "
+        "Requires --conda-pkgs.",
+    )
+    parser.add_argument(
+        "--num-downloads",
+        type=_positive_int,
+        default=None,
+        metavar="N",
+        help="Maximum number of concurrent downloads with --urls-from. "
+        "Defaults to the fetch_threads setting.",
+    )
+    parser.add_argument(
+        "--sentinel",
+        default=DEFAULT_SENTINEL,
+        metavar="NAME",
+        help="Name of the file (--watch) or line (--pkgs-from-stdin) that signals "
+        f"that no more packages will be added. Defaults to {DEFAULT_SENTINEL}.",
+    )
+    parser.add_argument(
+        "--poll-interval",
+        default=DEFAULT_POLL_INTERVAL,
+        type=float,
+        metavar="SECONDS",
+        help="Interval between scans of prefix/pkgs with --watch. "
+        f"Defaults to {DEFAULT_POLL_INTERVAL}.",
+    )
+    parser.add_argument(
+        "--reuse-pkgs-dirs",
+        action=_PackagesOnlyAction,
+        nargs=0,
+        const=True,
+        default=False,
+        help="Reuse packages that are already extracted in the other package caches "
+        "listed in pkgs_dirs if their sha256 matches. The extracted files are hardlinked, "
+        "reflinked, or copied instead of decompressing the package again. "
+        "Requires --conda-pkgs.",
+    )
+    parser.add_argument(
+        "--background",
+        action="store_true",
+        help="Lower the CPU and I/O priority of the extraction processes so that "
+        "the extraction does not compete with other work on the machine.",
+    )
+    parser.add_argument(
+        "--max-bytes-per-second",
+        type=_size,
+        default=None,
+        metavar="SIZE",
+        help="Cap the extraction throughput at SIZE bytes of package archives (or tarball) "
+        "per second. Accepts K, M, and G suffixes, e.g. 20M.",
+    )
 
 
 def _add_uninstall(parser: ArgumentParser) -> None:
@@ -84,6 +229,117 @@ def _add_uninstall(parser: ArgumentParser) -> None:
             " or when running on an environments directory."
         ),
     )
+    parser.add_argument(
+        "--num-processors",
+        default=1,
+        metavar="N",
+        action=_NumProcessorsAction,
+        help="Number of environments to remove concurrently. Environments are always removed "
+        "before the environments they are nested in. "
+        "Value must be int between 0 (auto) and the number of processors. "
+        "Defaults to 1. Concurrent removal is opt-in because the removals update "
+        "environments.txt concurrently, and each worker process of a single-file build "
+        "extracts the bundle again on platforms that spawn processes.",
+    )
+    parser.add_argument(
+        "--single-transaction",
+        action="store_true",
+        required=False,
+        help=(
+            "Unlink the packages of all environments in a single transaction"
+            " instead of running `conda remove --all` for each environment."
+            " --num-processors is ignored."
+        ),
+    )
+
+
+def _add_benchmark(parser: ArgumentParser) -> None:
+    parser.add_argument(
+        "--prefix",
+        action="store",
+        type=str,
+        default=None,
+        help="directory to create temporary benchmark files in; "
+        "use a directory on the disk the installation will be written to",
+    )
+    parser.add_argument(
+        "--num-packages",
+        type=_positive_int,
+        default=DEFAULT_NUM_PACKAGES,
+        metavar="N",
+        help=f"Number of synthetic packages to extract. Defaults to {DEFAULT_NUM_PACKAGES}.",
+    )
+    parser.add_argument(
+        "--package-size",
+        type=_positive_int,
+        default=DEFAULT_PACKAGE_SIZE,
+        metavar="KIB",
+        help="Uncompressed size of each synthetic package in KiB. "
+        f"Defaults to {DEFAULT_PACKAGE_SIZE}.",
+    )
+    parser.add_argument(
+        "--num-processors",
+        default=None,
+        metavar="N",
+        action=_NumProcessorsAction,
+        help="Maximum number of processors to benchmark extraction with. "
+        "Value must be int between 0 (all) and the number of processors. "
+        "Defaults to the number of processors.",
+    )
+    parser.add_argument(
+        "--repeat",
+        type=_positive_int,
+        default=DEFAULT_REPEAT,
+        metavar="N",
+        help=f"Number of times each measurement is repeated. Defaults to {DEFAULT_REPEAT}.",
+    )
+    parser.add_argument(
+        "--output",
+        type=Path,
+        default=None,
+        help="Write the JSON report to this file in addition to printing it.",
+    )
+
+
+def _add_server(parser: ArgumentParser) -> None:
+    parser.add_argument(
+        "--connection-file",
+        type=Path,
+        required=True,
+        help="File to write the connection details of the server to. "
+        f"Clients connect to the server if {SERVER_ENV_VAR} is set to this file.",
+    )
+    parser.add_argument(
+        "--idle-timeout",
+        type=float,
+        default=DEFAULT_IDLE_TIMEOUT,
+        metavar="SECONDS",
+        help="Shut down the server after SECONDS without requests. "
+        f"Use 0 to keep it running until it is stopped. Defaults to {DEFAULT_IDLE_TIMEOUT}.",
+    )
+    parser.add_argument(
+        "--stop",
+        action="store_true",
+        help="Stop the server that uses the connection file.",
+    )
+
+
+def _add_batch(parser: ArgumentParser) -> None:
+    parser.add_argument(
+        "script",
+        nargs="?",
+        default="-",
+        help="File with one conda-standalone command per line, without the executable, "
+        "e.g. `constructor extract --prefix /opt/conda --conda-pkgs`. "
+        "Lines are split like in a POSIX shell and can contain # comments. "
+        "Defaults to stdin.",
+    )
+    parser.add_argument(
+        "--report",
+        type=Path,
+        default=None,
+        help="Write the exit code and the duration of each step to this JSON file.",
+    )
 
 
 def _add_windows_path(parser: ArgumentParser) -> None:
@@ -148,6 +404,30 @@ def configure_parser(parser: ArgumentParser) -> None:
     _add_prefix(uninstall_parser)
     _add_uninstall(uninstall_parser)
 
+    benchmark_parser = subparsers.add_parser(
+        "benchmark",
+        description="Measures extraction, startup, and uninstallation performance "
+        "on this machine and recommends a configuration. Does not require network access.",
+    )
+    _add_benchmark(benchmark_parser)
+
+    batch_parser = subparsers.add_parser(
+        "batch",
+        description="Runs a sequence of conda-standalone commands in one process "
+        "and stops at the first failure. The configuration is reloaded for every command "
+        "and the duration of each command is printed.",
+    )
+    _add_batch(batch_parser)
+
+    server_parser = subparsers.add_parser(
+        "server",
+        description="Runs conda-standalone commands in a long-lived process to avoid "
+        "the startup time of each command. Commands are sent to the server by "
+        "conda-standalone itself if the environment variable "
+        f"{SERVER_ENV_VAR} is set to the connection file.",
+    )
+    _add_server(server_parser)
+
     # Not implemented for onedir builds
     if Path(sys.prefix).name != "_internal":
         subparsers.add_parser(
@@ -171,7 +451,45 @@ def configure_parser(parser: ArgumentParser) -> None:
     _add_windows_path(windows_path_parser)
 
 
-def execute(args: Namespace) -> None | int:
+class _StandaloneArgumentParser(ArgumentParser):
+    """Argument parser that formats the help like the parsers of the conda CLI."""
+
+    def __init__(self, *args, add_help: bool = True, **kwargs):
+        kwargs.setdefault("formatter_class", RawDescriptionHelpFormatter)
+        super().__init__(*args, add_help=False, **kwargs)
+        if add_help:
+            self.add_argument(
+                "-h", "--help", action="help", help="Show this help message and exit."
+            )
+
+
+def parse_args_without_conda(args: list[str], prog: str) -> Namespace | None:
+    """Parse the arguments of the constructor subcommand if it can run without conda.
+
+    This is the case for the help of all subcommands, for extractions that
+    do not need conda's configuration, and for the batch runner and the server,
+    which run the commands through the conda CLI themselves.
+    Returns None if the conda CLI is needed.
+    Parsing errors and help requests exit like with the conda CLI.
+    """
+    subcommand = args[0] if args else None
+    if "-h" not in args and "--help" not in args and subcommand not in STANDALONE_SUBCOMMANDS:
+        return None
+    parser = _StandaloneArgumentParser(prog=prog, description=SUMMARY)
+    configure_parser(parser)
+    parsed = parser.parse_args(args)
+    if parsed.cmd in ("batch", "server"):
+        return parsed
+    if parsed.cmd != "extract" or parsed.reuse_pkgs_dirs or parsed.urls_from:
+        return None
+    return parsed
+
+
+def execute(
+    args: Namespace,
+    package_extensions: tuple[str, ...] | None = None,
+    run_command: Callable[[], object] | None = None,
+) -> None | int:
     action: Callable
     kwargs = {}
     if args.cmd == "extract":
@@ -182,6 +500,16 @@ def execute(args: Namespace) -> None | int:
             {
                 "package_format": args.pkg_format,
                 "max_workers": args.num_processors,
+                "watch": args.watch,
+                "pkgs_from_stdin": args.pkgs_from_stdin,
+                "sentinel": args.sentinel,
+                "poll_interval": args.poll_interval,
+                "reuse_pkgs_dirs": args.reuse_pkgs_dirs,
+                "background": args.background,
+                "max_bytes_per_second": args.max_bytes_per_second,
+                "urls_from": args.urls_from,
+                "max_downloads": args.num_downloads,
+                "extensions": package_extensions,
             }
         )
     elif args.cmd == "uninstall":
@@ -193,8 +521,37 @@ def execute(args: Namespace) -> None | int:
                 "remove_caches": args.remove_caches,
                 "remove_config_files": args.remove_config_files,
                 "remove_user_data": args.remove_user_data,
+                "max_workers": args.num_processors,
+                "single_transaction": args.single_transaction,
             }
         )
+    elif args.cmd == "benchmark":
+        from .benchmark import benchmark
+
+        action = benchmark
+        kwargs.update(
+            {
+                "num_packages": args.num_packages,
+                "package_size": args.package_size,
+                "max_workers": args.num_processors,
+                "repeat": args.repeat,
+                "output": args.output,
+            }
+        )
+    elif args.cmd == "batch":
+        from .batch import batch
+
+        action = batch
+        kwargs.update({"script": args.script, "report": args.report, "run_command": run_command})
+    elif args.cmd == "server":
+        from .server import serve, stop
+
+        if args.stop:
+            action = stop
+        else:
+            action = serve
+            kwargs.update({"idle_timeout": args.idle_timeout, "run_command": run_command})
+        kwargs["connection_file"] = args.connection_file
     elif args.cmd == "update-bootstrapper":
         from .update_bootstrapper import update_bootstrapper
 
@@ -219,6 +576,7 @@ def execute(args: Namespace) -> None | int:
             )
     else:
         raise NotImplementedError(f"No action available for subcommand '{args.cmd}'.")
-    if args.cmd != "update-bootstrapper":
+    if args.cmd not in ("update-bootstrapper", "batch", "server") and args.prefix is not None:
         kwargs["prefix"] = Path(args.prefix).expanduser().resolve()
-    return action(**kwargs)
+    with tracing.span(f"constructor {args.cmd}"):
+        return action(**kwargs)
@@ -0,0 +1,103 @@
+"""Run conda-standalone commands inside the current process.
+
+The batch runner and the server run several commands in one process. Each command gets
+the command line, environment variables, and working directory it was requested with,
+and a fresh conda configuration. The state of the process is restored afterwards.
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+from typing import TYPE_CHECKING
+
+from .constants import SERVER_ENV_VAR
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+
+# Environment variables that describe the runtime environment of the process itself.
+# The process keeps its own values so that the subprocesses of a command
+# do not use the extraction directory of the client.
+PROCESS_ENV_VARS = ("LD_LIBRARY_PATH", "LD_LIBRARY_PATH_ORIG", "LIBPATH", "LIBPATH_ORIG")
+PROCESS_ENV_PREFIX = "_PYI_"
+
+
+def _request_environment(client_env: dict[str, str]) -> dict[str, str]:
+    env = {
+        key: value
+        for key, value in client_env.items()
+        if key not in PROCESS_ENV_VARS and not key.startswith(PROCESS_ENV_PREFIX)
+    }
+    env.update(
+        (key, value)
+        for key, value in os.environ.items()
+        if key in PROCESS_ENV_VARS or key.startswith(PROCESS_ENV_PREFIX)
+    )
+    # Commands that call conda.exe again must not be forwarded to the busy server
+    env.pop(SERVER_ENV_VAR, None)
+    return env
+
+
+def _reset_conda_state() -> None:
+    """Reset the configuration and the caches that conda keeps between commands."""
+    from conda.base.context import reset_context
+    from conda.core.package_cache_data import PackageCacheData
+    from conda.core.prefix_data import PrefixData
+    from conda.core.subdir_data import SubdirData
+    from conda.gateways.connection.session import CondaSession
+
+    reset_context()
+    PrefixData._cache_.clear()
+    PackageCacheData._cache_.clear()
+    SubdirData.clear_cached_local_channel_data(exclude_file=False)
+    CondaSession.cache_clear()
+
+
+def _exit_code(result: object) -> int:
+    if result is None:
+        return 0
+    if isinstance(result, int):
+        return result
+    print(result, file=sys.stderr)
+    return 1
+
+
+def run_request(request: dict, run_command: Callable[[], object]) -> int:
+    """Run a command with the command line, environment, and working directory of a request.
+
+    ``request`` holds the arguments after ``conda.exe`` under ``argv``, the environment
+    variables under ``env``, and the working directory under ``cwd``. Returns the exit code.
+    """
+    saved_argv = sys.argv
+    saved_env = dict(os.environ)
+    saved_cwd = os.getcwd()
+    saved_streams = (sys.stdin, sys.stdout, sys.stderr)
+    try:
+        os.environ.clear()
+        os.environ.update(_request_environment(request["env"]))
+        os.chdir(request["cwd"])
+        sys.argv = [saved_argv[0], *request["argv"]]
+        _reset_conda_state()
+        try:
+            return _exit_code(run_command())
+        except SystemExit as exc:
+            return _exit_code(exc.code)
+        except Exception:
+            import traceback
+
+            traceback.print_exc()
+            return 1
+    finally:
+        sys.stdin, sys.stdout, sys.stderr = saved_streams
+        sys.argv = saved_argv
+        os.environ.clear()
+        os.environ.update(saved_env)
+        os.chdir(saved_cwd)
+
+
+def run_conda() -> object:
+    """Run the conda CLI with the arguments in ``sys.argv``."""
+    from conda.cli.main import main
+
+    return main()
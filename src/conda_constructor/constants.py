@@ -0,0 +1,11 @@
+"""Constants shared by the ``constructor`` parser and the subcommands.
+
+They are kept out of the modules of the subcommands, so that the parser can be built without
+importing conda, e.g. to print the help.
+"""
+
+SERVER_ENV_VAR = "CONDA_STANDALONE_SERVER"
+DEFAULT_IDLE_TIMEOUT = 600
+DEFAULT_NUM_PACKAGES = 24
+DEFAULT_PACKAGE_SIZE = 2048  # KiB
+DEFAULT_REPEAT = 3
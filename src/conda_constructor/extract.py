@@ -1,21 +1,39 @@
+from __future__ import annotations
+
 import argparse
+import hashlib
+import json
 import os
+import shutil
 import sys
-from concurrent.futures import ProcessPoolExecutor, as_completed
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from contextlib import ExitStack, suppress
 from enum import Enum
 from pathlib import Path
+from typing import TYPE_CHECKING
 
 from conda.auxlib.type_coercion import boolify
-from conda.base.context import context
 from conda_package_handling import api
 from conda_package_streaming.package_streaming import TarfileNoSameOwner
 from tqdm.auto import tqdm
 
+from . import tracing
+from .background import Throttle, ThrottledReader, set_background_priority
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable, Iterator
+    from concurrent.futures import Future
+
 # This might be None!
 CPU_COUNT = os.cpu_count()
 # See validation results for magic number of 3
 # https://dholth.github.io/conda-benchmarks/#extract.TimeExtract.time_extract?conda-package-handling=2.0.0a2&p-format='.conda'&p-format='.tar.bz2'&p-lang='py'
 DEFAULT_NUM_PROCESSORS = 1 if not CPU_COUNT else min(3, CPU_COUNT)
+# Name of the file (--watch) or line (--pkgs-from-stdin) that signals
+# that no more packages will be added.
+DEFAULT_SENTINEL = ".extract_done"
+DEFAULT_POLL_INTERVAL = 0.5
 
 
 class ExtractType(Enum):
@@ -67,46 +85,406 @@ def _create_dummy_executor(*args, **kwargs):
     return DummyExecutor(*args, **kwargs)
 
 
-def _extract_conda_pkgs(prefix: Path, max_workers=None) -> None:
-    current_location = Path.cwd()
-    os.chdir(prefix / "pkgs")
-    flist = []
-    for ext in context.plugin_manager.get_package_extractors():
-        for pkg in Path.cwd().iterdir():
+def _scan_pkgs_dir(pkgs_dir: Path, extensions: tuple[str, ...]) -> Iterator[str]:
+    for ext in extensions:
+        for pkg in pkgs_dir.iterdir():
             if pkg.name.endswith(ext):
-                flist.append(str(pkg))
-    disabled = True if boolify(os.environ.get("CONDA_QUIET")) else None  # None only for non-tty
-    with ProcessPoolExecutor(max_workers=max_workers) as executor:
-        futures = {executor.submit(api.extract, fn): fn for fn in flist}
-        with tqdm(total=len(flist), leave=False, disable=disabled) as pbar:
-            for future in as_completed(futures):
-                fn = futures[future]
-                try:
-                    future.result()
-                except Exception as exc:
-                    raise RuntimeError(f"Failed to extract {fn}: {exc}") from exc
+                yield str(pkg)
+
+
+def _watch_pkgs_dir(
+    pkgs_dir: Path,
+    extensions: tuple[str, ...],
+    sentinel: str,
+    poll_interval: float,
+) -> Iterator[str | None]:
+    """Yield packages as they appear in the package directory until the sentinel file exists.
+
+    A package is only yielded once its size and modification time did not change
+    between two polls, so that partially written files are not extracted. Once the
+    sentinel file exists, all remaining packages are considered complete.
+    Yields None when there is nothing to do so that the caller can process results.
+    """
+    seen = set()
+    pending = {}
+    sentinel_file = pkgs_dir / sentinel
+    while True:
+        done = sentinel_file.exists()
+        with os.scandir(pkgs_dir) as entries:
+            for entry in sorted(entries, key=lambda entry: entry.name):
+                if entry.name in seen or not entry.name.endswith(extensions):
+                    continue
+                if not entry.is_file():
+                    continue
+                stat = entry.stat()
+                signature = (stat.st_size, stat.st_mtime_ns)
+                if done or pending.get(entry.name) == signature:
+                    seen.add(entry.name)
+                    pending.pop(entry.name, None)
+                    yield entry.path
                 else:
-                    pbar.set_description(f"Extracting: {Path(fn).name}")
-                    pbar.update()
+                    pending[entry.name] = signature
+        if done:
+            sentinel_file.unlink(missing_ok=True)
+            return
+        yield None
+        time.sleep(poll_interval)
+
+
+def _read_pkgs_from_stdin(
+    pkgs_dir: Path, extensions: tuple[str, ...], sentinel: str
+) -> Iterator[str]:
+    """Yield package paths read from stdin until EOF or the sentinel line.
+
+    Relative paths are resolved against the package directory.
+    """
+    for line in sys.stdin:
+        line = line.strip()
+        if not line:
+            continue
+        if line == sentinel:
+            return
+        pkg = pkgs_dir / line
+        if not pkg.name.endswith(extensions):
+            raise ValueError(f"Cannot extract unknown package type: '{pkg.name}'.")
+        yield str(pkg)
+
+
+def _read_package_urls(urls_from: str, extensions: tuple[str, ...]) -> list[tuple[str, str]]:
+    """Read package URLs and their sha256 hashes from a file or stdin (``-``).
+
+    Each line has the form ``<url>#<sha256>`` or ``<url>#sha256:<sha256>``, so that
+    explicit environment files can be used. Empty lines, comments, and ``@`` directives
+    like ``@EXPLICIT`` are ignored.
+    """
+    if urls_from == "-":
+        lines = sys.stdin.read().splitlines()
+    else:
+        lines = Path(urls_from).read_text().splitlines()
+    package_urls = []
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith(("#", "@")):
+            continue
+        url, _, sha256 = line.partition("#")
+        sha256 = sha256.removeprefix("sha256:")
+        if len(sha256) != 64:
+            raise ValueError(f"Missing or invalid sha256 hash for package URL: '{url}'.")
+        if not url.endswith(extensions):
+            raise ValueError(f"Cannot extract unknown package type: '{url}'.")
+        package_urls.append((url, sha256))
+    return package_urls
+
+
+def _download_package(url: str, sha256: str, pkgs_dir: Path) -> str:
+    """Download a package into the package directory unless it is already there."""
+    from conda.gateways.connection.download import download
+
+    pkg = pkgs_dir / url.rsplit("/", 1)[-1]
+    with tracing.span("download package", package=pkg.name) as attributes:
+        if pkg.exists():
+            if _sha256(pkg) == sha256:
+                attributes["cached"] = True
+                return str(pkg)
+            pkg.unlink()
+        download(url, pkg, sha256=sha256)
+        attributes["cached"] = False
+    return str(pkg)
+
+
+def _download_pkgs(
+    pkgs_dir: Path,
+    package_urls: list[tuple[str, str]],
+    max_downloads: int,
+    poll_interval: float,
+) -> Iterator[str | None]:
+    """Yield the paths of downloaded packages as soon as each download finishes.
+
+    Yields None when no download finished within the polling interval
+    so that the caller can process results.
+    """
+    with ThreadPoolExecutor(max_workers=max_downloads) as executor:
+        futures = {
+            executor.submit(_download_package, url, sha256, pkgs_dir): url
+            for url, sha256 in package_urls
+        }
+        try:
+            while futures:
+                done, _ = wait(futures, timeout=poll_interval, return_when=FIRST_COMPLETED)
+                if not done:
+                    yield None
+                for future in done:
+                    url = futures.pop(future)
+                    try:
+                        yield future.result()
+                    except Exception as exc:
+                        raise RuntimeError(f"Failed to download {url}: {exc}") from exc
+        finally:
+            for future in futures:
+                future.cancel()
+
+
+def _sha256(path: Path) -> str:
+    with path.open("rb") as fh:
+        return hashlib.file_digest(fh, "sha256").hexdigest()
+
+
+def _find_extracted_package(pkg: Path, extensions: tuple[str, ...], pkgs_dirs: tuple[str, ...]):
+    """Find an extracted copy of a package in other package caches.
+
+    An extracted package is only reused if its repodata record or the package
+    archive next to it has the same sha256 as the package to extract.
+    """
+    ext = next((ext for ext in extensions if pkg.name.endswith(ext)), "")
+    dirname = pkg.name[: -len(ext)] if ext else pkg.name
+    sha256 = None
+    for pkgs_dir in pkgs_dirs:
+        candidate = Path(pkgs_dir, dirname)
+        if not (candidate / "info" / "index.json").is_file():
+            continue
+        if sha256 is None:
+            sha256 = _sha256(pkg)
+        try:
+            record = json.loads((candidate / "info" / "repodata_record.json").read_text())
+        except (OSError, ValueError):
+            record = {}
+        if record.get("sha256") == sha256:
+            return candidate
+        archive = Path(pkgs_dir, pkg.name)
+        if archive.is_file() and _sha256(archive) == sha256:
+            return candidate
+    return None
+
+
+def _clone_file(source: str, destination: str) -> None:
+    """Hardlink a file, falling back to a reflink (Linux) or a copy."""
+    try:
+        os.link(source, destination)
+        return
+    except OSError:
+        pass
+    if sys.platform == "linux":
+        import fcntl
+
+        # Hardlinks may not be allowed for files owned by other users,
+        # so try a copy-on-write clone before copying the data
+        ficlone = 0x40049409
+        try:
+            with open(source, "rb") as src, open(destination, "wb") as dst:
+                fcntl.ioctl(dst.fileno(), ficlone, src.fileno())
+            shutil.copystat(source, destination)
+            return
+        except OSError:
+            # open() may have failed before creating the destination
+            with suppress(FileNotFoundError):
+                os.unlink(destination)
+    shutil.copy2(source, destination)
+
+
+def _link_extracted_package(source: Path, destination: Path) -> None:
+    """Materialize an extracted package tree without decompressing the archive.
+
+    The repodata record is not linked since it may come from a different channel.
+    The result looks the same as a fresh extraction of the archive.
+    """
+    staging = destination.with_name(f"{destination.name}.linking")
+    if staging.exists():
+        shutil.rmtree(staging)
+    for root, dirnames, filenames in os.walk(source):
+        target_root = staging / Path(root).relative_to(source)
+        target_root.mkdir(parents=True, exist_ok=True)
+        for name in dirnames + filenames:
+            path = os.path.join(root, name)
+            target = os.path.join(target_root, name)
+            if os.path.islink(path):
+                os.symlink(os.readlink(path), target)
+            elif name in filenames:
+                if root == str(source / "info") and name == "repodata_record.json":
+                    continue
+                _clone_file(path, target)
+    if destination.exists():
+        shutil.rmtree(destination)
+    staging.rename(destination)
+
+
+def _extract_package(
+    fn: str, extensions: tuple[str, ...] = (), reuse_pkgs_dirs: tuple[str, ...] = ()
+) -> None:
+    """Extract a package or link an extracted copy from other package caches."""
+    pkg = Path(fn)
+    with tracing.span("extract package", package=pkg.name) as attributes:
+        if reuse_pkgs_dirs:
+            if extracted := _find_extracted_package(pkg, extensions, reuse_pkgs_dirs):
+                ext = next(ext for ext in extensions if pkg.name.endswith(ext))
+                _link_extracted_package(extracted, pkg.with_name(pkg.name[: -len(ext)]))
+                attributes["linked_from"] = str(extracted)
+                return
+        api.extract(fn)
+
+
+def _extract_package_traced(
+    fn: str, extensions: tuple[str, ...] = (), reuse_pkgs_dirs: tuple[str, ...] = ()
+) -> list[dict]:
+    """Extract a package in a worker process and return the recorded spans."""
+    with tracing.collect() as events:
+        _extract_package(fn, extensions, reuse_pkgs_dirs)
+    return events
+
+
+def _collect_extracted(futures: dict[Future, str], pbar: tqdm | None, block: bool = False) -> None:
+    """Process finished extractions and remove them from ``futures``.
+
+    Raises RuntimeError for the first failed extraction.
+    """
+    if not futures:
+        return
+    done, _ = wait(futures, timeout=None if block else 0, return_when=FIRST_COMPLETED)
+    for future in done:
+        fn = futures.pop(future)
+        try:
+            tracing.add_events(future.result())
+        except Exception as exc:
+            raise RuntimeError(f"Failed to extract {fn}: {exc}") from exc
+        else:
+            pbar.set_description(f"Extracting: {Path(fn).name}")
+            pbar.update()
+
+
+def _extract_conda_pkgs(
+    prefix: Path,
+    max_workers=None,
+    watch: bool = False,
+    pkgs_from_stdin: bool = False,
+    sentinel: str = DEFAULT_SENTINEL,
+    poll_interval: float = DEFAULT_POLL_INTERVAL,
+    reuse_pkgs_dirs: bool = False,
+    background: bool = False,
+    max_bytes_per_second: int | None = None,
+    urls_from: str | None = None,
+    max_downloads: int | None = None,
+    extensions: tuple[str, ...] | None = None,
+) -> None:
+    """Extract the conda packages in ``prefix/pkgs``.
+
+    conda's context is only loaded if it is needed, e.g. if ``extensions`` is not given,
+    so that installers can extract packages without initializing conda.
+    """
+    current_location = Path.cwd()
+    pkgs_dir = prefix / "pkgs"
+    if urls_from:
+        pkgs_dir.mkdir(parents=True, exist_ok=True)
+    os.chdir(pkgs_dir)
+    if extensions is None or reuse_pkgs_dirs or urls_from:
+        from conda.base.context import context
+    if extensions is None:
+        extensions = tuple(context.plugin_manager.get_package_extractors())
+    other_pkgs_dirs = ()
+    if reuse_pkgs_dirs:
+        other_pkgs_dirs = tuple(
+            pkgs for pkgs in context.pkgs_dirs if Path(pkgs).resolve() != pkgs_dir.resolve()
+        )
+    packages: Iterable[str | None]
+    # The number of packages is not known in advance when streaming
+    streaming = watch or pkgs_from_stdin
+    total = 0
+    if urls_from:
+        package_urls = _read_package_urls(urls_from, extensions)
+        packages = _download_pkgs(
+            pkgs_dir, package_urls, max_downloads or context.fetch_threads, poll_interval
+        )
+        total = len(package_urls)
+    elif watch:
+        packages = _watch_pkgs_dir(pkgs_dir, extensions, sentinel, poll_interval)
+    elif pkgs_from_stdin:
+        packages = _read_pkgs_from_stdin(pkgs_dir, extensions, sentinel)
+    else:
+        packages = list(_scan_pkgs_dir(pkgs_dir, extensions))
+        total = len(packages)
+    disabled = True if boolify(os.environ.get("CONDA_QUIET")) else None  # None only for non-tty
+    throttle = Throttle(max_bytes_per_second) if max_bytes_per_second else None
+    initializer = set_background_priority if background else None
+    extract_package = _extract_package_traced if tracing.enabled() else _extract_package
+    with (
+        tracing.span("extract packages", pkgs_dir=str(pkgs_dir), max_workers=max_workers),
+        ProcessPoolExecutor(max_workers=max_workers, initializer=initializer) as executor,
+        ExitStack() as stack,
+    ):
+        futures = {}
+        pbar = None
+        if urls_from:
+            # Start the worker processes before the download threads
+            # so that they are not forked while a download holds a lock.
+            executor.submit(os.getpid).result()
+        for fn in packages:
+            if fn is not None:
+                futures[executor.submit(extract_package, fn, extensions, other_pkgs_dirs)] = fn
+                if pbar is None:
+                    # Create the progress bar after the first submission. Worker processes
+                    # may be forked then, which must not happen while its monitor thread runs.
+                    pbar = stack.enter_context(tqdm(total=total, leave=False, disable=disabled))
+                if streaming:
+                    pbar.total += 1
+                    pbar.refresh()
+                if throttle:
+                    # Throttle at package granularity based on the size of the archives
+                    throttle.consume(os.path.getsize(fn))
+            _collect_extracted(futures, pbar)
+        while futures:
+            _collect_extracted(futures, pbar, block=True)
     os.chdir(current_location)
 
 
-def _extract_tarball(prefix: Path) -> None:
+def _extract_tarball(
+    prefix: Path, background: bool = False, max_bytes_per_second: int | None = None
+) -> None:
     current_location = Path.cwd()
     os.chdir(prefix)
-    t = TarfileNoSameOwner.open(mode="r|*", fileobj=sys.stdin.buffer)
-    tar_args = {}
-    if hasattr(t, "extraction_filter"):
-        tar_args["filter"] = "data"
-    t.extractall(**tar_args)
-    t.close()
+    if background:
+        set_background_priority()
+    fileobj = sys.stdin.buffer
+    if max_bytes_per_second:
+        fileobj = ThrottledReader(fileobj, Throttle(max_bytes_per_second))
+    with tracing.span("extract tarball", prefix=str(prefix)):
+        t = TarfileNoSameOwner.open(mode="r|*", fileobj=fileobj)
+        tar_args = {}
+        if hasattr(t, "extraction_filter"):
+            tar_args["filter"] = "data"
+        t.extractall(**tar_args)
+        t.close()
     os.chdir(current_location)
 
 
-def extract(prefix: Path, package_format: ExtractType, max_workers: int | None = None):
+def extract(
+    prefix: Path,
+    package_format: ExtractType,
+    max_workers: int | None = None,
+    watch: bool = False,
+    pkgs_from_stdin: bool = False,
+    sentinel: str = DEFAULT_SENTINEL,
+    poll_interval: float = DEFAULT_POLL_INTERVAL,
+    reuse_pkgs_dirs: bool = False,
+    background: bool = False,
+    max_bytes_per_second: int | None = None,
+    urls_from: str | None = None,
+    max_downloads: int | None = None,
+    extensions: tuple[str, ...] | None = None,
+):
     if package_format == ExtractType.TAR:
-        _extract_tarball(prefix)
+        _extract_tarball(prefix, background=background, max_bytes_per_second=max_bytes_per_second)
     elif package_format == ExtractType.PACKAGES:
-        _extract_conda_pkgs(prefix, max_workers=max_workers)
+        _extract_conda_pkgs(
+            prefix,
+            max_workers=max_workers,
+            watch=watch,
+            pkgs_from_stdin=pkgs_from_stdin,
+            sentinel=sentinel,
+            poll_interval=poll_interval,
+            reuse_pkgs_dirs=reuse_pkgs_dirs,
+            background=background,
+            max_bytes_per_second=max_bytes_per_second,
+            urls_from=urls_from,
+            max_downloads=max_downloads,
+            extensions=extensions,
+        )
     else:
         raise NotImplementedError(f"Cannot extract packages of format {package_format.value}.")
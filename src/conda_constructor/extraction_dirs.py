@@ -0,0 +1,121 @@
+"""Clean up extraction directories of single-file builds that were left behind.
+
+The bootloader of single-file builds extracts the bundle into a new ``_MEI*`` directory
+inside the temporary directory every time it runs and removes it when the process exits.
+If the bootloader process is killed, e.g. with SIGKILL, the directory is left behind.
+
+The name of the directory does not identify the process that uses it, so conda-standalone
+holds a lock on a file inside its extraction directory for as long as it runs. The operating
+system releases the lock when the process exits, however it exits. Directories with a lock
+file that nobody holds are stale.
+"""
+
+from __future__ import annotations
+
+import atexit
+import logging
+import os
+import sys
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from typing import IO
+
+logger = logging.getLogger(__name__)
+
+EXTRACTION_DIR_PREFIX = "_MEI"
+LOCK_FILE = "conda-standalone.lock"
+# A new process may not have locked its lock file yet
+MIN_LOCK_FILE_AGE = 60
+
+# Open for the lifetime of the process to keep the lock
+_lock_file: IO[bytes] | None = None
+
+
+def _lock(f: IO[bytes]) -> bool:
+    """Lock an open file without waiting. Returns False if another process holds the lock."""
+    try:
+        if sys.platform == "win32":
+            import msvcrt
+
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            import fcntl
+
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        return False
+    return True
+
+
+def lock_extraction_dir() -> None:
+    """Mark the extraction directory of this process as in use until the process exits."""
+    global _lock_file
+
+    extraction_dir = getattr(sys, "_MEIPASS", None)
+    if not extraction_dir or not os.path.basename(extraction_dir).startswith(
+        EXTRACTION_DIR_PREFIX
+    ):
+        return
+    try:
+        f = open(os.path.join(extraction_dir, LOCK_FILE), "a+b")
+    except OSError as exc:
+        logger.debug("Could not create the lock file in %s.", extraction_dir, exc_info=exc)
+        return
+    if _lock(f):
+        _lock_file = f
+        # Released just before the bootloader removes the directory
+        atexit.register(f.close)
+    else:
+        f.close()
+
+
+def _is_stale_extraction_dir(path: Path) -> bool:
+    lock_path = path / LOCK_FILE
+    if not path.is_dir() or path.is_symlink() or not lock_path.is_file():
+        return False
+    # Only consider directories of the current user
+    if hasattr(os, "getuid") and path.stat().st_uid != os.getuid():
+        return False
+    if time.time() - lock_path.stat().st_mtime < MIN_LOCK_FILE_AGE:
+        return False
+    with open(lock_path, "a+b") as f:
+        # Closing the file releases the lock again
+        return _lock(f)
+
+
+def clean_stale_extraction_dirs(tmp_dir: Path | None = None) -> list[Path]:
+    """Remove the extraction directories of conda-standalone processes that are gone.
+
+    Directories of running processes, of other users, and of other applications or
+    older versions of conda-standalone, which have no lock file, are not touched.
+    Returns the removed directories.
+    """
+    import shutil
+    import tempfile
+
+    tmp_dir = Path(tmp_dir or tempfile.gettempdir())
+    current = Path(getattr(sys, "_MEIPASS", "")).resolve()
+    removed = []
+    try:
+        candidates = [
+            path for path in tmp_dir.iterdir() if path.name.startswith(EXTRACTION_DIR_PREFIX)
+        ]
+    except OSError as exc:
+        logger.debug("Could not list %s.", tmp_dir, exc_info=exc)
+        return removed
+    for path in candidates:
+        if path.resolve() == current:
+            continue
+        try:
+            if not _is_stale_extraction_dir(path):
+                continue
+        except OSError:
+            continue
+        shutil.rmtree(path, ignore_errors=True)
+        if not path.exists():
+            removed.append(path)
+    return removed
@@ -0,0 +1,234 @@
+"""Unpack heavy components of the single-file binary when they are first imported.
+
+The bootloader of single-file builds extracts every bundled file at every start, even if
+the command never uses it. Components that only some commands need, like the libmamba
+solver and its shared libraries, are therefore stored in secondary archives instead.
+These are embedded in the executable as entries that the bootloader does not extract.
+
+When a module of a component is imported for the first time, its archive is unpacked into
+the extraction directory of the bootloader, so that the files end up in the same place as
+if the bootloader had extracted them. The bootloader removes them on exit as usual.
+
+The archives are read with a reader of the package format of PyInstaller. The build only
+stores components in secondary archives if PyInstaller is a supported version that writes
+this format, and all files are extracted by the bootloader otherwise. If a package cannot
+be read at runtime anyway, a warning is printed and the modules of the component are not
+importable.
+"""
+
+from __future__ import annotations
+
+import os
+import stat
+import struct
+import sys
+import threading
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable, Sequence
+    from zipfile import ZipFile
+
+# Prefix of the archive entries in the package of the executable
+ARCHIVE_PREFIX = "conda_constructor/lazy"
+# Created in the extraction directory once a component has been unpacked
+MARKER_PREFIX = ".lazy-"
+
+# Major versions of PyInstaller whose package format the reader supports
+SUPPORTED_PYINSTALLER_VERSIONS = range(6, 7)
+
+# See PyInstaller.archive.readers.CArchiveReader
+_COOKIE_MAGIC = b"MEI\014\013\012\013\016"
+_COOKIE_FORMAT = "!8sIIII64s"
+_TOC_ENTRY_FORMAT = "!IIIIBc"
+_SEARCH_CHUNK_SIZE = 8192
+
+_lock = threading.Lock()
+_finder: _LazyComponentFinder | None = None
+
+
+def archive_name(component: str) -> str:
+    return f"{ARCHIVE_PREFIX}/{component}.zip"
+
+
+def supports_package_format(version: str, writer: type) -> bool:
+    """Whether the reader can read the packages of a PyInstaller version and its writer.
+
+    Used by the build to decide whether components can be stored in secondary archives.
+    """
+    try:
+        major = int(version.split(".")[0])
+    except ValueError:
+        return False
+    return major in SUPPORTED_PYINSTALLER_VERSIONS and (
+        getattr(writer, "_COOKIE_MAGIC_PATTERN", None),
+        getattr(writer, "_COOKIE_FORMAT", None),
+        getattr(writer, "_TOC_ENTRY_FORMAT", None),
+    ) == (_COOKIE_MAGIC, _COOKIE_FORMAT, _TOC_ENTRY_FORMAT)
+
+
+def _find_cookie(f) -> int:
+    """Return the offset of the package cookie, searching from the end like the bootloader."""
+    end = f.seek(0, os.SEEK_END)
+    while end >= len(_COOKIE_MAGIC):
+        start = max(end - _SEARCH_CHUNK_SIZE, 0)
+        f.seek(start)
+        position = f.read(end - start).rfind(_COOKIE_MAGIC)
+        if position != -1:
+            return start + position
+        if start == 0:
+            break
+        end = start + len(_COOKIE_MAGIC) - 1
+    raise OSError(f"No PyInstaller package found in {f.name}.")
+
+
+def _read_package_entry(executable: str, name: str) -> bytes:
+    """Read an uncompressed entry from the package that PyInstaller embeds in the executable."""
+    entry_header_size = struct.calcsize(_TOC_ENTRY_FORMAT)
+    cookie_size = struct.calcsize(_COOKIE_FORMAT)
+    with open(executable, "rb") as f:
+        cookie_offset = _find_cookie(f)
+        f.seek(cookie_offset)
+        _, package_length, toc_offset, toc_length, python_version, _ = struct.unpack(
+            _COOKIE_FORMAT, f.read(cookie_size)
+        )
+        package_start = cookie_offset + cookie_size - package_length
+        # The values of a package in another format would not add up
+        if (
+            python_version != sys.version_info[0] * 100 + sys.version_info[1]
+            or package_start < 0
+            or toc_offset + toc_length + cookie_size != package_length
+        ):
+            raise OSError(f"Unsupported PyInstaller package in {executable}.")
+        f.seek(package_start + toc_offset)
+        toc = f.read(toc_length)
+        position = 0
+        while position < len(toc):
+            entry_length, offset, length, _, compressed, _ = struct.unpack_from(
+                _TOC_ENTRY_FORMAT, toc, position
+            )
+            if entry_length <= entry_header_size:
+                raise OSError(f"Unsupported PyInstaller package in {executable}.")
+            entry_name = toc[position + entry_header_size : position + entry_length]
+            position += entry_length
+            if entry_name.rstrip(b"\0").decode("utf-8") != name:
+                continue
+            if compressed:
+                raise OSError(f"{name} is compressed in {executable}.")
+            f.seek(package_start + offset)
+            return f.read(length)
+    raise KeyError(f"{name} not found in {executable}.")
+
+
+def _extract_member(archive: ZipFile, member, target_dir: str) -> None:
+    path = os.path.join(target_dir, *member.filename.split("/"))
+    if os.path.lexists(path):
+        # Unpacked by another process, e.g. a multiprocessing worker
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    mode = member.external_attr >> 16
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    if stat.S_ISLNK(mode):
+        os.symlink(archive.read(member).decode("utf-8"), tmp_path)
+    else:
+        with archive.open(member) as src, open(tmp_path, "wb") as dst:
+            while chunk := src.read(1024 * 1024):
+                dst.write(chunk)
+        if mode:
+            os.chmod(tmp_path, stat.S_IMODE(mode))
+    try:
+        os.replace(tmp_path, path)
+    except OSError:
+        # Windows does not replace files that are in use
+        os.unlink(tmp_path)
+        if not os.path.lexists(path):
+            raise
+
+
+def unpack(component: str) -> bool:
+    """Unpack a component into the extraction directory if that has not happened yet.
+
+    Returns False if the component is not stored in a secondary archive.
+    """
+    extraction_dir = getattr(sys, "_MEIPASS", None)
+    if extraction_dir is None:
+        return False
+    marker = os.path.join(extraction_dir, f"{MARKER_PREFIX}{component}")
+    with _lock:
+        if os.path.exists(marker):
+            return True
+        import io
+        import zipfile
+
+        from . import startup_profile
+
+        executable = os.environ.get("_PYI_ARCHIVE_FILE", sys.executable)
+        with startup_profile.span(f"unpack {component}"):
+            try:
+                data = _read_package_entry(executable, archive_name(component))
+            except KeyError:
+                return False
+            except (OSError, struct.error, UnicodeDecodeError) as exc:
+                import warnings
+
+                warnings.warn(
+                    f"Could not unpack {component} from {executable}: {exc}",
+                    RuntimeWarning,
+                    stacklevel=2,
+                )
+                return False
+            with zipfile.ZipFile(io.BytesIO(data)) as archive:
+                for member in archive.infolist():
+                    _extract_member(archive, member, extraction_dir)
+            open(marker, "w").close()
+    import importlib
+
+    importlib.invalidate_caches()
+    return True
+
+
+class _LazyComponentFinder:
+    """Meta path finder that unpacks a component before any of its modules is imported.
+
+    It never finds modules itself, the regular finders import them from the unpacked files.
+    """
+
+    def __init__(self, components: dict[str, Sequence[str]]):
+        self._modules = {
+            module: component for component, modules in components.items() for module in modules
+        }
+
+    def find_spec(self, fullname: str, path: Iterable[str] | None = None, target=None) -> None:
+        name = fullname
+        while True:
+            component = self._modules.pop(name, None)
+            if component is not None:
+                unpack(component)
+                return None
+            name, _, child = name.rpartition(".")
+            if not child or not name:
+                return None
+
+    def invalidate_caches(self) -> None:
+        pass
+
+
+def install() -> bool:
+    """Unpack the components that are stored in secondary archives on first import.
+
+    Returns False if there are no such components, e.g. when running from source
+    or in a build with an extraction directory that contains all files.
+    """
+    global _finder
+
+    if _finder is not None:
+        return True
+    try:
+        from ._lazy import COMPONENTS
+    except ImportError:
+        return False
+    if not COMPONENTS or not hasattr(sys, "_MEIPASS"):
+        return False
+    _finder = _LazyComponentFinder(COMPONENTS)
+    sys.meta_path.insert(0, _finder)
+    return True
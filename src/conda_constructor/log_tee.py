@@ -0,0 +1,140 @@
+"""Copy everything written to stdout and stderr into a log file.
+
+The standard output and error file descriptors are replaced with pipes. A thread per pipe
+writes what it reads to the original console and to the log file. Output of child processes
+that inherit the file descriptors, e.g. link scripts or ``conda run --no-capture-output``,
+ends up in the log file as well.
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+import threading
+from contextlib import contextmanager
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+    from pathlib import Path
+    from typing import BinaryIO
+
+CHUNK_SIZE = 64 * 1024
+LOG_BUFFER_SIZE = 1024 * 1024
+# Seconds to wait for the output of child processes that are still running on exit
+DRAIN_TIMEOUT = 5
+# Windows: see processenv.h
+STD_HANDLES = {1: -11, 2: -12}
+
+
+def _write_all(fd: int, data: bytes) -> None:
+    view = memoryview(data)
+    while view:
+        view = view[os.write(fd, view) :]
+
+
+def _pump(read_fd: int, console_fd: int, log: BinaryIO, lock: threading.Lock) -> None:
+    try:
+        while chunk := os.read(read_fd, CHUNK_SIZE):
+            try:
+                _write_all(console_fd, chunk)
+            except OSError:
+                # The console is gone, e.g. a closed pipe, but the log is still written
+                pass
+            with lock:
+                log.write(chunk)
+    finally:
+        os.close(read_fd)
+
+
+def _set_std_handle(fd: int) -> None:
+    """Make child processes on Windows inherit ``fd`` as their standard stream.
+
+    subprocess passes the standard handles of the process, not its file descriptors.
+    """
+    if sys.platform != "win32":
+        return
+    import ctypes
+    import msvcrt
+
+    ctypes.windll.kernel32.SetStdHandle(STD_HANDLES[fd], msvcrt.get_osfhandle(fd))
+
+
+def start_resource_tracker() -> None:
+    """Start the resource tracker of multiprocessing before the output is redirected.
+
+    Unless worker processes are forked, the first pool or lock starts the tracker process,
+    which lives as long as this process. If that happens while the output is redirected,
+    the tracker inherits the pipes and keeps them open until this process exits.
+    """
+    if sys.platform == "win32":
+        return
+    import multiprocessing
+
+    if multiprocessing.get_start_method() != "fork":
+        from multiprocessing import resource_tracker
+
+        resource_tracker.ensure_running()
+
+
+@contextmanager
+def tee_output(log_file: Path) -> Iterator[None]:
+    """Copy the output of this process and its child processes into ``log_file``.
+
+    The log file is appended to. Each stream is copied by its own thread, so output written
+    to stdout and stderr in quick succession may appear in a different order than it was written.
+    """
+    streams = {1: sys.stdout, 2: sys.stderr}
+    for stream in streams.values():
+        stream.flush()
+    start_resource_tracker()
+    log = open(log_file, "ab", buffering=LOG_BUFFER_SIZE)
+    lock = threading.Lock()
+    console_fds = {}
+    threads = []
+    try:
+        for fd, stream in streams.items():
+            read_fd, write_fd = os.pipe()
+            console_fds[fd] = os.dup(fd)
+            os.dup2(write_fd, fd)
+            os.close(write_fd)
+            _set_std_handle(fd)
+            thread = threading.Thread(
+                target=_pump,
+                args=(read_fd, console_fds[fd], log, lock),
+                name=f"log-tee-{fd}",
+                daemon=True,
+            )
+            thread.start()
+            threads.append(thread)
+        if sys.platform == "win32":
+            # The console streams write to the console directly instead of the descriptors
+            sys.stdout, sys.stderr = (
+                open(
+                    fd,
+                    "w",
+                    encoding=stream.encoding,
+                    errors=stream.errors,
+                    line_buffering=True,
+                    closefd=False,
+                )
+                for fd, stream in streams.items()
+            )
+        yield
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        sys.stdout, sys.stderr = streams.values()
+        # Restoring the descriptors closes the pipes, which ends the threads
+        # once all child processes that inherited them have exited
+        for fd, console_fd in console_fds.items():
+            os.dup2(console_fd, fd)
+            _set_std_handle(fd)
+        for thread in threads:
+            thread.join(DRAIN_TIMEOUT)
+        with lock:
+            log.flush()
+        if not any(thread.is_alive() for thread in threads):
+            for console_fd in console_fds.values():
+                os.close(console_fd)
+            log.close()
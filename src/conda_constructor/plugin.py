@@ -5,7 +5,7 @@ from typing import TYPE_CHECKING
 from conda.plugins.hookspec import hookimpl
 from conda.plugins.types import CondaSubcommand
 
-from .cli import configure_parser, execute
+from .cli import SUMMARY, configure_parser, execute
 
 if TYPE_CHECKING:
     from collections.abc import Iterator
@@ -17,6 +17,6 @@ def conda_subcommands() -> Iterator[CondaSubcommand]:
     yield CondaSubcommand(
         name="constructor",
         action=execute,
-        summary="A subcommand to provide installer helper functions to `constructor`.",
+        summary=SUMMARY,
         configure_parser=configure_parser,
     )
@@ -0,0 +1,198 @@
+"""Load the conda plug-ins of the frozen binary without scanning the package metadata.
+
+conda finds external plug-ins by reading the entry points of all installed distributions.
+The plug-ins bundled in conda-standalone cannot change after the build, so the build writes
+their entry points into ``conda_constructor._plugins`` and they are loaded from there.
+
+Plug-ins that are expensive to import, like the libmamba solver, are registered as deferred
+plug-ins instead. These provide the same solvers and subcommands as recorded at build time,
+but only import the plug-in when a solver is instantiated or a subcommand is run.
+"""
+
+from __future__ import annotations
+
+import logging
+from typing import TYPE_CHECKING
+
+from conda.plugins.hookspec import hookimpl, spec_name
+from conda.plugins.types import CondaSolver, CondaSubcommand
+
+if TYPE_CHECKING:
+    from argparse import ArgumentParser, Namespace
+    from collections.abc import Callable, Iterator
+    from types import ModuleType
+
+    from conda.plugins.manager import CondaPluginManager
+
+logger = logging.getLogger(__name__)
+
+# Hooks that a deferred plug-in can provide without being imported
+DEFERRABLE_HOOKS = frozenset({"conda_solvers", "conda_subcommands"})
+
+_installed = False
+
+
+def _hook_names(plugin: object) -> set[str]:
+    return {name for name in dir(plugin) if hasattr(getattr(plugin, name), f"{spec_name}_impl")}
+
+
+def describe_plugin(plugin: ModuleType) -> dict | None:
+    """Record what a deferred plug-in needs to register in place of ``plugin``.
+
+    Used by the build to write ``conda_constructor._plugins``. Returns None if the plug-in
+    implements hooks that cannot be deferred.
+    """
+    hooks = _hook_names(plugin)
+    if not hooks <= DEFERRABLE_HOOKS:
+        return None
+    solvers = {}
+    for solver in plugin.conda_solvers() if "conda_solvers" in hooks else ():
+        user_agent = getattr(solver.backend, "user_agent", None)
+        solvers[solver.name] = {"user_agent": user_agent() if user_agent else None}
+    subcommands = {}
+    for subcommand in plugin.conda_subcommands() if "conda_subcommands" in hooks else ():
+        subcommands[subcommand.name] = {
+            "summary": subcommand.summary,
+            "configure_parser": subcommand.configure_parser is not None,
+        }
+    return {"solvers": solvers, "subcommands": subcommands}
+
+
+def _defer_configure_parser(parser: ArgumentParser, configure_parser: Callable) -> None:
+    """Configure the parser of a subcommand only when it parses the arguments.
+
+    conda configures the parsers of all subcommands for every command it runs.
+    """
+    parser_class = type(parser)
+
+    class DeferredParser(parser_class):
+        def parse_known_args(self, args=None, namespace=None):
+            self.__class__ = parser_class
+            configure_parser(self)
+            return self.parse_known_args(args, namespace)
+
+    parser.__class__ = DeferredParser
+
+
+class _DeferredPlugin:
+    """Stand-in for a plug-in that provides its solvers and subcommands without importing it."""
+
+    def __init__(self, name: str, value: str, description: dict):
+        # Registered under the same name as the plug-in module
+        self.__name__ = value
+        self._entry_point_name = name
+        self._description = description
+        self._plugin: ModuleType | None = None
+        self._backends: dict[str, type] = {}
+
+    def _load(self) -> ModuleType:
+        if self._plugin is None:
+            from importlib.metadata import EntryPoint
+
+            from . import startup_profile
+
+            with startup_profile.span(f"load plugin {self._entry_point_name}"):
+                self._plugin = EntryPoint(self._entry_point_name, self.__name__, spec_name).load()
+        return self._plugin
+
+    def _solver(self, name: str) -> CondaSolver:
+        return next(solver for solver in self._load().conda_solvers() if solver.name == name)
+
+    def _subcommand(self, name: str) -> CondaSubcommand:
+        return next(
+            subcommand
+            for subcommand in self._load().conda_subcommands()
+            if subcommand.name == name
+        )
+
+    def _solver_backend(self, name: str, user_agent: str | None) -> type:
+        if name in self._backends:
+            return self._backends[name]
+        plugin = self
+
+        class DeferredSolver:
+            """Instantiates the solver of the plug-in, which is imported on first use."""
+
+            def __new__(cls, *args, **kwargs):
+                return plugin._solver(name).backend(*args, **kwargs)
+
+        if user_agent is not None:
+            DeferredSolver.user_agent = staticmethod(lambda: user_agent)
+        self._backends[name] = DeferredSolver
+        return DeferredSolver
+
+    def _subcommand_stub(self, name: str, summary: str, configure_parser: bool) -> CondaSubcommand:
+        def action(args: Namespace | tuple[str]) -> int | None:
+            return self._subcommand(name).action(args)
+
+        def deferred_configure_parser(parser: ArgumentParser) -> None:
+            _defer_configure_parser(
+                parser, lambda parser: self._subcommand(name).configure_parser(parser)
+            )
+
+        return CondaSubcommand(
+            name=name,
+            summary=summary,
+            action=action,
+            configure_parser=deferred_configure_parser if configure_parser else None,
+        )
+
+    @hookimpl
+    def conda_solvers(self) -> Iterator[CondaSolver]:
+        for name, solver in self._description["solvers"].items():
+            yield CondaSolver(name=name, backend=self._solver_backend(name, **solver))
+
+    @hookimpl
+    def conda_subcommands(self) -> Iterator[CondaSubcommand]:
+        for name, subcommand in self._description["subcommands"].items():
+            yield self._subcommand_stub(name, **subcommand)
+
+
+def use_cached_entry_points() -> bool:
+    """Make conda load its plug-in entry points from the list created at build time.
+
+    Must be called before the plug-in manager is created.
+    Returns False if no list is available, e.g. when running from source.
+    """
+    global _installed
+
+    if _installed:
+        return True
+    try:
+        from ._plugins import DEFERRED_PLUGINS, ENTRY_POINTS
+    except ImportError:
+        return False
+    from importlib.metadata import EntryPoint
+
+    from conda.plugins.manager import CondaPluginManager
+
+    load_entrypoints = CondaPluginManager.load_entrypoints
+
+    def load_cached_entrypoints(
+        self: CondaPluginManager, group: str, name: str | None = None
+    ) -> int:
+        if group != spec_name:
+            return load_entrypoints(self, group, name)
+        count = 0
+        for entry_point_name, value in ENTRY_POINTS:
+            if name is not None and entry_point_name != name:
+                continue
+            if entry_point_name in DEFERRED_PLUGINS:
+                plugin = _DeferredPlugin(
+                    entry_point_name, value, DEFERRED_PLUGINS[entry_point_name]
+                )
+            else:
+                try:
+                    plugin = EntryPoint(entry_point_name, value, group).load()
+                except Exception as err:
+                    logger.warning(
+                        "Error while loading conda entry point: %s (%s)", entry_point_name, err
+                    )
+                    continue
+            if self.register(plugin):
+                count += 1
+        return count
+
+    CondaPluginManager.load_entrypoints = load_cached_entrypoints
+    _installed = True
+    return True
@@ -0,0 +1,209 @@
+"""Profile a whole conda-standalone command, including its multiprocessing workers.
+
+Profiling is enabled with ``--profile <path>`` or by setting ``CONDA_STANDALONE_PROFILE`` to
+the path of the output file. ``--profile-mode`` or ``CONDA_STANDALONE_PROFILE_MODE`` selects
+the profiler:
+
+- ``cprofile`` (default): deterministic profiling with cProfile. The output is a pstats
+  file, which can be read with ``pstats`` or tools like snakeviz.
+- ``sampling``: a thread samples the stacks of all threads every millisecond. The output is
+  a speedscope file, which can be opened in https://www.speedscope.app.
+
+The settings are passed on to child processes in the environment. Child processes, e.g.
+the workers that extract packages, write their profiles next to the output file with their
+process ID added to the name.
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+import threading
+import time
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+    from types import FrameType
+
+PROFILE_ENV_VAR = "CONDA_STANDALONE_PROFILE"
+MODE_ENV_VAR = "CONDA_STANDALONE_PROFILE_MODE"
+# Process ID of the process that writes to the output file itself
+_PARENT_ENV_VAR = "CONDA_STANDALONE_PROFILE_PARENT"
+MODES = ("cprofile", "sampling")
+# Seconds between two samples of the sampling profiler
+SAMPLE_INTERVAL = 0.001
+
+_profiler: CProfiler | SamplingProfiler | None = None
+
+
+class CProfiler:
+    """Deterministic profiler that writes pstats files."""
+
+    def __init__(self):
+        import cProfile
+
+        self.pid = os.getpid()
+        self._profile = cProfile.Profile()
+
+    def start(self) -> None:
+        self._profile.enable()
+
+    def stop(self) -> None:
+        self._profile.disable()
+
+    def write(self, output: str) -> None:
+        self._profile.dump_stats(output)
+
+
+class SamplingProfiler:
+    """Samples the stacks of all threads from a background thread.
+
+    The samples of each thread are written as a sampled profile of the speedscope format,
+    weighted by the time since the previous sample.
+    """
+
+    def __init__(self, interval: float = SAMPLE_INTERVAL):
+        self.pid = os.getpid()
+        self.interval = interval
+        self.frames: dict[tuple[str, str, int], int] = {}
+        # Thread ID -> (name, stacks, weights)
+        self.threads: dict[int, tuple[str, list[list[int]], list[float]]] = {}
+        self._stopped = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def _frame_index(self, frame: FrameType) -> int:
+        code = frame.f_code
+        key = (code.co_qualname, code.co_filename, code.co_firstlineno)
+        index = self.frames.get(key)
+        if index is None:
+            index = self.frames[key] = len(self.frames)
+        return index
+
+    def _stack(self, frame: FrameType | None) -> list[int]:
+        stack = []
+        while frame is not None:
+            stack.append(self._frame_index(frame))
+            frame = frame.f_back
+        stack.reverse()
+        return stack
+
+    def _sample(self) -> None:
+        previous = time.perf_counter()
+        own_id = threading.get_ident()
+        while not self._stopped.wait(self.interval):
+            now = time.perf_counter()
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                if thread_id not in self.threads:
+                    names = {thread.ident: thread.name for thread in threading.enumerate()}
+                    self.threads[thread_id] = (names.get(thread_id, str(thread_id)), [], [])
+                _, stacks, weights = self.threads[thread_id]
+                stacks.append(self._stack(frame))
+                weights.append(now - previous)
+            previous = now
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._sample, name="profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._thread is not None and self._thread.ident != threading.get_ident():
+            self._thread.join()
+
+    def speedscope(self) -> dict:
+        profiles = [
+            {
+                "type": "sampled",
+                "name": f"{name} (pid {self.pid})",
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": sum(weights),
+                "samples": stacks,
+                "weights": weights,
+            }
+            for name, stacks, weights in self.threads.values()
+        ]
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": " ".join(sys.argv),
+            "exporter": "conda-standalone",
+            "shared": {
+                "frames": [
+                    {"name": name, "file": file, "line": line} for name, file, line in self.frames
+                ]
+            },
+            "profiles": profiles,
+        }
+
+    def write(self, output: str) -> None:
+        import json
+
+        with open(output, "w") as f:
+            json.dump(self.speedscope(), f)
+
+
+def _output_path(output: str) -> str:
+    """Return the path of the profile of this process."""
+    if os.environ.get(_PARENT_ENV_VAR) == str(os.getpid()):
+        return output
+    root, ext = os.path.splitext(output)
+    return f"{root}.{os.getpid()}{ext}"
+
+
+def _start_profiler(output: str, mode: str) -> Callable[[], None]:
+    """Start profiling this process and return the function that writes the profile."""
+    global _profiler
+
+    profiler = _profiler = SamplingProfiler() if mode == "sampling" else CProfiler()
+    output = _output_path(output)
+
+    def write() -> None:
+        if os.getpid() != profiler.pid:
+            # Forked child processes inherit the exit handlers
+            return
+        profiler.stop()
+        profiler.write(output)
+
+    from multiprocessing import util
+
+    util.register_after_fork(profiler, _restart_after_fork)
+    profiler.start()
+    return write
+
+
+def _restart_after_fork(profiler: CProfiler | SamplingProfiler) -> None:
+    """Profile a forked multiprocessing worker into its own file."""
+    if profiler is not _profiler or profiler.pid == os.getpid():
+        # Not forked, e.g. a spawned worker that started its own profiler
+        return
+    from multiprocessing import util
+
+    # The profiler inherited from the parent process may still be enabled
+    profiler.stop()
+    write = _start_profiler(os.environ[PROFILE_ENV_VAR], os.environ[MODE_ENV_VAR])
+    # Forked workers exit without running the atexit handlers,
+    # but they run the finalizers of multiprocessing
+    util.Finalize(None, write, exitpriority=0)
+
+
+def start(output: str | os.PathLike | None = None, mode: str | None = None) -> None:
+    """Profile this process into ``output`` or the file set in the environment, if any.
+
+    The profile is written on exit.
+    """
+    output = output or os.environ.get(PROFILE_ENV_VAR)
+    if not output or _profiler is not None:
+        return
+    mode = mode or os.environ.get(MODE_ENV_VAR) or MODES[0]
+    if mode not in MODES:
+        raise ValueError(f"Unknown profile mode '{mode}'. Choose one of: {', '.join(MODES)}.")
+    output = os.path.abspath(output)
+    os.environ[PROFILE_ENV_VAR] = output
+    os.environ[MODE_ENV_VAR] = mode
+    os.environ.setdefault(_PARENT_ENV_VAR, str(os.getpid()))
+    import atexit
+
+    atexit.register(_start_profiler(output, mode))
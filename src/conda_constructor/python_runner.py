@@ -0,0 +1,172 @@
+"""Run Python code for ``conda.exe python`` like the regular interpreter.
+
+The frozen interpreter cannot write ``__pycache__`` directories next to scripts, so the
+bytecode of scripts is cached in a directory of its own instead. Cache entries are keyed by
+the hash of the path and the source of the script, the Python version and the optimization
+level, so they never need to be invalidated. Instead, entries that were not used for
+``MAX_AGE`` seconds and the least recently used entries beyond ``MAX_ENTRIES`` are removed
+whenever a new entry is written. ``CONDA_STANDALONE_BYTECODE_CACHE`` overrides the location
+of the cache. Like the interpreter, no cache entries are written if
+``PYTHONDONTWRITEBYTECODE`` is set.
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+import time
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from types import CodeType
+
+CACHE_ENV_VAR = "CONDA_STANDALONE_BYTECODE_CACHE"
+# Bounds of the cache, entries of edited or removed scripts are never read again
+MAX_AGE = 30 * 24 * 60 * 60
+MAX_ENTRIES = 500
+# The modification time of an entry is its last use, updated at most once in this interval
+_USE_INTERVAL = 24 * 60 * 60
+
+
+def bytecode_cache_dir() -> str:
+    cache_dir = os.environ.get(CACHE_ENV_VAR)
+    if cache_dir:
+        return cache_dir
+    from platformdirs import user_cache_dir
+
+    return os.path.join(user_cache_dir("conda-standalone", appauthor=False), "bytecode")
+
+
+def _cache_path(path: str, source: bytes, optimize: int) -> str:
+    import hashlib
+
+    digest = hashlib.sha256(os.fsencode(path) + b"\0" + source).hexdigest()
+    tag = sys.implementation.cache_tag
+    name = f"{digest}.{tag}.opt-{optimize}.pyc" if optimize else f"{digest}.{tag}.pyc"
+    return os.path.join(bytecode_cache_dir(), name)
+
+
+def _prune_cache(cache_dir: str) -> None:
+    """Remove unused and least recently used entries, see MAX_AGE and MAX_ENTRIES."""
+    try:
+        with os.scandir(cache_dir) as entries:
+            # Temporary files of interrupted writes are removed once they are old enough
+            files = [
+                (entry.stat().st_mtime, entry.path)
+                for entry in entries
+                if entry.name.endswith((".pyc", ".tmp"))
+            ]
+    except OSError:
+        return
+    files.sort(reverse=True)
+    now = time.time()
+    for index, (mtime, path) in enumerate(files):
+        if index >= MAX_ENTRIES or now - mtime > MAX_AGE:
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+
+
+def compile_file(path: str, optimize: int = 0) -> CodeType:
+    """Compile a script, reusing the bytecode of an earlier run if the source is unchanged."""
+    import marshal
+    from importlib.util import MAGIC_NUMBER
+
+    path = os.path.abspath(path)
+    with open(path, "rb") as f:
+        source = f.read()
+    cache_path = _cache_path(path, source, optimize)
+    try:
+        with open(cache_path, "rb") as f:
+            data = f.read()
+            mtime = os.fstat(f.fileno()).st_mtime
+        if data.startswith(MAGIC_NUMBER):
+            code = marshal.loads(memoryview(data)[len(MAGIC_NUMBER) :])
+            if time.time() - mtime > _USE_INTERVAL:
+                # Keep the entry from being pruned
+                try:
+                    os.utime(cache_path)
+                except OSError:
+                    pass
+            return code
+    except (OSError, ValueError, EOFError, TypeError):
+        pass
+    code = compile(source, path, "exec", dont_inherit=True, optimize=optimize)
+    if not os.environ.get("PYTHONDONTWRITEBYTECODE"):
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            with open(tmp_path, "wb") as f:
+                f.write(MAGIC_NUMBER + marshal.dumps(code))
+            os.replace(tmp_path, cache_path)
+        except OSError:
+            # The cache is optional, e.g. if the directory is read-only
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+        else:
+            _prune_cache(os.path.dirname(cache_path))
+    return code
+
+
+def run_code(code: CodeType, path: str | None = None) -> None:
+    """Run code as the ``__main__`` module, like runpy does for scripts."""
+    import types
+
+    module = types.ModuleType("__main__")
+    module.__file__ = path
+    module.__cached__ = None
+    module.__loader__ = None
+    module.__package__ = None
+    module.__spec__ = None
+    original_main = sys.modules.get("__main__")
+    sys.modules["__main__"] = module
+    try:
+        exec(code, module.__dict__)
+    finally:
+        if original_main is None:
+            del sys.modules["__main__"]
+        else:
+            sys.modules["__main__"] = original_main
+
+
+def run_stdin(optimize: int = 0) -> None:
+    """Run the code piped to stdin as one program."""
+    source = sys.stdin.buffer.read()
+    run_code(compile(source, "<stdin>", "exec", dont_inherit=True, optimize=optimize))
+
+
+def print_import_times() -> None:
+    """Print the time every following import takes to stderr, like ``-X importtime``.
+
+    Modules that were imported before, e.g. those conda-standalone needs to start,
+    are not included.
+    """
+    import _frozen_importlib
+    import _thread
+
+    original = _frozen_importlib._find_and_load
+    # Thread ID -> time spent in the nested imports of each import in progress
+    stacks: dict[int, list[int]] = {}
+
+    def _find_and_load(name, import_):
+        stack = stacks.setdefault(_thread.get_ident(), [])
+        level = len(stack)
+        stack.append(0)
+        start = time.perf_counter_ns()
+        try:
+            return original(name, import_)
+        finally:
+            cumulative = (time.perf_counter_ns() - start) // 1000
+            nested = stack.pop()
+            if stack:
+                stack[-1] += cumulative
+            indent = "  " * level
+            sys.stderr.write(
+                f"import time: {cumulative - nested:>9} | {cumulative:>10} | {indent}{name}\n"
+            )
+
+    sys.stderr.write("import time: self [us] | cumulative | imported package\n")
+    _frozen_importlib._find_and_load = _find_and_load
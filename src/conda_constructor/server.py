@@ -0,0 +1,265 @@
+"""Run conda-standalone commands in a long-lived process.
+
+Installers run many ``conda.exe`` commands in a row, and each of them has to start the
+interpreter and import conda. ``conda.exe constructor server`` keeps a process with conda
+already imported and runs the commands of clients one after another. A client is
+``conda.exe`` itself: if ``CONDA_STANDALONE_SERVER`` points to the connection file of a
+server, the command line, environment variables, and working directory are forwarded to
+the server, and its output and exit code are passed back.
+
+The output of a command is captured at the file descriptor level, so that the output of
+subprocesses is forwarded as well. Commands do not receive any input on stdin, so commands
+that read stdin run in the client instead.
+
+This module is imported by every client, so it must stay cheap to import.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import sys
+from multiprocessing.connection import Client
+from typing import TYPE_CHECKING
+
+from .constants import DEFAULT_IDLE_TIMEOUT
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+    from multiprocessing.connection import Connection
+    from pathlib import Path
+
+READ_SIZE = 64 * 1024
+# Options that make a command read its input from stdin
+STDIN_OPTIONS = ("--tar-from-stdin", "--extract-tarball", "--pkgs-from-stdin")
+
+
+def _read_connection_file(connection_file: str | Path) -> dict:
+    with open(connection_file) as f:
+        return json.load(f)
+
+
+def _connect(connection_file: str | Path) -> Connection:
+    info = _read_connection_file(connection_file)
+    return Client(info["address"], family=info["family"], authkey=bytes.fromhex(info["authkey"]))
+
+
+def reads_stdin(argv: list[str]) -> bool:
+    """Whether the command ``conda.exe <argv>`` reads its input from stdin."""
+    for index, arg in enumerate(argv):
+        if arg in STDIN_OPTIONS or arg == "--urls-from=-":
+            return True
+        if arg == "--urls-from" and argv[index + 1 : index + 2] == ["-"]:
+            return True
+    if argv[:2] == ["constructor", "batch"]:
+        # The script defaults to stdin
+        scripts = []
+        args = iter(argv[2:])
+        for arg in args:
+            if arg == "--report":
+                next(args, None)
+            elif arg == "-" or not arg.startswith("-"):
+                scripts.append(arg)
+        return scripts in ([], ["-"])
+    return False
+
+
+def forward(argv: list[str], connection_file: str | Path) -> int | None:
+    """Run a command in the server and return its exit code.
+
+    Returns None if the server cannot be reached so that the command can run locally.
+    """
+    try:
+        conn = _connect(connection_file)
+    except (OSError, ValueError, KeyError, EOFError):
+        return None
+    with conn:
+        conn.send({"argv": argv, "env": dict(os.environ), "cwd": os.getcwd()})
+        streams = {"stdout": sys.stdout, "stderr": sys.stderr}
+        while True:
+            try:
+                kind, payload = conn.recv()
+            except EOFError:
+                print("The conda-standalone server closed the connection.", file=sys.stderr)
+                return 1
+            if kind == "exit":
+                return payload
+            stream = streams[kind]
+            stream.flush()
+            stream.buffer.write(payload)
+            stream.buffer.flush()
+
+
+def stop(connection_file: str | Path) -> None:
+    """Ask the server to shut down after the current command."""
+    with _connect(connection_file) as conn:
+        conn.send({"shutdown": True})
+
+
+class _StreamForwarder:
+    """Forward everything written to stdout and stderr to a connection.
+
+    The file descriptors 1 and 2 are replaced by pipes whose contents are sent by
+    reader threads, and file descriptor 0 reads from the null device.
+    """
+
+    def __init__(self, conn: Connection):
+        import threading
+
+        self._conn = conn
+        self._lock = threading.Lock()
+        self._saved_fds: dict[int, int] = {}
+        self._threads: list[threading.Thread] = []
+
+    def _send(self, kind: str, data: bytes) -> None:
+        with self._lock:
+            try:
+                self._conn.send((kind, data))
+            except OSError:
+                # The client is gone, but the command should still finish
+                pass
+
+    def _forward(self, read_fd: int, kind: str) -> None:
+        with open(read_fd, "rb", buffering=0) as pipe:
+            while data := pipe.read(READ_SIZE):
+                self._send(kind, data)
+
+    def __enter__(self) -> _StreamForwarder:
+        import threading
+
+        sys.stdout.flush()
+        sys.stderr.flush()
+        null_fd = os.open(os.devnull, os.O_RDONLY)
+        self._saved_fds[0] = os.dup(0)
+        os.dup2(null_fd, 0)
+        os.close(null_fd)
+        for fd, kind in ((1, "stdout"), (2, "stderr")):
+            read_fd, write_fd = os.pipe()
+            self._saved_fds[fd] = os.dup(fd)
+            os.dup2(write_fd, fd)
+            os.close(write_fd)
+            thread = threading.Thread(target=self._forward, args=(read_fd, kind), daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        for stream in (sys.stdout, sys.stderr, sys.__stdout__, sys.__stderr__):
+            try:
+                stream.flush()
+            except (AttributeError, OSError, ValueError):
+                pass
+        for fd, saved_fd in self._saved_fds.items():
+            os.dup2(saved_fd, fd)
+            os.close(saved_fd)
+        # Subprocesses that outlive the command may still hold the pipes open
+        for thread in self._threads:
+            thread.join(timeout=5)
+
+
+def _write_connection_file(connection_file: Path, info: dict) -> None:
+    """Write the connection file atomically and readable only by the current user."""
+    tmp_file = connection_file.with_name(f"{connection_file.name}.tmp")
+    fd = os.open(tmp_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with open(fd, "w") as f:
+        json.dump(info, f)
+    os.replace(tmp_file, connection_file)
+
+
+def serve(
+    connection_file: Path,
+    idle_timeout: float = DEFAULT_IDLE_TIMEOUT,
+    run_command: Callable[[], object] | None = None,
+) -> None:
+    """Run the commands of clients until the server is stopped or idle for too long.
+
+    ``run_command`` runs the command in ``sys.argv`` and returns its exit code.
+    Defaults to the conda CLI.
+    """
+    import secrets
+    import tempfile
+    import threading
+    import time
+    from multiprocessing.connection import Listener
+
+    from conda.plugins.manager import get_plugin_manager
+
+    from . import plugin
+    from .commands import run_conda, run_request
+    from .log_tee import start_resource_tracker
+    from .plugin_cache import use_cached_entry_points
+
+    # Import conda and load the plugins before the first request
+    use_cached_entry_points()
+    get_plugin_manager().load_plugins(plugin)
+    # The tracker process lives as long as the server and would otherwise inherit
+    # the output pipes of the first command that uses multiprocessing
+    start_resource_tracker()
+    run_command = run_command or run_conda
+    connection_file = connection_file.resolve()
+    authkey = secrets.token_bytes(32)
+    with tempfile.TemporaryDirectory(prefix="conda-standalone-server-") as tmp_dir:
+        address = None
+        if sys.platform != "win32":
+            # Unix sockets are only accessible to the current user in this directory
+            address = os.path.join(tmp_dir, "server.sock")
+        with Listener(address, authkey=authkey) as listener:
+            _write_connection_file(
+                connection_file,
+                {
+                    "address": listener.address,
+                    "family": "AF_PIPE" if sys.platform == "win32" else "AF_UNIX",
+                    "authkey": authkey.hex(),
+                    "pid": os.getpid(),
+                },
+            )
+            lock = threading.Lock()
+            last_activity = time.monotonic()
+            busy = False
+            stopped = threading.Event()
+
+            def watch_idle_time() -> None:
+                while not stopped.wait(1):
+                    with lock:
+                        # Commands may run for longer than the idle timeout
+                        idle = 0 if busy else time.monotonic() - last_activity
+                    if idle > idle_timeout:
+                        # Wake up the accept call of the main thread
+                        try:
+                            stop(connection_file)
+                        except OSError:
+                            pass
+                        return
+
+            if idle_timeout > 0:
+                threading.Thread(target=watch_idle_time, daemon=True).start()
+            try:
+                while True:
+                    try:
+                        conn = listener.accept()
+                    except (OSError, EOFError):
+                        # Failed authentication or a client that disconnected early
+                        continue
+                    with conn:
+                        try:
+                            request = conn.recv()
+                        except (OSError, EOFError):
+                            continue
+                        if request.get("shutdown"):
+                            return
+                        with lock:
+                            busy = True
+                        try:
+                            with _StreamForwarder(conn):
+                                exit_code = run_request(request, run_command)
+                        finally:
+                            with lock:
+                                busy = False
+                                last_activity = time.monotonic()
+                        try:
+                            conn.send(("exit", exit_code))
+                        except OSError:
+                            pass
+            finally:
+                stopped.set()
+                connection_file.unlink(missing_ok=True)
@@ -0,0 +1,203 @@
+"""Serve the output of ``conda.exe shell.*`` commands from a cache.
+
+Shell init code runs ``conda.exe shell.bash hook`` or its equivalent in every new shell, and
+``conda activate`` runs ``conda.exe shell.<shell> activate``. The output only depends on the
+arguments, a few environment variables, the configuration files and the environments involved,
+so it is cached in the user cache directory. ``CONDA_STANDALONE_SHELL_CACHE`` overrides the
+location of the cache. With a valid entry, the output is printed without importing conda.
+
+Entries are keyed by the arguments, the working directory, the binary and the environment
+variables conda and the activators read. While the output is generated, the prefixes the
+activator inspects are recorded. An entry is invalid once a configuration file in the search
+path of conda is created or changes, once the environment directories, or the ``conda-meta``
+directory, environment variable files or activation scripts of these prefixes change, or when
+the variables set by these prefixes have different values in the environment.
+
+Output is not cached if the command fails, writes to stderr, e.g. warnings about overwritten
+environment variables, or writes its output to a temporary file, like ``shell.cmd.exe`` does.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import sys
+from typing import TYPE_CHECKING
+
+from .cache_entries import (
+    KEY_ENV_PREFIXES,
+    SYS_PREFIX_PLACEHOLDER,
+    config_stamps,
+    load_entry,
+    stamp,
+    write_entry,
+)
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Sequence
+
+CACHE_ENV_VAR = "CONDA_STANDALONE_SHELL_CACHE"
+COMMANDS = ("hook", "activate", "deactivate", "reactivate")
+# Environment variables the activators read, besides those of conda
+ACTIVATOR_ENV_VARS = ("PATH", "PS1", "prompt", "PROMPT")
+# Options of the conda-standalone entry point, which a cached output would not apply
+ENTRY_POINT_OPTIONS = ("--log-file", "--trace-file", "--profile", "--profile-mode", "--no-rc")
+
+# Path of the cache entry for this command, set by run_cached
+_cache_path: str | None = None
+
+
+def _cache_path_for(argv: Sequence[str]) -> str | None:
+    """Return the path of the cache entry for ``conda.exe <argv>``, if it can be cached."""
+    if (
+        len(argv) < 2
+        or argv[1] not in COMMANDS
+        or any(arg.split("=", 1)[0] in ENTRY_POINT_OPTIONS for arg in argv)
+    ):
+        return None
+    import hashlib
+
+    environ = {
+        name: value.replace(sys.prefix, SYS_PREFIX_PLACEHOLDER)
+        for name, value in os.environ.items()
+        if (name.startswith(KEY_ENV_PREFIXES) and not name.startswith("CONDA_STANDALONE_"))
+        # The hook does not depend on the active environment
+        or (argv[1] != "hook" and name in ACTIVATOR_ENV_VARS)
+    }
+    key = json.dumps(
+        [
+            list(argv),
+            os.getcwd() if argv[1] != "hook" else None,
+            sys.executable,
+            # A new conda-standalone may generate different output
+            stamp(sys.executable),
+            sorted(environ.items()),
+        ],
+        separators=(",", ":"),
+    )
+    cache_dir = os.environ.get(CACHE_ENV_VAR)
+    if not cache_dir:
+        from platformdirs import user_cache_dir
+
+        cache_dir = os.path.join(user_cache_dir("conda-standalone", appauthor=False), "shell")
+    return os.path.join(cache_dir, f"{hashlib.sha256(key.encode()).hexdigest()}.json")
+
+
+def run_cached(argv: Sequence[str]) -> int | None:
+    """Print the cached output of ``conda.exe <argv>`` without importing conda.
+
+    Returns None if there is no valid cache entry. ``use_shell_cache`` then fills the cache
+    when conda generates the output.
+    """
+    global _cache_path
+
+    _cache_path = _cache_path_for(argv)
+    if _cache_path is None:
+        return None
+    entry = load_entry(_cache_path)
+    if entry is None or any(
+        os.environ.get(name) != value for name, value in entry["environ"].items()
+    ):
+        return None
+    from . import startup_profile
+
+    with startup_profile.span("shell output from cache"):
+        sys.stdout.write(entry["output"].replace(SYS_PREFIX_PLACEHOLDER, sys.prefix))
+    return 0
+
+
+def _stamps(prefixes: set[str]) -> dict[str, int | None]:
+    """Return the modification times of the files the output for ``prefixes`` depends on."""
+    from conda.base.context import context
+
+    # Environments are looked up by name in the environment directories
+    paths = list(context.envs_dirs)
+    for prefix in prefixes:
+        paths.extend(
+            os.path.join(prefix, *parts)
+            for parts in (
+                ("conda-meta",),
+                ("conda-meta", "state"),
+                ("etc", "conda", "activate.d"),
+                ("etc", "conda", "deactivate.d"),
+                ("etc", "conda", "env_vars.d"),
+                # The MSYS2 variants of the environment on Windows
+                ("Library",),
+            )
+        )
+    return {**config_stamps(prefixes), **{path: stamp(path) for path in paths}}
+
+
+def _record_prefixes(
+    prefixes: set[str], env_var_names: set[str]
+) -> list[tuple[type, str, Callable]]:
+    """Record the prefixes the activator inspects and the variables they set.
+
+    Returns the original methods, which have to be restored afterwards.
+    """
+    from conda.activate import _Activator
+
+    def recording(method: Callable, records_env_vars: bool = False) -> Callable:
+        def wrapper(self, prefix):
+            result = method(self, prefix)
+            if prefix:
+                prefixes.add(prefix)
+            if records_env_vars:
+                env_var_names.update(result)
+            return result
+
+        return wrapper
+
+    originals = []
+    for name in ("_get_activate_scripts", "_get_deactivate_scripts", "_get_environment_env_vars"):
+        method = getattr(_Activator, name)
+        originals.append((_Activator, name, method))
+        setattr(_Activator, name, recording(method, name == "_get_environment_env_vars"))
+    return originals
+
+
+def use_shell_cache() -> None:
+    """Make conda write the output of ``shell.*`` commands to the cache."""
+    from importlib import import_module
+
+    # conda.cli.main is shadowed by the function of the same name in conda.cli
+    main_module = import_module("conda.cli.main")
+    cache_path = _cache_path
+    if cache_path is None:
+        return
+    original_main_sourced = main_module.main_sourced
+
+    def main_sourced(shell: str, *args, **kwargs) -> int:
+        from contextlib import redirect_stderr, redirect_stdout
+        from io import StringIO
+
+        from conda.activate import _build_activator_cls
+
+        prefixes: set[str] = set()
+        env_var_names: set[str] = set()
+        originals = _record_prefixes(prefixes, env_var_names)
+        stdout = StringIO()
+        stderr = StringIO()
+        try:
+            with redirect_stdout(stdout), redirect_stderr(stderr):
+                exit_code = original_main_sourced(shell, *args, **kwargs)
+        finally:
+            for owner, name, method in originals:
+                setattr(owner, name, method)
+            sys.stdout.write(stdout.getvalue())
+            sys.stderr.write(stderr.getvalue())
+        if (
+            exit_code == 0
+            and not stderr.getvalue()
+            # The output is the path of a temporary file that the shell removes
+            and _build_activator_cls(shell.replace("shell.", "", 1)).tempfile_extension is None
+        ):
+            entry = {
+                "stamps": _stamps(prefixes),
+                "environ": {name: os.environ.get(name) for name in sorted(env_var_names)},
+                "output": stdout.getvalue().replace(sys.prefix, SYS_PREFIX_PLACEHOLDER),
+            }
+            write_entry(cache_path, entry)
+        return exit_code
+
+    main_module.main_sourced = main_sourced
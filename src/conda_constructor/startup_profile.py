@@ -0,0 +1,372 @@
+"""Record where the startup time of conda-standalone goes.
+
+Profiling is enabled by setting ``CONDA_STANDALONE_STARTUP_PROFILE`` to the path of the
+output file. ``CONDA_STANDALONE_STARTUP_PROFILE_FORMAT`` selects the output format:
+``json`` (default) or ``chrome`` for the Chrome trace event format, which can be
+loaded into ``chrome://tracing`` or https://ui.perfetto.dev.
+
+This module is imported before anything else to time all following imports,
+so it must stay cheap to import. When profiling is disabled, it does nothing.
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+import time
+from contextlib import contextmanager, nullcontext
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Iterator
+    from contextlib import AbstractContextManager
+    from typing import Any
+
+PROFILE_ENV_VAR = "CONDA_STANDALONE_STARTUP_PROFILE"
+FORMAT_ENV_VAR = "CONDA_STANDALONE_STARTUP_PROFILE_FORMAT"
+FORMATS = ("json", "chrome")
+# Seconds between 1601-01-01 (Windows FILETIME epoch) and 1970-01-01
+FILETIME_EPOCH_OFFSET = 11644473600
+
+_profiler: StartupProfiler | None = None
+
+
+class _ImportNode:
+    __slots__ = ("name", "start", "end", "children")
+
+    def __init__(self, name: str, start: float):
+        self.name = name
+        self.start = start
+        self.end = start
+        self.children: list[_ImportNode] = []
+
+
+class StartupProfiler:
+    """Collects wall-clock spans of startup phases and a tree of module imports.
+
+    All times are stored as seconds since the epoch so that they can be compared
+    with the start times of the processes.
+    """
+
+    def __init__(self, output: str, output_format: str):
+        self.output = output
+        self.output_format = output_format
+        self.pid = os.getpid()
+        self._epoch_offset = time.time() - time.perf_counter()
+        self.start = self.now()
+        self.phases: list[tuple[str, float, float]] = []
+        self._import_stacks: dict[int, list[_ImportNode]] = {}
+        self._import_roots: dict[int, list[_ImportNode]] = {}
+        self._original_find_and_load: Callable | None = None
+
+    def now(self) -> float:
+        return self._epoch_offset + time.perf_counter()
+
+    @contextmanager
+    def span(self, name: str) -> Iterator[None]:
+        start = self.now()
+        try:
+            yield
+        finally:
+            self.phases.append((name, start, self.now()))
+
+    def trace_calls(self, owner: Any, attribute: str, name: str) -> None:
+        """Record a span every time ``owner.attribute`` is called."""
+        original = getattr(owner, attribute)
+
+        def traced(*args, **kwargs):
+            with self.span(name):
+                return original(*args, **kwargs)
+
+        setattr(owner, attribute, traced)
+
+    def start_import_tracking(self) -> None:
+        """Time the imports of modules that are not imported yet, like ``-X importtime``.
+
+        The interpreter calls ``_find_and_load`` of the import machinery for every module
+        that is not in ``sys.modules`` yet, including the parent packages.
+        """
+        import _frozen_importlib
+        import _thread
+
+        original = _frozen_importlib._find_and_load
+        self._original_find_and_load = original
+
+        def _find_and_load(name, import_):
+            thread_id = _thread.get_ident()
+            stack = self._import_stacks.get(thread_id)
+            if stack is None:
+                stack = self._import_stacks[thread_id] = []
+                self._import_roots[thread_id] = []
+            node = _ImportNode(name, self.now())
+            (stack[-1].children if stack else self._import_roots[thread_id]).append(node)
+            stack.append(node)
+            try:
+                return original(name, import_)
+            finally:
+                node.end = self.now()
+                stack.pop()
+
+        _frozen_importlib._find_and_load = _find_and_load
+
+    def stop_import_tracking(self) -> None:
+        if self._original_find_and_load is not None:
+            import _frozen_importlib
+
+            _frozen_importlib._find_and_load = self._original_find_and_load
+            self._original_find_and_load = None
+
+    def _process_phases(self) -> list[tuple[str, float, float]]:
+        """Return the phases before this module was imported, if they can be determined."""
+        process_start = _process_start_time(os.getpid())
+        if process_start is None:
+            return []
+        phases = []
+        if _is_onefile():
+            # The bootloader process extracts the application and starts this process
+            bootloader_start = _process_start_time(os.getppid())
+            if bootloader_start is not None and bootloader_start <= process_start:
+                phases.append(("bootloader", bootloader_start, process_start))
+        phases.append(("python init", process_start, self.start))
+        return phases
+
+    def report(self) -> dict:
+        end = self.now()
+        phases = [*self._process_phases(), *self.phases]
+        origin = min(start for _, start, _ in phases) if phases else self.start
+        origin = min(origin, self.start)
+
+        def to_ms(seconds: float) -> float:
+            return round(seconds * 1000, 3)
+
+        def import_tree(node: _ImportNode) -> dict:
+            cumulative = node.end - node.start
+            children_time = sum(child.end - child.start for child in node.children)
+            return {
+                "module": node.name,
+                "start_ms": to_ms(node.start - origin),
+                "self_ms": to_ms(cumulative - children_time),
+                "cumulative_ms": to_ms(cumulative),
+                "children": [import_tree(child) for child in node.children],
+            }
+
+        return {
+            "argv": sys.argv,
+            "frozen": getattr(sys, "frozen", False),
+            "onefile": _is_onefile(),
+            "total_ms": to_ms(end - origin),
+            "peak_rss_bytes": _peak_rss(),
+            "phases": [
+                {
+                    "name": name,
+                    "start_ms": to_ms(start - origin),
+                    "duration_ms": to_ms(phase_end - start),
+                }
+                for name, start, phase_end in sorted(phases, key=lambda phase: phase[1])
+            ],
+            "imports": {
+                str(thread_id): [import_tree(node) for node in nodes]
+                for thread_id, nodes in self._import_roots.items()
+            },
+        }
+
+    def write(self) -> None:
+        if os.getpid() != self.pid:
+            # Forked child processes inherit the exit handler
+            return
+        import json
+
+        self.stop_import_tracking()
+        report = self.report()
+        if self.output_format == "chrome":
+            report = to_chrome_trace(report, self.pid)
+        with open(self.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+def to_chrome_trace(report: dict, pid: int) -> dict:
+    """Convert a startup profile report into the Chrome trace event format.
+
+    Phases are shown in their own row and the imports in one row per thread.
+    """
+    events = [
+        {"name": "process_name", "ph": "M", "pid": pid, "args": {"name": "conda-standalone"}},
+        {"name": "thread_name", "ph": "M", "pid": pid, "tid": 0, "args": {"name": "phases"}},
+    ]
+    for phase in report["phases"]:
+        events.append(
+            {
+                "name": phase["name"],
+                "cat": "phase",
+                "ph": "X",
+                "ts": phase["start_ms"] * 1000,
+                "dur": phase["duration_ms"] * 1000,
+                "pid": pid,
+                "tid": 0,
+            }
+        )
+
+    def add_imports(nodes: list[dict], tid: int) -> None:
+        for node in nodes:
+            events.append(
+                {
+                    "name": node["module"],
+                    "cat": "import",
+                    "ph": "X",
+                    "ts": node["start_ms"] * 1000,
+                    "dur": node["cumulative_ms"] * 1000,
+                    "pid": pid,
+                    "tid": tid,
+                    "args": {"self_ms": node["self_ms"]},
+                }
+            )
+            add_imports(node["children"], tid)
+
+    for tid, (thread_id, nodes) in enumerate(report["imports"].items(), start=1):
+        events.append(
+            {
+                "name": "thread_name",
+                "ph": "M",
+                "pid": pid,
+                "tid": tid,
+                "args": {"name": f"imports (thread {thread_id})"},
+            }
+        )
+        add_imports(nodes, tid)
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+def _is_onefile() -> bool:
+    meipass = getattr(sys, "_MEIPASS", None)
+    if not getattr(sys, "frozen", False) or meipass is None:
+        return False
+    # onedir builds run from the directory of the executable or its _internal directory
+    executable_dir = os.path.dirname(os.path.realpath(sys.executable))
+    return os.path.realpath(meipass) not in (
+        executable_dir,
+        os.path.join(executable_dir, "_internal"),
+    )
+
+
+def _process_start_time(pid: int) -> float | None:
+    """Return the start time of a process in seconds since the epoch (Linux and Windows)."""
+    try:
+        if sys.platform == "linux":
+            with open(f"/proc/{pid}/stat") as f:
+                # The process name may contain spaces, so split after it
+                fields = f.read().rpartition(")")[2].split()
+            # Field 22 of /proc/<pid>/stat is the start time in clock ticks after boot
+            start_after_boot = int(fields[19]) / os.sysconf("SC_CLK_TCK")
+            return time.time() - time.clock_gettime(time.CLOCK_BOOTTIME) + start_after_boot
+        if sys.platform == "win32":
+            import ctypes
+            from ctypes import wintypes
+
+            process_query_limited_information = 0x1000
+            kernel32 = ctypes.windll.kernel32
+            handle = kernel32.OpenProcess(process_query_limited_information, False, pid)
+            if not handle:
+                return None
+            try:
+                creation, exit_time, kernel, user = (wintypes.FILETIME() for _ in range(4))
+                if not kernel32.GetProcessTimes(
+                    handle,
+                    ctypes.byref(creation),
+                    ctypes.byref(exit_time),
+                    ctypes.byref(kernel),
+                    ctypes.byref(user),
+                ):
+                    return None
+            finally:
+                kernel32.CloseHandle(handle)
+            # FILETIME counts 100 ns intervals since 1601-01-01
+            filetime = (creation.dwHighDateTime << 32) | creation.dwLowDateTime
+            return filetime / 1e7 - FILETIME_EPOCH_OFFSET
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+    return None
+
+
+def _peak_rss() -> int | None:
+    """Return the peak resident set size of this process in bytes."""
+    try:
+        if sys.platform == "linux":
+            # Unlike ru_maxrss, VmHWM does not include the memory of the process before exec
+            with open("/proc/self/status") as f:
+                for line in f:
+                    if line.startswith("VmHWM:"):
+                        return int(line.split()[1]) * 1024
+            return None
+        if sys.platform == "win32":
+            import ctypes
+            from ctypes import wintypes
+
+            class ProcessMemoryCounters(ctypes.Structure):
+                _fields_ = [
+                    ("cb", wintypes.DWORD),
+                    ("PageFaultCount", wintypes.DWORD),
+                    ("PeakWorkingSetSize", ctypes.c_size_t),
+                    ("WorkingSetSize", ctypes.c_size_t),
+                    ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+                    ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                    ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+                    ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                    ("PagefileUsage", ctypes.c_size_t),
+                    ("PeakPagefileUsage", ctypes.c_size_t),
+                ]
+
+            kernel32 = ctypes.windll.kernel32
+            kernel32.GetCurrentProcess.restype = wintypes.HANDLE
+            counters = ProcessMemoryCounters()
+            counters.cb = ctypes.sizeof(counters)
+            if not kernel32.K32GetProcessMemoryInfo(
+                kernel32.GetCurrentProcess(), ctypes.byref(counters), counters.cb
+            ):
+                return None
+            return counters.PeakWorkingSetSize
+        import resource
+
+        # Reported in bytes on macOS and in kilobytes elsewhere
+        peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak_rss if sys.platform == "darwin" else peak_rss * 1024
+    except (OSError, ValueError, IndexError, AttributeError, ImportError):
+        return None
+
+
+def start() -> None:
+    """Start profiling if it is enabled via the environment.
+
+    The environment variables are removed so that subprocesses, e.g. multiprocessing
+    workers, are not profiled and do not overwrite the output.
+    """
+    global _profiler
+
+    output = os.environ.pop(PROFILE_ENV_VAR, None)
+    output_format = os.environ.pop(FORMAT_ENV_VAR, None) or "json"
+    if not output or _profiler is not None:
+        return
+    if output_format not in FORMATS:
+        print(
+            f"Unknown startup profile format '{output_format}'. "
+            f"Choose one of: {', '.join(FORMATS)}.",
+            file=sys.stderr,
+        )
+        return
+    import atexit
+
+    _profiler = StartupProfiler(os.path.abspath(output), output_format)
+    _profiler.start_import_tracking()
+    atexit.register(_profiler.write)
+
+
+def span(name: str) -> AbstractContextManager[None]:
+    """Record a startup phase if profiling is enabled."""
+    if _profiler is None:
+        return nullcontext()
+    return _profiler.span(name)
+
+
+def trace_calls(owner: Any, attribute: str, name: str) -> None:
+    """Record a startup phase for every call of ``owner.attribute`` if profiling is enabled."""
+    if _profiler is not None:
+        _profiler.trace_calls(owner, attribute, name)
@@ -0,0 +1,148 @@
+"""Record timed spans of installer operations and write them as a Chrome trace.
+
+Tracing is enabled with ``--trace-file <path>`` or by setting ``CONDA_STANDALONE_TRACE_FILE``
+to the path of the output file. The trace can be loaded into ``chrome://tracing`` or
+https://ui.perfetto.dev. Spans nest by time within each thread and carry attributes, e.g.
+the package or environment they belong to.
+
+Worker processes do not write traces themselves. Functions that run in worker processes
+record their spans with ``collect`` and return them to the parent, which adds them to its
+trace with ``add_events``. When tracing is disabled, spans do nothing.
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+    from contextlib import AbstractContextManager
+    from typing import Any
+
+TRACE_ENV_VAR = "CONDA_STANDALONE_TRACE_FILE"
+
+_tracer: Tracer | None = None
+
+
+class Tracer:
+    """Collects spans as complete events of the Chrome trace event format.
+
+    Timestamps are microseconds since the epoch so that the events of several processes
+    can be merged into one trace.
+    """
+
+    def __init__(self, output: str | None = None):
+        self.output = output
+        self.pid = os.getpid()
+        self.events: list[dict] = []
+        self._epoch_offset = time.time() - time.perf_counter()
+        self._lock = threading.Lock()
+
+    def now(self) -> float:
+        return (self._epoch_offset + time.perf_counter()) * 1e6
+
+    @contextmanager
+    def span(self, name: str, attributes: dict[str, Any]) -> Iterator[dict[str, Any]]:
+        start = self.now()
+        try:
+            yield attributes
+        finally:
+            event = {
+                "name": name,
+                "cat": "span",
+                "ph": "X",
+                "ts": start,
+                "dur": self.now() - start,
+                "pid": os.getpid(),
+                "tid": threading.get_native_id(),
+                "args": attributes,
+            }
+            with self._lock:
+                self.events.append(event)
+
+    def add_events(self, events: list[dict]) -> None:
+        with self._lock:
+            self.events.extend(events)
+
+    def trace(self) -> dict:
+        events = sorted(self.events, key=lambda event: event["ts"])
+        origin = events[0]["ts"] if events else 0
+        metadata = [
+            {"name": "process_name", "ph": "M", "pid": pid, "args": {"name": "conda-standalone"}}
+            for pid in sorted({event["pid"] for event in events})
+        ]
+        return {
+            "traceEvents": [
+                *metadata,
+                *({**event, "ts": round(event["ts"] - origin, 3)} for event in events),
+            ],
+            "displayTimeUnit": "ms",
+        }
+
+    def write(self) -> None:
+        if os.getpid() != self.pid or self.output is None:
+            # Forked child processes inherit the exit handler
+            return
+        import json
+
+        with open(self.output, "w") as f:
+            json.dump(self.trace(), f, default=str)
+
+
+def start(output: str | os.PathLike | None = None) -> None:
+    """Start tracing into ``output`` or the file set in the environment, if any.
+
+    The environment variable is removed so that child processes, e.g. conda-standalone
+    processes started by this one, do not overwrite the output.
+    """
+    global _tracer
+
+    output = output or os.environ.pop(TRACE_ENV_VAR, None)
+    os.environ.pop(TRACE_ENV_VAR, None)
+    if not output or _tracer is not None:
+        return
+    import atexit
+
+    _tracer = Tracer(os.path.abspath(output))
+    atexit.register(_tracer.write)
+
+
+def enabled() -> bool:
+    return _tracer is not None
+
+
+def span(name: str, **attributes: Any) -> AbstractContextManager[dict[str, Any]]:
+    """Record a span if tracing is enabled.
+
+    The context manager returns the attributes of the span, so that attributes that are only
+    known at the end, like the number of files found, can be added.
+    """
+    if _tracer is None:
+        return nullcontext(attributes)
+    return _tracer.span(name, attributes)
+
+
+def add_events(events: list[dict] | None) -> None:
+    """Add the events recorded by ``collect`` in another process to the trace."""
+    if _tracer is not None and events:
+        _tracer.add_events(events)
+
+
+@contextmanager
+def collect() -> Iterator[list[dict]]:
+    """Record the spans of this process into the returned list instead of a file.
+
+    Used in worker processes, whose spans are sent back to the parent process.
+    """
+    global _tracer
+
+    previous = _tracer
+    _tracer = Tracer()
+    try:
+        yield _tracer.events
+    finally:
+        _tracer = previous
@@ -2,6 +2,9 @@ import logging
 import os
 import re
 import sys
+from collections.abc import Iterator
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from contextlib import contextmanager
 from pathlib import Path
 from shutil import rmtree
 
@@ -10,6 +13,7 @@ from conda.base.context import context, reset_context
 from conda.cli.main import main as conda_main
 from conda.common.compat import on_win
 from conda.common.path import win_path_to_unix
+from conda.core.envs_manager import unregister_env
 from conda.core.initialize import (
     CONDA_INITIALIZE_PS_RE_BLOCK,
     CONDA_INITIALIZE_RE_BLOCK,
@@ -23,7 +27,38 @@ from conda.notices.cache import get_notices_cache_dir
 from menuinst.cli.cli import install as install_shortcut
 from ruamel.yaml import YAML
 
+from . import tracing
+
 logger = logging.getLogger()
+# Directories of an environment that are managed by conda or its packages.
+# They never contain other environments, so they are skipped when searching for environments.
+# Compared in lower case because the directory names differ in case on Windows.
+ENVIRONMENT_SKIP_DIRS = frozenset(
+    {
+        "bin",
+        "compiler_compat",
+        "conda-meta",
+        "condabin",
+        "dlls",
+        "etc",
+        "include",
+        "lib",
+        "lib32",
+        "lib64",
+        "libexec",
+        "library",
+        "man",
+        "menu",
+        "pkgs",
+        "sbin",
+        "scripts",
+        "share",
+        "shell",
+        "ssl",
+        "tcl",
+        "tools",
+    }
+)
 # On Windows, these warnings are expected because the uninstaller may still be
 # accessing files (like install.log) that conda cannot rename.
 if sys.platform == "win32":
@@ -169,13 +204,17 @@ def _get_init_reverse_plan(
 def _run_conda_init_reverse(for_user: bool, prefix: Path, prefixes: list[Path]):
     for_system = not for_user
     anaconda_prompt = False
-    plan = _get_init_reverse_plan(prefix, prefixes, for_user, for_system, anaconda_prompt)
+    with tracing.span("build init reverse plan", for_user=for_user) as attributes:
+        plan = _get_init_reverse_plan(prefix, prefixes, for_user, for_system, anaconda_prompt)
+        attributes["targets"] = len(plan)
     # Do not call conda.core.initialize() because it will always run make_install_plan.
     # That function will search for activation scripts in sys.prefix which do no exist
     # in the extraction directory of conda-standalone.
-    run_plan(plan)
+    with tracing.span("run init reverse plan", for_user=for_user):
+        run_plan(plan)
     try:
-        run_plan_elevated(plan)
+        with tracing.span("run elevated init reverse plan", for_user=for_user):
+            run_plan_elevated(plan)
     except Exception as exc:
         logger.error(
             "Could not revert some shell profiles because they require elevated privileges. "
@@ -203,7 +242,183 @@ def _get_menuinst_base_prefix(prefix: Path, conda_root_prefix: Path | None) -> P
     return prefix
 
 
-def _remove_environments(prefix: Path, prefixes: list[Path]):
+def _prepare_removal(env_prefix: Path, menuinst_base_prefix: Path) -> None:
+    # Unprotect frozen environments first
+    frozen_file = env_prefix / PREFIX_FROZEN_FILE
+    if frozen_file.is_file():
+        try:
+            _remove_file_directory(frozen_file, raise_on_error=True)
+        except PermissionError as e:
+            raise PermissionError(
+                f"Failed to unprotect '{env_prefix}'. Try to re-run the uninstallation with "
+                f"elevated privileges or remove the file '{frozen_file}' manually.",
+            ) from e
+
+    with tracing.span("remove shortcuts", prefix=str(env_prefix)):
+        install_shortcut(env_prefix, root_prefix=str(menuinst_base_prefix), remove_shortcuts=[])
+
+
+@contextmanager
+def _allow_removal(
+    env_prefixes: list[Path], conda_root_prefix: Path | None, default_activation_prefix: Path
+) -> Iterator[None]:
+    """Temporarily change the configuration so that conda can remove ``env_prefixes``."""
+    environ = {}
+    # If conda_root_prefix is the same as prefix, conda remove will not be able
+    # to remove that environment, so temporarily unset it.
+    if conda_root_prefix and conda_root_prefix in env_prefixes:
+        environ["CONDA_ROOT_PREFIX"] = None
+    # Conda does not remove the default environment, so set it to something else temporarily
+    if default_activation_prefix in env_prefixes:
+        environ["CONDA_DEFAULT_ACTIVATION_ENV"] = sys.prefix
+    if not environ:
+        yield
+        return
+    original = {name: os.environ.get(name) for name in environ}
+    try:
+        _set_environ(environ)
+        reset_context()
+        yield
+    finally:
+        # Worker processes remove further environments afterwards
+        _set_environ(original)
+        reset_context()
+
+
+def _set_environ(environ: dict[str, str | None]) -> None:
+    for name, value in environ.items():
+        if value is None:
+            os.environ.pop(name, None)
+        else:
+            os.environ[name] = value
+
+
+def _remove_environment(
+    env_prefix: Path,
+    menuinst_base_prefix: Path,
+    conda_root_prefix: Path | None,
+    default_activation_prefix: Path,
+) -> None:
+    _prepare_removal(env_prefix, menuinst_base_prefix)
+    with (
+        _allow_removal([env_prefix], conda_root_prefix, default_activation_prefix),
+        tracing.span("conda remove", prefix=str(env_prefix)),
+    ):
+        return_code = conda_main("remove", "-y", "-p", str(env_prefix), "--all")
+    if return_code != 0:
+        raise RuntimeError(f"Failed to remove environment '{env_prefix}'.")
+
+
+def _remove_environment_traced(*args) -> list[dict]:
+    """Remove an environment in a worker process and return the recorded spans."""
+    with tracing.collect() as events:
+        _remove_environment(*args)
+    return events
+
+
+def _nesting_parents(prefixes: list[Path]) -> dict[Path, Path]:
+    """Map each environment to the innermost environment it is nested in, if any.
+
+    ``prefixes`` must be sorted by path depth.
+    """
+    parents = {}
+    for index, env_prefix in enumerate(prefixes):
+        for candidate in reversed(prefixes[:index]):
+            if env_prefix.is_relative_to(candidate):
+                parents[env_prefix] = candidate
+                break
+    return parents
+
+
+def _remove_environments_concurrently(
+    prefixes: list[Path], max_workers: int | None, *args
+) -> None:
+    """Remove environments with a pool of worker processes.
+
+    Nested environments form a tree: an environment is removed after all environments nested
+    in it, because removing it deletes their directories. Environments that are not nested in
+    each other, like those in ``envs``, are removed concurrently.
+    """
+    parents = _nesting_parents(prefixes)
+    num_nested = dict.fromkeys(prefixes, 0)
+    for parent in parents.values():
+        num_nested[parent] += 1
+    ready = [env_prefix for env_prefix in reversed(prefixes) if not num_nested[env_prefix]]
+    remove_environment = _remove_environment_traced if tracing.enabled() else _remove_environment
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = {}
+        try:
+            while ready or futures:
+                for env_prefix in ready:
+                    futures[executor.submit(remove_environment, env_prefix, *args)] = env_prefix
+                ready = []
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    env_prefix = futures.pop(future)
+                    tracing.add_events(future.result())
+                    parent = parents.get(env_prefix)
+                    if parent is not None:
+                        num_nested[parent] -= 1
+                        if not num_nested[parent]:
+                            ready.append(parent)
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+
+
+def _remove_environments_in_transaction(
+    prefixes: list[Path],
+    menuinst_base_prefix: Path,
+    conda_root_prefix: Path | None,
+    default_activation_prefix: Path,
+) -> None:
+    """Unlink the packages of all environments in a single transaction.
+
+    Unlike ``conda remove --all``, the CLI and the context are only set up once. The transaction
+    still runs the pre-unlink scripts and removes the shortcuts of the packages.
+    """
+    from conda.core.link import PrefixSetup, UnlinkLinkTransaction
+    from conda.core.prefix_data import PrefixData
+    from conda.gateways.disk.delete import rm_rf
+
+    for env_prefix in reversed(prefixes):
+        _prepare_removal(env_prefix, menuinst_base_prefix)
+    setups = []
+    for env_prefix in prefixes:
+        records = tuple(PrefixData(str(env_prefix)).iter_records())
+        if records:
+            setups.append(
+                PrefixSetup(
+                    target_prefix=str(env_prefix),
+                    unlink_precs=records,
+                    link_precs=(),
+                    remove_specs=(),
+                    update_specs=(),
+                    neutered_specs={},
+                )
+            )
+    if setups:
+        transaction = UnlinkLinkTransaction(*setups)
+        if not context.quiet and not context.json:
+            transaction.print_transaction_summary()
+        with (
+            _allow_removal(prefixes, conda_root_prefix, default_activation_prefix),
+            tracing.span("unlink transaction", environments=len(setups)),
+        ):
+            transaction.execute()
+    # Files left behind by the packages, e.g. caches or user files, are removed as well
+    for env_prefix in reversed(prefixes):
+        rm_rf(str(env_prefix))
+        unregister_env(str(env_prefix))
+
+
+def _remove_environments(
+    prefix: Path,
+    prefixes: list[Path],
+    max_workers: int | None = 1,
+    single_transaction: bool = False,
+):
     # menuinst must be run separately because conda remove --all does not remove all shortcuts.
     # This is because some placeholders depend on conda's context.root_prefix, which is set to
     # the extraction directory of conda-standalone. The base prefix must be determined separately
@@ -213,46 +428,30 @@ def _remove_environments(prefix: Path, prefixes: list[Path]):
         conda_root_prefix = Path(conda_root_prefix).resolve()
     default_activation_prefix = context.default_activation_prefix.resolve()
     menuinst_base_prefix = _get_menuinst_base_prefix(prefix, conda_root_prefix).resolve()
+    args = (menuinst_base_prefix, conda_root_prefix, default_activation_prefix)
+    if single_transaction:
+        _remove_environments_in_transaction(prefixes, *args)
+        return
     # Uninstalling environments must be performed with the deepest environment first.
     # Otherwise, parent environments will delete the environment directory and
     # uninstallation logic (removing shortcuts, pre-unlink scripts, etc.) cannot be run.
-    for env_prefix in reversed(prefixes):
-        # Unprotect frozen environments first
-        frozen_file = env_prefix / PREFIX_FROZEN_FILE
-        if frozen_file.is_file():
-            try:
-                _remove_file_directory(frozen_file, raise_on_error=True)
-            except PermissionError as e:
-                raise PermissionError(
-                    f"Failed to unprotect '{env_prefix}'. Try to re-run the uninstallation with "
-                    f"elevated privileges or remove the file '{frozen_file}' manually.",
-                ) from e
-
-        install_shortcut(env_prefix, root_prefix=str(menuinst_base_prefix), remove_shortcuts=[])
-        # If conda_root_prefix is the same as prefix, conda remove will not be able
-        # to remove that environment, so temporarily unset it.
-        if conda_root_prefix and conda_root_prefix == env_prefix:
-            del os.environ["CONDA_ROOT_PREFIX"]
-            reset_context()
-        # Conda does not remove the default environment, so set it to something else temporarily
-        if default_activation_prefix == env_prefix:
-            os.environ["CONDA_DEFAULT_ACTIVATION_ENV"] = sys.prefix
-            reset_context()
-
-        return_code = conda_main("remove", "-y", "-p", str(env_prefix), "--all")
-        if return_code != 0:
-            raise RuntimeError(f"Failed to remove environment '{env_prefix}'.")
-
-        if conda_root_prefix and conda_root_prefix == env_prefix:
-            os.environ["CONDA_ROOT_PREFIX"] = str(conda_root_prefix)
-            reset_context()
-        if default_activation_prefix == env_prefix:
-            del os.environ["CONDA_DEFAULT_ACTIVATION_ENV"]
-            reset_context()
+    remaining = prefixes
+    nested = [env_prefix for env_prefix in prefixes if env_prefix != prefix.resolve()]
+    if max_workers != 1 and len(nested) > 1:
+        _remove_environments_concurrently(nested, max_workers, *args)
+        # Concurrent removals may overwrite each other's changes to environments.txt
+        for env_prefix in nested:
+            unregister_env(str(env_prefix))
+        # The uninstall prefix, which may contain conda-standalone itself,
+        # is removed in this process after the worker processes have exited.
+        remaining = [env_prefix for env_prefix in prefixes if env_prefix not in nested]
+    for env_prefix in reversed(remaining):
+        _remove_environment(env_prefix, *args)
 
 
 def _remove_caches():
-    return_code = conda_main("clean", "--all", "-y")
+    with tracing.span("conda clean"):
+        return_code = conda_main("clean", "--all", "-y")
     if return_code != 0:
         logger.warning("Failed to remove all cache files.")
     # Delete empty package cache directories
@@ -337,15 +536,57 @@ def _remove_default_environment_from_configs(prefixes: list[Path]):
             )
 
 
+def _find_prefixes(prefix: Path) -> list[Path]:
+    """Find all conda environments inside a directory.
+
+    Directories are walked with ``os.scandir`` without following symbolic links. Inside
+    environments, the directories managed by conda and its packages are skipped, which
+    avoids walking the package cache and the installed files. Other directories, e.g.
+    ``envs`` or environments created in custom locations, are searched at any depth.
+
+    The environments are sorted by path depth, which places the root prefix first.
+    Since it is more likely that profiles contain the root prefix,
+    this makes loops more efficient.
+    """
+    prefixes = []
+    directories = [os.fspath(prefix)]
+    while directories:
+        directory = directories.pop()
+        is_environment = os.path.exists(os.path.join(directory, PREFIX_MAGIC_FILE))
+        if is_environment:
+            prefixes.append(Path(directory).resolve())
+        try:
+            entries = os.scandir(directory)
+        except OSError:
+            continue
+        with entries:
+            for entry in entries:
+                if is_environment and entry.name.lower() in ENVIRONMENT_SKIP_DIRS:
+                    continue
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        directories.append(entry.path)
+                except OSError:
+                    continue
+    prefixes.sort(key=lambda x: (len(x.parts), x))
+    return prefixes
+
+
 def uninstall(
     prefix: Path,
     remove_caches: bool = False,
     remove_config_files: str | None = None,
     remove_user_data: bool = False,
+    max_workers: int | None = 1,
+    single_transaction: bool = False,
 ) -> None:
     """
     Remove a conda prefix or a directory containing conda environments.
 
+    Up to ``max_workers`` environments are removed concurrently, or as many as there are
+    processors if it is None. With ``single_transaction``, the packages of all environments
+    are unlinked in one transaction instead.
+
     This command also provides options to remove various cache and configuration
     files to fully remove a conda installation.
     """
@@ -364,11 +605,9 @@ def uninstall(
             )
 
     print(f"Uninstalling conda installation in {prefix}...")
-    prefixes = [file.parent.parent.resolve() for file in prefix.glob(f"**/{PREFIX_MAGIC_FILE}")]
-    # Sort by path depth. This will place the root prefix first
-    # Since it is more likely that profiles contain the root prefix,
-    # this makes loops more efficient.
-    prefixes.sort(key=lambda x: len(x.parts))
+    with tracing.span("find environments", prefix=str(prefix)) as attributes:
+        prefixes = _find_prefixes(prefix)
+        attributes["environments"] = len(prefixes)
 
     # Run conda --init reverse for the shells
     # that contain a prefix that is being uninstalled
@@ -379,7 +618,13 @@ def uninstall(
         _run_conda_init_reverse(for_user, prefix, prefixes)
 
     print("Removing environments...")
-    _remove_environments(prefix, prefixes)
+    with tracing.span(
+        "remove environments",
+        environments=len(prefixes),
+        max_workers=max_workers,
+        single_transaction=single_transaction,
+    ):
+        _remove_environments(prefix, prefixes, max_workers, single_transaction)
 
     # If the uninstall prefix is an environments directory,
     # it should only contain the magic file.
@@ -392,17 +637,21 @@ def uninstall(
 
     if remove_caches:
         print("Cleaning cache directories.")
-        _remove_caches()
+        with tracing.span("clean caches"):
+            _remove_caches()
 
     if remove_config_files:
         print("Removing .condarc files...")
-        _remove_config_files(remove_config_files)
+        with tracing.span("remove config files", scope=remove_config_files):
+            _remove_config_files(remove_config_files)
 
     if remove_user_data:
         print("Removing user data...")
-        _remove_file_directory(Path("~/.conda").expanduser())
+        with tracing.span("remove user data"):
+            _remove_file_directory(Path("~/.conda").expanduser())
 
     # Remove default activation environment where possible.
     # Run this at the end because at this point, a lot of
     # configuration files may have already been deleted.
-    _remove_default_environment_from_configs(prefixes)
+    with tracing.span("remove default environment from configs"):
+        _remove_default_environment_from_configs(prefixes)
@@ -15,6 +15,7 @@ from conda.models.match_spec import MatchSpec
 from conda.models.version import VersionOrder
 from conda_package_handling import api as cph_api
 
+from conda_constructor import tracing
 from conda_constructor._version import __buildnum__, __version__
 
 if TYPE_CHECKING:
@@ -122,7 +123,8 @@ def update_bootstrapper() -> None:
     os.environ["CONDA_RESTRICT_SEARCH_PATH"] = "1"
     reset_context()
 
-    match = _find_update(min_version=__version__, min_buildnum=__buildnum__)
+    with tracing.span("find update", version=__version__, buildnum=__buildnum__):
+        match = _find_update(min_version=__version__, min_buildnum=__buildnum__)
     if match is None:
         print("Already up-to-date.")
         return
@@ -134,13 +136,16 @@ def update_bootstrapper() -> None:
         if not package.name.lower().endswith(valid_suffixes):
             raise UpdateError(f"Cannot extract unknown package type: '{package.name}'.")
 
-        download(match.url, package, sha256=match.sha256)
-        cph_api.extract(str(package), dest_dir=str(tmp))
+        with tracing.span("download update", package=match.fn):
+            download(match.url, package, sha256=match.sha256)
+        with tracing.span("extract update", package=match.fn):
+            cph_api.extract(str(package), dest_dir=str(tmp))
         new_conda_exe = tmp / "standalone_conda" / "conda.exe"
 
         if not new_conda_exe.exists():
             raise UpdateError(f"Expected executable not found in package: {new_conda_exe}")
 
         conda_exe = Path(sys.executable)
-        _apply_update(new_conda_exe, conda_exe)
+        with tracing.span("apply update", executable=str(conda_exe)):
+            _apply_update(new_conda_exe, conda_exe)
         print(f"Updated conda-standalone to {match.version} (build {match.build}).")
@@ -7,28 +7,22 @@ It will end up calling the `conda` CLI, but it intercepts the call to do some
 preliminary work and handling some special cases that arise when PyInstaller is involved.
 """
 
+# Start profiling before anything else is imported
+from conda_constructor import startup_profile
+
+startup_profile.start()
+
+from conda_constructor import lazy_components, profiling, tracing
+
+lazy_components.install()
+
 import argparse
-import logging
 import os
 import sys
-from contextlib import contextmanager, nullcontext
+from contextlib import nullcontext
 from multiprocessing import freeze_support
 from pathlib import Path
 
-
-class StreamToLogger:
-    def __init__(self, logger, log_level=logging.INFO):
-        self.logger = logger
-        self.log_level = log_level
-
-    def write(self, buf):
-        self.logger.log(self.log_level, buf.rstrip())
-
-    def flush(self):
-        # Stream handlers need a flush method, but the log command flushes the buffer already
-        pass
-
-
 if os.name == "nt" and "SSLKEYLOGFILE" in os.environ:
     # This causes a crash with requests 2.32+ on Windows
     # Root cause is 'urllib3.util.ssl_.create_urllib3_context()'
@@ -38,6 +32,19 @@ if os.name == "nt" and "SSLKEYLOGFILE" in os.environ:
 if "CONDARC" not in os.environ:
     os.environ["CONDARC"] = os.path.join(sys.prefix, ".condarc")
 
+# Options of conda-standalone and of `conda run` that are followed by a value
+OPTIONS_WITH_VALUE = (
+    "--log-file",
+    "--trace-file",
+    "--profile",
+    "--profile-mode",
+    "-n",
+    "--name",
+    "-p",
+    "--prefix",
+    "--cwd",
+)
+
 
 def _fix_sys_path():
     """
@@ -61,15 +68,35 @@ def _python_subcommand():
     by hand. Options we support are:
 
     - -V/--version: print the version
+    - -O/-OO: compile the code that is run with optimizations
+    - -X importtime: print the time each following import takes
     - a path: run the file or directory/__main__.py
     - -c: run the command
     - -m: run the module
     - no arguments: start an interactive session
-    - stdin: run the passed input as if it was '-c'
+    - stdin: run the passed input as one program
     """
+    from conda_constructor import python_runner
 
     if sys.argv[1] == "python":
         del sys.argv[1]
+    optimize = 0
+    while len(sys.argv) > 1:
+        arg = sys.argv[1]
+        if arg.startswith("-O") and set(arg[1:]) == {"O"}:
+            optimize = min(optimize + len(arg) - 1, 2)
+        elif arg == "-X" and len(sys.argv) > 2:
+            del sys.argv[1]
+            name, _, value = sys.argv[1].partition("=")
+            sys._xoptions[name] = value or True
+        elif arg.startswith("-X") and len(arg) > 2:
+            name, _, value = arg[2:].partition("=")
+            sys._xoptions[name] = value or True
+        else:
+            break
+        del sys.argv[1]
+    if sys._xoptions.get("importtime"):
+        python_runner.print_import_times()
     first_arg = sys.argv[1] if len(sys.argv) > 1 else None
 
     if first_arg is None:
@@ -81,9 +108,7 @@ def _python_subcommand():
 
             return CondaStandaloneConsole().interact(exitmsg="")
         else:  # piped stuff
-            for line in sys.stdin:
-                exec(line)
-            return
+            return python_runner.run_stdin(optimize)
 
     if first_arg in ("-V", "--version"):
         print("Python " + ".".join([str(x) for x in sys.version_info[:3]]))
@@ -91,6 +116,10 @@ def _python_subcommand():
 
     import runpy
 
+    if os.path.isfile(first_arg):
+        del sys.argv[0]  # remove the executable, so that the script is sys.argv[0]
+        python_runner.run_code(python_runner.compile_file(first_arg, optimize), first_arg)
+        return
     if os.path.exists(first_arg):
         runpy.run_path(first_arg, run_name="__main__")
         return
@@ -106,10 +135,11 @@ def _python_subcommand():
             del sys.argv[0]  # remove the executable, but keep '-c' in sys.argv
             cmd = sys.argv[1]  # save the actual command
             del sys.argv[1]  # remove the passed command
-            exec(cmd)  # the extra arguments are still in sys.argv
+            # the extra arguments are still in sys.argv
+            exec(compile(cmd, "<string>", "exec", optimize=optimize))
             return
 
-    print("Usage: conda.exe python [-V] [-c cmd | -m mod | file] [arg] ...")
+    print("Usage: conda.exe python [-V] [-O] [-X importtime] [-c cmd | -m mod | file] [arg] ...")
     if first_arg in ("-h", "--help"):
         return
     return 1
@@ -131,70 +161,120 @@ def _patch_for_conda_run():
         os.environ.setdefault("CONDA_EXE", sys.executable)
 
 
-@contextmanager
-def setup_logger(logfile: Path):
-    """Forward all stdout and stderr output into a file logger.
+def _own_args_end() -> int:
+    """Return the index in sys.argv at which the arguments of conda-standalone and conda end.
 
-    This automatically captures all logger output.
+    The executable and the arguments of `conda run` follow, which are passed on as they are,
+    even if they look like options of conda-standalone.
     """
-    plain_formatter = logging.Formatter("%(message)s")
-    plain_logfile_handler = logging.FileHandler(logfile)
-    plain_logfile_handler.setFormatter(plain_formatter)
-
-    stdout_logger = logging.getLogger("stdout_logger")
-    stdout_logger.setLevel(logging.INFO)
-    stdout_logger.propagate = False
-    stdout_console_handler = logging.StreamHandler(sys.__stdout__)
-    stdout_console_handler.setFormatter(plain_formatter)
-    stdout_logger.addHandler(stdout_console_handler)
-    stdout_logger.addHandler(plain_logfile_handler)
-
-    stderr_logger = logging.getLogger("stderr_logger")
-    stderr_logger.setLevel(logging.INFO)
-    stderr_logger.propagate = False
-    stderr_console_handler = logging.StreamHandler(sys.__stderr__)
-    stderr_console_handler.setFormatter(plain_formatter)
-    stderr_logger.addHandler(stderr_console_handler)
-    stderr_logger.addHandler(plain_logfile_handler)
-
-    sys.stdout = StreamToLogger(stdout_logger)
-    sys.stderr = StreamToLogger(stderr_logger)
-    yield
-    sys.stdout = sys.__stdout__
-    sys.stderr = sys.__stderr__
-
-
-def _conda_main():
-    from conda.cli import main
+    argv = sys.argv
+    if len(argv) < 2 or argv[1] != "run":
+        return len(argv)
+    index = 2
+    while index < len(argv) and argv[index].startswith("-") and argv[index] != "--":
+        index += 2 if argv[index] in OPTIONS_WITH_VALUE else 1
+    return min(index, len(argv))
 
-    _fix_sys_path()
+
+def _handle_no_rc():
     try:
-        no_rc = sys.argv.index("--no-rc")
+        no_rc = sys.argv.index("--no-rc", 0, _own_args_end())
         os.environ["CONDA_RESTRICT_RC_SEARCH_PATH"] = "1"
         del sys.argv[no_rc]
     except ValueError:
         pass
 
-    from conda.plugins.manager import get_plugin_manager
 
-    from conda_constructor import plugin
+def _parse_output_files():
+    # Without abbreviations, so that conda's --trace is not taken for --trace-file
+    output_parser = argparse.ArgumentParser(add_help=False, allow_abbrev=False)
+    output_parser.add_argument("--log-file", type=Path)
+    output_parser.add_argument("--trace-file", type=Path)
+    output_parser.add_argument("--profile", type=Path)
+    output_parser.add_argument("--profile-mode", choices=profiling.MODES)
+    end = _own_args_end()
+    args, remaining = output_parser.parse_known_args(sys.argv[1:end])
+    remaining.extend(sys.argv[end:])
+    if args.trace_file or tracing.TRACE_ENV_VAR in os.environ:
+        tracing.start(args.trace_file)
+    if args.profile:
+        profiling.start(args.profile, args.profile_mode)
+    return args, remaining
+
+
+def _conda_main(patch_conda=None):
+    """Run the conda CLI, calling ``patch_conda`` once conda is imported."""
+    _handle_no_rc()
+    # Parsed first so that the profile includes the imports and plugins of conda
+    output_args, remaining = _parse_output_files()
+    with startup_profile.span("conda imports"):
+        from conda.base.context import Context
+        from conda.cli import main
+
+    _fix_sys_path()
 
-    manager = get_plugin_manager()
-    manager.load_plugins(plugin)
+    startup_profile.trace_calls(Context, "__init__", "context")
+    with startup_profile.span("plugins"):
+        from conda.plugins.manager import CondaPluginManager, get_plugin_manager
 
-    logger_parser = argparse.ArgumentParser(add_help=False)
-    logger_parser.add_argument("--log-file", type=Path)
-    args, remaining = logger_parser.parse_known_args()
-    if args.log_file:
+        from conda_constructor import plugin
+        from conda_constructor.plugin_cache import use_cached_entry_points
+
+        use_cached_entry_points()
+        startup_profile.trace_calls(CondaPluginManager, "load_entrypoints", "plugin entry points")
+        manager = get_plugin_manager()
+        manager.load_plugins(plugin)
+    if patch_conda is not None:
+        patch_conda()
+
+    if output_args.log_file or output_args.trace_file or output_args.profile:
         sys.argv[1:] = remaining
-        logger_context = setup_logger(args.log_file.resolve())
+    if output_args.log_file:
+        from conda_constructor.log_tee import tee_output
+
+        logger_context = tee_output(output_args.log_file.resolve())
     else:
         logger_context = nullcontext()
 
-    with logger_context:
+    with logger_context, startup_profile.span("command"):
         return main()
 
 
+def _constructor_main():
+    """
+    Run `conda.exe constructor` without importing the conda CLI if possible.
+
+    Extracting packages and printing the help of the subcommands do not need conda's
+    context, plugin manager, or solvers, which take a significant amount of time to load.
+    All other subcommands are passed on to the conda CLI.
+    """
+    from conda.base.constants import CONDA_PACKAGE_EXTENSIONS
+
+    from conda_constructor.cli import execute, parse_args_without_conda
+
+    _handle_no_rc()
+    output_args, remaining = _parse_output_files()
+    if output_args.log_file:
+        from conda_constructor.log_tee import tee_output
+
+        logger_context = tee_output(output_args.log_file.resolve())
+    else:
+        logger_context = nullcontext()
+    with logger_context:
+        with startup_profile.span("parse arguments"):
+            args = parse_args_without_conda(
+                remaining[1:], prog=f"{Path(sys.argv[0]).name} constructor"
+            )
+        if args is not None:
+            # Only the package formats of conda's built-in extractors are bundled
+            with startup_profile.span("command"):
+                return execute(
+                    args, package_extensions=CONDA_PACKAGE_EXTENSIONS, run_command=_run_command
+                )
+    _patch_root_prefix()
+    return _conda_main()
+
+
 def _patch_constructor_args(argv: list[str] = sys.argv) -> list[str]:
     legacy_args = {
         "--extract-conda-pkgs": ["constructor", "extract", "--conda-pkgs"],
@@ -222,22 +302,93 @@ def _patch_constructor_args(argv: list[str] = sys.argv) -> list[str]:
     return argv
 
 
-def main():
-    # https://docs.python.org/3/library/multiprocessing.html#multiprocessing.freeze_support
-    freeze_support()
+def _clean_extraction_dirs():
+    """Lock the extraction directory of this process.
+
+    If enabled, the extraction directories that killed processes left behind are removed.
+    """
+    from conda_constructor.extraction_dirs import (
+        clean_stale_extraction_dirs,
+        lock_extraction_dir,
+    )
+
+    # Always locked, so that other processes can tell that the directory is in use
+    lock_extraction_dir()
+    if os.environ.get("CONDA_STANDALONE_CLEAN_EXTRACTION_DIRS", "").lower() in (
+        "1",
+        "true",
+        "yes",
+    ):
+        clean_stale_extraction_dirs()
+
+
+def _forward_to_server():
+    """Run the command in a conda-standalone server if one is configured.
+
+    Returns None if the command has to run in this process.
+    """
+    connection_file = os.environ.get("CONDA_STANDALONE_SERVER")
+    if not connection_file or len(sys.argv) < 2:
+        return None
+    # The Python interpreter needs stdin, and the server cannot start itself
+    if sys.argv[1] in ("python", "-m") or sys.argv[1:3] == ["constructor", "server"]:
+        return None
+    from conda_constructor.server import forward, reads_stdin
+
+    # The server runs commands without stdin
+    if reads_stdin(sys.argv[1:]):
+        return None
+    return forward(sys.argv[1:], connection_file)
+
+
+def _run_command():
     if len(sys.argv) > 1:
         if sys.argv[1] == "constructor":
             sys.argv = _patch_constructor_args(sys.argv)
+            return _constructor_main()
+        elif sys.argv[1] in ("--version", "-V") and len(sys.argv) == 2:
+            from conda import __version__
+
+            print(f"conda {__version__}")
+            return
         # Some parts of conda call `sys.executable -m`, so conda-standalone needs to
         # interpret `conda.exe -m` as `conda.exe python -m`.
         elif sys.argv[1] == "python" or sys.argv[1] == "-m":
             return _python_subcommand()
         elif sys.argv[1] == "run":
+            from conda_constructor import activation_cache
+
+            activation_cache.record_environment()
             _patch_for_conda_run()
+            exit_code = activation_cache.run_cached(sys.argv[2:])
+            if exit_code is not None:
+                return exit_code
+            _patch_root_prefix()
+            return _conda_main(activation_cache.use_activation_cache)
+        elif sys.argv[1].startswith("shell."):
+            from conda_constructor import shell_cache
+
+            exit_code = shell_cache.run_cached(sys.argv[1:])
+            if exit_code is not None:
+                return exit_code
+            _patch_root_prefix()
+            return _conda_main(shell_cache.use_shell_cache)
 
     _patch_root_prefix()
     return _conda_main()
 
 
+def main():
+    # Started before freeze_support to profile spawned multiprocessing workers as well
+    profiling.start()
+    # https://docs.python.org/3/library/multiprocessing.html#multiprocessing.freeze_support
+    freeze_support()
+    _clean_extraction_dirs()
+    exit_code = _forward_to_server()
+    if exit_code is not None:
+        return exit_code
+    return _run_command()
+
+
 if __name__ == "__main__":
     sys.exit(main())
@@ -0,0 +1,56 @@
+import json
+from pathlib import Path
+
+from utils import run_conda
+
+
+def test_batch(tmp_path: Path):
+    (tmp_path / "pkgs").mkdir()
+    script = tmp_path / "steps.txt"
+    script.write_text(
+        "\n".join(
+            [
+                "# Comments and empty lines are skipped",
+                "",
+                "--version",
+                f"constructor extract --prefix '{tmp_path}' --conda-pkgs",
+                "config --show channels",
+            ]
+        )
+    )
+    report_file = tmp_path / "report.json"
+    process = run_conda(
+        "constructor",
+        "batch",
+        script,
+        "--report",
+        report_file,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    assert process.stdout.startswith("conda ")
+    assert "channels:" in process.stdout
+    assert "[3/3]" in process.stderr
+    report = json.loads(report_file.read_text())
+    assert [step["exit_code"] for step in report["steps"]] == [0, 0, 0]
+    assert report["skipped"] == []
+
+
+def test_batch_stops_on_failure(tmp_path: Path):
+    report_file = tmp_path / "report.json"
+    process = run_conda(
+        "constructor",
+        "batch",
+        "--report",
+        report_file,
+        input="--version\nconstructor not-a-subcommand\n--version\n",
+        capture_output=True,
+        text=True,
+    )
+    assert process.returncode == 2
+    assert process.stdout.count("conda ") == 1
+    report = json.loads(report_file.read_text())
+    assert [step["exit_code"] for step in report["steps"]] == [0, 2]
+    assert report["skipped"] == ["--version"]
+    assert report["exit_code"] == 2
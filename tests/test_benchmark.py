@@ -0,0 +1,55 @@
+import json
+from pathlib import Path
+
+import pytest
+from utils import run_conda
+
+
+def test_benchmark(tmp_path: Path):
+    report_file = tmp_path / "report.json"
+    process = run_conda(
+        "constructor",
+        "benchmark",
+        "--prefix",
+        tmp_path,
+        "--num-packages=2",
+        "--package-size=64",
+        "--num-processors=1",
+        "--repeat=1",
+        "--output",
+        report_file,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    report = json.loads(process.stdout)
+    assert report == json.loads(report_file.read_text())
+    assert {result["format"] for result in report["extract"]} == {".conda", ".tar.bz2"}
+    assert all(result["num_processors"] == 1 for result in report["extract"])
+    assert set(report["startup"]) == {"--version", "constructor --help", "list"}
+    for result in report["startup"].values():
+        assert result["seconds"]["median"] > 0
+        assert result["peak_rss_mb"] > 0
+    if report["system"]["frozen"]:
+        # The solver is only imported when a command solves
+        assert not any(result["imports_solver"] for result in report["startup"].values())
+    assert set(report["run"]) == {"direct", "cold_cache", "warm_cache"}
+    for result in report["run"].values():
+        assert result["seconds"]["median"] > 0
+    if report["extraction_dir"] is not None:
+        assert report["extraction_dir"]["files"] > 0
+    assert report["uninstall_scan"]["num_environments"] > 1
+    assert report["uninstall_scan"]["glob_seconds"]["median"] > 0
+    assert report["recommendation"]["num_processors"] == 1
+    # Temporary files are cleaned up
+    assert list(tmp_path.iterdir()) == [report_file]
+
+
+@pytest.mark.parametrize("option", ("--num-packages", "--package-size", "--repeat"))
+@pytest.mark.parametrize("value", ("0", "-1"))
+def test_benchmark_invalid_count(option: str, value: str):
+    process = run_conda(
+        "constructor", "benchmark", f"{option}={value}", capture_output=True, text=True
+    )
+    assert process.returncode == 2
+    assert "must be a positive integer" in process.stderr
@@ -1,10 +1,18 @@
+import hashlib
 import io
+import json
+import os
+import pstats
 import shutil
 import stat
 import subprocess
 import sys
 import tarfile
+import threading
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
 from pathlib import Path
+from textwrap import dedent
 
 import pytest
 from conda.base.constants import CONDA_PACKAGE_EXTENSIONS
@@ -21,6 +29,17 @@ TAR_EXTRACT_COMMANDS = (
 )
 
 
+@pytest.fixture
+def package_server():
+    """Serve the test packages over HTTP on a local port."""
+    handler = partial(SimpleHTTPRequestHandler, directory=str(HERE / "data"))
+    with ThreadingHTTPServer(("127.0.0.1", 0), handler) as server:
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        yield f"http://127.0.0.1:{server.server_address[1]}"
+        server.shutdown()
+
+
 @pytest.mark.parametrize("extract_command", CONDA_EXTRACT_COMMANDS)
 def test_extract_conda_pkgs(tmp_path: Path, extract_command: tuple[str]):
     pkgs_dir = tmp_path / "pkgs"
@@ -37,6 +56,32 @@ def test_extract_conda_pkgs(tmp_path: Path, extract_command: tuple[str]):
     assert missing_directories == []
 
 
+@pytest.mark.parametrize("extract_command", CONDA_EXTRACT_COMMANDS)
+@pytest.mark.parametrize(
+    "extra_args",
+    (
+        pytest.param((), id="without conda"),
+        # Only extractions that need conda's configuration are parsed by the conda CLI
+        pytest.param(("--reuse-pkgs-dirs",), id="with conda"),
+    ),
+)
+def test_extract_conda_pkgs_empty(
+    tmp_path: Path, extract_command: tuple[str], extra_args: tuple[str]
+):
+    (tmp_path / "pkgs").mkdir()
+    process = run_conda(
+        "constructor",
+        *extract_command,
+        "--prefix",
+        tmp_path,
+        *extra_args,
+        capture_output=True,
+        text=True,
+    )
+    assert process.returncode == 0, process.stderr
+    assert list((tmp_path / "pkgs").iterdir()) == []
+
+
 @pytest.mark.parametrize("extract_command", TAR_EXTRACT_COMMANDS)
 def test_extract_tarball_no_raise_deprecation_warning(tmp_path: Path, extract_command: tuple[str]):
     # See https://github.com/conda/conda-standalone/issues/143
@@ -55,6 +100,26 @@ def test_extract_tarball_no_raise_deprecation_warning(tmp_path: Path, extract_co
     assert b"DeprecationWarning: Python" not in process.stdout
 
 
+@pytest.mark.parametrize(
+    "option", ("--watch", "--pkgs-from-stdin", "--urls-from=-", "--reuse-pkgs-dirs")
+)
+@pytest.mark.parametrize("tar_first", (True, False), ids=("tar first", "tar last"))
+def test_extract_tarball_packages_only_option(tmp_path: Path, option: str, tar_first: bool):
+    args = ["--tar-from-stdin", option] if tar_first else [option, "--tar-from-stdin"]
+    process = run_conda(
+        "constructor",
+        "extract",
+        *args,
+        "--prefix",
+        tmp_path,
+        input="",
+        capture_output=True,
+        text=True,
+    )
+    assert process.returncode == 2
+    assert "not allowed with argument" in process.stderr
+
+
 @pytest.mark.parametrize("extract_command", TAR_EXTRACT_COMMANDS)
 def test_extract_tarball_umask(tmp_path: Path, extract_command: tuple[str]):
     "Ported from https://github.com/conda/conda-package-streaming/pull/65"
@@ -112,3 +177,298 @@ def test_extract_conda_pkgs_num_processors(tmp_path: Path, extract_command: tupl
         if not (pkgs_dir / expected_dir).exists():
             missing_directories.append(expected_dir)
     assert missing_directories == []
+
+
+def test_extract_conda_pkgs_log_file(tmp_path: Path):
+    pkgs_dir = tmp_path / "pkgs"
+    shutil.copytree(HERE / "data", pkgs_dir)
+    log_file = tmp_path / "extract.log"
+    run_conda(
+        "constructor",
+        "--log-file",
+        log_file,
+        "extract",
+        "--conda-pkgs",
+        "--prefix",
+        tmp_path,
+        check=True,
+    )
+    assert log_file.exists()
+    assert len([path for path in pkgs_dir.iterdir() if path.is_dir()]) == 2
+
+
+def test_extract_conda_pkgs_log_file_spawn(tmp_path: Path):
+    """The resource tracker of spawned workers must not keep the log pipes open."""
+    pkgs_dir = tmp_path / "pkgs"
+    shutil.copytree(HERE / "data", pkgs_dir)
+    log_file = tmp_path / "extract.log"
+    script = tmp_path / "extract.py"
+    script.write_text(
+        dedent(
+            """
+            import multiprocessing
+            import sys
+            import time
+            from pathlib import Path
+
+            from conda.base.constants import CONDA_PACKAGE_EXTENSIONS
+            from conda_constructor.cli import execute, parse_args_without_conda
+            from conda_constructor.log_tee import DRAIN_TIMEOUT, tee_output
+
+            if __name__ == "__main__":
+                # The default on macOS and Windows
+                multiprocessing.set_start_method("spawn", force=True)
+                args = ["extract", "--conda-pkgs", "--prefix", sys.argv[2]]
+                start = time.monotonic()
+                with tee_output(Path(sys.argv[1])):
+                    execute(
+                        parse_args_without_conda(args, prog="constructor"),
+                        package_extensions=CONDA_PACKAGE_EXTENSIONS,
+                    )
+                elapsed = time.monotonic() - start
+                # The output threads wait for DRAIN_TIMEOUT if the pipes are kept open
+                assert elapsed < DRAIN_TIMEOUT, elapsed
+            """
+        )
+    )
+    run_conda("python", script, log_file, tmp_path, check=True)
+    assert log_file.exists()
+    assert len([path for path in pkgs_dir.iterdir() if path.is_dir()]) == 2
+
+
+def test_extract_conda_pkgs_trace_file(tmp_path: Path):
+    pkgs_dir = tmp_path / "pkgs"
+    shutil.copytree(HERE / "data", pkgs_dir)
+    trace_file = tmp_path / "extract.json"
+    run_conda(
+        "constructor",
+        "--trace-file",
+        trace_file,
+        "extract",
+        "--conda-pkgs",
+        "--prefix",
+        tmp_path,
+        check=True,
+    )
+    events = json.loads(trace_file.read_text())["traceEvents"]
+    spans = {event["name"] for event in events if event["ph"] == "X"}
+    assert {"constructor extract", "extract packages", "extract package"} <= spans
+    packages = {event["args"]["package"] for event in events if event["name"] == "extract package"}
+    assert packages == {path.name for path in (HERE / "data").iterdir()}
+
+
+@pytest.mark.parametrize("mode", ("cprofile", "sampling"))
+def test_extract_conda_pkgs_profile(tmp_path: Path, mode: str):
+    pkgs_dir = tmp_path / "pkgs"
+    shutil.copytree(HERE / "data", pkgs_dir)
+    profile = tmp_path / "profiles" / ("extract.prof" if mode == "cprofile" else "extract.json")
+    profile.parent.mkdir()
+    run_conda(
+        "constructor",
+        "--profile",
+        profile,
+        "--profile-mode",
+        mode,
+        "extract",
+        "--conda-pkgs",
+        "--prefix",
+        tmp_path,
+        check=True,
+    )
+    # One profile of the main process and one per worker process
+    profiles = sorted(profile.parent.iterdir())
+    assert profile in profiles
+    assert len(profiles) > 1
+    for path in profiles:
+        if mode == "cprofile":
+            assert pstats.Stats(str(path)).total_calls > 0
+        else:
+            assert json.loads(path.read_text())["profiles"]
+
+
+def test_extract_conda_pkgs_from_stdin(tmp_path: Path):
+    pkgs_dir = tmp_path / "pkgs"
+    data_dir = HERE / "data"
+    shutil.copytree(data_dir, pkgs_dir)
+    # Extract only one package and ignore everything after the sentinel
+    pkg_names = [pkg.name for pkg in data_dir.iterdir()]
+    run_conda(
+        "constructor",
+        "extract",
+        "--conda-pkgs",
+        "--pkgs-from-stdin",
+        "--prefix",
+        tmp_path,
+        input="\n".join([pkg_names[0], ".extract_done", *pkg_names[1:]]),
+        text=True,
+        check=True,
+    )
+    extracted = [path.name for path in pkgs_dir.iterdir() if path.is_dir()]
+    assert len(extracted) == 1
+    assert pkg_names[0].startswith(extracted[0])
+
+
+def test_extract_conda_pkgs_watch(tmp_path: Path):
+    pkgs_dir = tmp_path / "pkgs"
+    pkgs_dir.mkdir()
+    data_dir = HERE / "data"
+    process = subprocess.Popen(
+        [
+            CONDA_EXE,
+            "constructor",
+            "extract",
+            "--conda-pkgs",
+            "--watch",
+            "--poll-interval=0.1",
+            "--prefix",
+            tmp_path,
+        ],
+    )
+    for pkg in data_dir.iterdir():
+        # Move packages into place once they are fully written
+        shutil.copy(pkg, tmp_path / pkg.name)
+        (tmp_path / pkg.name).rename(pkgs_dir / pkg.name)
+    (pkgs_dir / ".extract_done").touch()
+    assert process.wait(timeout=300) == 0
+    assert not (pkgs_dir / ".extract_done").exists()
+    missing_directories = []
+    for pkg in data_dir.iterdir():
+        expected_dir = pkg.name
+        for ext in CONDA_PACKAGE_EXTENSIONS:
+            expected_dir = expected_dir.removesuffix(ext)
+        if not (pkgs_dir / expected_dir).exists():
+            missing_directories.append(expected_dir)
+    assert missing_directories == []
+
+
+@pytest.mark.parametrize(
+    "extract_command",
+    (
+        pytest.param(("extract", "--conda-pkgs"), id="conda-pkgs"),
+        pytest.param(("extract", "--tar-from-stdin"), id="tar-from-stdin"),
+    ),
+)
+def test_extract_background(tmp_path: Path, extract_command: tuple[str]):
+    data_dir = HERE / "data"
+    if "--conda-pkgs" in extract_command:
+        shutil.copytree(data_dir, tmp_path / "pkgs")
+        stdin = None
+    else:
+        stdin = io.BytesIO()
+        with tarfile.open(fileobj=stdin, mode="w") as tar:
+            tar.add(data_dir, arcname="data")
+        stdin = stdin.getvalue()
+    run_conda(
+        "constructor",
+        *extract_command,
+        "--background",
+        "--max-bytes-per-second=50M",
+        "--prefix",
+        tmp_path,
+        input=stdin,
+        check=True,
+    )
+    if "--conda-pkgs" in extract_command:
+        for pkg in data_dir.iterdir():
+            expected_dir = pkg.name
+            for ext in CONDA_PACKAGE_EXTENSIONS:
+                expected_dir = expected_dir.removesuffix(ext)
+            assert (tmp_path / "pkgs" / expected_dir / "info" / "index.json").exists()
+    else:
+        assert sorted(path.name for path in (tmp_path / "data").iterdir()) == sorted(
+            path.name for path in data_dir.iterdir()
+        )
+
+
+def test_extract_conda_pkgs_reuse_pkgs_dirs(tmp_path: Path):
+    data_dir = HERE / "data"
+    shared_prefix = tmp_path / "shared"
+    shutil.copytree(data_dir, shared_prefix / "pkgs")
+    run_conda("constructor", "extract", "--conda-pkgs", "--prefix", shared_prefix, check=True)
+
+    prefix = tmp_path / "prefix"
+    shutil.copytree(data_dir, prefix / "pkgs")
+    env = os.environ.copy()
+    env["CONDA_PKGS_DIRS"] = ",".join([str(shared_prefix / "pkgs"), str(prefix / "pkgs")])
+    run_conda(
+        "constructor",
+        "extract",
+        "--conda-pkgs",
+        "--reuse-pkgs-dirs",
+        "--prefix",
+        prefix,
+        env=env,
+        check=True,
+    )
+    for pkg in data_dir.iterdir():
+        expected_dir = pkg.name
+        for ext in CONDA_PACKAGE_EXTENSIONS:
+            expected_dir = expected_dir.removesuffix(ext)
+        index_json = prefix / "pkgs" / expected_dir / "info" / "index.json"
+        shared_index_json = shared_prefix / "pkgs" / expected_dir / "info" / "index.json"
+        assert index_json.read_bytes() == shared_index_json.read_bytes()
+        # Files are hardlinked when both package caches are on the same file system
+        assert index_json.stat().st_nlink == 2
+
+
+def test_extract_conda_pkgs_urls_from(tmp_path: Path, package_server: str):
+    data_dir = HERE / "data"
+    lines = ["@EXPLICIT"]
+    for pkg in data_dir.iterdir():
+        sha256 = hashlib.sha256(pkg.read_bytes()).hexdigest()
+        lines.append(f"{package_server}/{pkg.name}#{sha256}")
+    run_conda(
+        "constructor",
+        "extract",
+        "--conda-pkgs",
+        "--urls-from=-",
+        "--num-downloads=2",
+        "--prefix",
+        tmp_path,
+        input="\n".join(lines),
+        text=True,
+        check=True,
+    )
+    for pkg in data_dir.iterdir():
+        assert (tmp_path / "pkgs" / pkg.name).read_bytes() == pkg.read_bytes()
+        expected_dir = pkg.name
+        for ext in CONDA_PACKAGE_EXTENSIONS:
+            expected_dir = expected_dir.removesuffix(ext)
+        assert (tmp_path / "pkgs" / expected_dir / "info" / "index.json").exists()
+
+
+@pytest.mark.parametrize("value", ("0", "-1"))
+def test_extract_conda_pkgs_invalid_num_downloads(tmp_path: Path, value: str):
+    process = run_conda(
+        "constructor",
+        "extract",
+        "--conda-pkgs",
+        "--urls-from=-",
+        f"--num-downloads={value}",
+        "--prefix",
+        tmp_path,
+        capture_output=True,
+        text=True,
+    )
+    assert process.returncode == 2
+    assert "must be a positive integer" in process.stderr
+
+
+def test_extract_conda_pkgs_urls_from_checksum_mismatch(tmp_path: Path, package_server: str):
+    pkg = next((HERE / "data").iterdir())
+    urls_file = tmp_path / "urls.txt"
+    urls_file.write_text(f"{package_server}/{pkg.name}#{'0' * 64}\n")
+    process = run_conda(
+        "constructor",
+        "extract",
+        "--conda-pkgs",
+        "--urls-from",
+        urls_file,
+        "--prefix",
+        tmp_path,
+        capture_output=True,
+        text=True,
+    )
+    assert process.returncode != 0
+    assert f"Failed to download {package_server}/{pkg.name}" in process.stderr
+    assert not (tmp_path / "pkgs" / pkg.name).exists()
@@ -3,7 +3,9 @@ import os
 import re
 import subprocess
 import sys
+import time
 from pathlib import Path
+from textwrap import dedent
 
 import pytest
 from ruamel.yaml import YAML
@@ -78,6 +80,154 @@ def test_constructor():
     run_conda("constructor", "--help", check=True)
 
 
+@pytest.mark.parametrize("subcommand", ("extract", "uninstall", "benchmark"))
+def test_constructor_subcommand_help(subcommand: str):
+    process = run_conda(
+        "constructor", subcommand, "--help", capture_output=True, text=True, check=True
+    )
+    assert f"constructor {subcommand} [-h]" in process.stdout
+
+
+def test_version():
+    process = run_conda("--version", capture_output=True, text=True, check=True)
+    assert process.stdout.startswith("conda ")
+
+
+def test_optimization_level():
+    # Builds with optimized bytecode must also run the interpreter at that level
+    expected = int(os.environ.get("PYINSTALLER_OPTIMIZE", 0))
+    process = run_conda(
+        "python",
+        "-c",
+        "import sys; print(sys.flags.optimize)",
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    assert int(process.stdout) == expected
+
+
+def test_lazy_components():
+    script = dedent(
+        """
+        import json
+        import os
+        import sys
+
+        from conda_constructor.startup_profile import _is_onefile
+
+        def extracted():
+            return os.path.exists(os.path.join(sys._MEIPASS, "libmambapy"))
+
+        result = {"onefile": _is_onefile()}
+        if result["onefile"]:
+            result["before_import"] = extracted()
+            import libmambapy
+
+            result["after_import"] = extracted()
+        print(json.dumps(result))
+        """
+    )
+    process = run_conda("python", "-c", script, capture_output=True, text=True, check=True)
+    result = json.loads(process.stdout)
+    if not result["onefile"]:
+        pytest.skip("Only single-file builds extract components on first use.")
+    if "libmambapy" in os.environ.get("PYINSTALLER_LAZY_COMPONENTS", "libmambapy").split(","):
+        assert not result["before_import"]
+    assert result["after_import"]
+
+
+@pytest.mark.parametrize("args", (["constructor", "--help"], ["info", "--json"]))
+def test_startup_profile(tmp_path: Path, args: list[str]):
+    profile = tmp_path / "startup.json"
+    env = os.environ.copy()
+    env["CONDA_STANDALONE_STARTUP_PROFILE"] = str(profile)
+    run_conda(*args, env=env, capture_output=True, check=True)
+    report = json.loads(profile.read_text())
+    phases = [phase["name"] for phase in report["phases"]]
+    if args[0] == "info":
+        assert {
+            "conda imports",
+            "plugins",
+            "plugin entry points",
+            "context",
+            "command",
+        }.issubset(phases)
+    else:
+        # Handled without conda
+        assert "parse arguments" in phases
+        assert "plugins" not in phases
+    if report["onefile"] and sys.platform != "darwin":
+        assert phases[:2] == ["bootloader", "python init"]
+    imported_modules = set()
+    nodes = [node for thread_nodes in report["imports"].values() for node in thread_nodes]
+    while nodes:
+        node = nodes.pop()
+        imported_modules.add(node["module"])
+        nodes.extend(node["children"])
+    assert "conda_constructor.cli" in imported_modules
+    if args[0] == "info" and report["frozen"]:
+        # The plug-in entry points are written at build time
+        assert "conda_constructor._plugins" in imported_modules
+        # and the solver is only imported when a command solves
+        assert "libmambapy" not in imported_modules
+    assert report["peak_rss_bytes"] > 0
+
+
+def test_deferred_plugin_subcommand():
+    process = run_conda(
+        "repoquery", "search", "--help", capture_output=True, text=True, check=True
+    )
+    assert "--platform" in process.stdout
+
+
+def test_clean_extraction_dirs(tmp_path: Path):
+    extraction_dirs = {
+        "stale": tmp_path / "_MEIabcdef",
+        "running": tmp_path / "_MEIghijkl",
+        "just started": tmp_path / "_MEImnopqr",
+        "other application": tmp_path / "_MEIstuvwx",
+    }
+    old = time.time() - 3600
+    for name, extraction_dir in extraction_dirs.items():
+        extraction_dir.mkdir()
+        if name != "other application":
+            lock_file = extraction_dir / "conda-standalone.lock"
+            lock_file.touch()
+            if name != "just started":
+                os.utime(lock_file, (old, old))
+    env = os.environ.copy()
+    env["CONDA_STANDALONE_CLEAN_EXTRACTION_DIRS"] = "1"
+    for var in ("TMPDIR", "TEMP", "TMP"):
+        env[var] = str(tmp_path)
+    with open(extraction_dirs["running"] / "conda-standalone.lock", "a+b") as running_lock:
+        # Held like by a running conda-standalone process
+        if sys.platform == "win32":
+            import msvcrt
+
+            running_lock.seek(0)
+            msvcrt.locking(running_lock.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            import fcntl
+
+            fcntl.flock(running_lock.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        run_conda("--version", env=env, capture_output=True, check=True)
+    assert not extraction_dirs["stale"].exists()
+    assert extraction_dirs["running"].exists()
+    assert extraction_dirs["just started"].exists()
+    assert extraction_dirs["other application"].exists()
+
+
+def test_startup_profile_chrome(tmp_path: Path):
+    profile = tmp_path / "startup.json"
+    env = os.environ.copy()
+    env["CONDA_STANDALONE_STARTUP_PROFILE"] = str(profile)
+    env["CONDA_STANDALONE_STARTUP_PROFILE_FORMAT"] = "chrome"
+    run_conda("constructor", "--help", env=env, capture_output=True, check=True)
+    events = json.loads(profile.read_text())["traceEvents"]
+    assert {event["cat"] for event in events if event["ph"] == "X"} == {"phase", "import"}
+
+
 @pytest.mark.parametrize(
     "args",
     (
@@ -249,6 +399,73 @@ def test_python():
     assert eval(process.stdout) == ["-c", "extra-arg"]
 
 
+def test_python_stdin():
+    # Multi-line statements and names defined in earlier lines
+    script = "def double(x):\n    return 2 * x\n\nprint(double(21), __name__)\n"
+    process = run_conda("python", input=script, check=True, capture_output=True, text=True)
+    assert process.stdout.strip() == "42 __main__"
+
+
+def test_python_script_bytecode_cache(tmp_path: Path):
+    cache_dir = tmp_path / "cache"
+    env = {**os.environ, "CONDA_STANDALONE_BYTECODE_CACHE": str(cache_dir)}
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    script_file = tmp_path / "script.py"
+    script_file.write_text("import sys\nprint(__name__, sys.argv[1:])\nassert False\n")
+
+    for _ in range(2):
+        process = run_conda("python", script_file, "arg", capture_output=True, text=True, env=env)
+        assert process.returncode == 1
+        assert process.stdout.strip() == "__main__ ['arg']"
+        assert "AssertionError" in process.stderr
+    assert len(list(cache_dir.glob("*.pyc"))) == 1
+
+    # Optimized bytecode without asserts is cached separately
+    process = run_conda(
+        "python", "-O", script_file, "arg", check=True, capture_output=True, text=True, env=env
+    )
+    assert process.stdout.strip() == "__main__ ['arg']"
+    assert len(list(cache_dir.glob("*.opt-1.pyc"))) == 1
+
+
+def test_python_script_bytecode_cache_pruning(tmp_path: Path):
+    cache_dir = tmp_path / "cache"
+    cache_dir.mkdir()
+    env = {**os.environ, "CONDA_STANDALONE_BYTECODE_CACHE": str(cache_dir)}
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    # Entries that were not used for more than 30 days are removed when a new entry is written
+    old_entry = cache_dir / "old.pyc"
+    recent_entry = cache_dir / "recent.pyc"
+    for entry, age_days in ((old_entry, 31), (recent_entry, 29)):
+        entry.write_bytes(b"")
+        mtime = time.time() - age_days * 24 * 60 * 60
+        os.utime(entry, (mtime, mtime))
+    script_file = tmp_path / "script.py"
+    script_file.write_text("print(42)\n")
+    process = run_conda("python", script_file, check=True, capture_output=True, text=True, env=env)
+    assert process.stdout.strip() == "42"
+    assert not old_entry.exists()
+    assert recent_entry.exists()
+    assert len(list(cache_dir.glob("*.pyc"))) == 2
+
+
+def test_python_importtime(tmp_path: Path):
+    (tmp_path / "imported_module.py").write_text("x = 1\n")
+    process = run_conda(
+        "python",
+        "-X",
+        "importtime",
+        "-c",
+        f"import sys; sys.path.insert(0, {str(tmp_path)!r}); import imported_module",
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    lines = process.stderr.splitlines()
+    assert lines[0] == "import time: self [us] | cumulative | imported package"
+    assert lines[-1].endswith("| imported_module")
+
+
 def test_conda_run():
     env = os.environ.copy()
     for key in os.environ:
@@ -308,3 +525,194 @@ def test_conda_run_conda_exe(tmp_path: Path, with_log: bool):
             # which adds some unnecessary stderr output; so, only read the first line
             log_text = log_text.split("\n")[0]
         assert os.path.realpath(log_text.strip()) == os.path.realpath(CONDA_EXE)
+
+
+def test_conda_run_activation_cache(tmp_path: Path):
+    prefix = tmp_path / "env"
+    (prefix / "conda-meta").mkdir(parents=True)
+    (prefix / "conda-meta" / "history").touch()
+    cache_dir = tmp_path / "cache"
+    env = os.environ.copy()
+    env["CONDA_STANDALONE_ACTIVATION_CACHE"] = str(cache_dir)
+    for key in os.environ:
+        if key.startswith(("CONDA_PREFIX", "CONDA_SHLVL")):
+            env.pop(key)
+    code = "import os;print(os.environ['CONDA_PREFIX'], os.environ.get('ACTIVATED'))"
+
+    def conda_run():
+        process = run_conda(
+            "run",
+            "-p",
+            prefix,
+            sys.executable,
+            "-c",
+            code,
+            check=True,
+            text=True,
+            capture_output=True,
+            env=env,
+        )
+        return process.stdout.strip()
+
+    # The first run fills the cache, the second one runs from the cache
+    for _ in range(2):
+        assert conda_run() == f"{prefix} None"
+        assert len(list(cache_dir.glob("*.json"))) == 1
+
+    # Activation scripts invalidate the cache entry and are run by the wrapper script
+    activate_d = prefix / "etc" / "conda" / "activate.d"
+    activate_d.mkdir(parents=True)
+    if sys.platform == "win32":
+        (activate_d / "activated.bat").write_text("@set ACTIVATED=yes\n")
+    else:
+        (activate_d / "activated.sh").write_text("export ACTIVATED=yes\n")
+    assert conda_run() == f"{prefix} yes"
+
+
+def test_conda_run_activation_cache_new_condarc(tmp_path: Path):
+    prefix = tmp_path / "env"
+    (prefix / "conda-meta").mkdir(parents=True)
+    (prefix / "conda-meta" / "history").touch()
+    home = tmp_path / "home"
+    home.mkdir()
+    env = os.environ.copy()
+    env["CONDA_STANDALONE_ACTIVATION_CACHE"] = str(tmp_path / "cache")
+    env["HOME"] = env["USERPROFILE"] = str(home)
+
+    def prompt_modifier():
+        process = run_conda(
+            "run",
+            "-p",
+            prefix,
+            sys.executable,
+            "-c",
+            "import os; print(os.environ['CONDA_PROMPT_MODIFIER'])",
+            check=True,
+            text=True,
+            capture_output=True,
+            env=env,
+        )
+        return process.stdout.strip()
+
+    for _ in range(2):
+        assert prompt_modifier() == f"({prefix})"
+    # Configuration files that did not exist when the entry was written invalidate it too
+    (home / ".condarc").write_text('env_prompt: "[custom]"\n')
+    assert prompt_modifier() == "[custom]"
+
+
+def test_conda_run_child_options(tmp_path: Path):
+    prefix = tmp_path / "env"
+    (prefix / "conda-meta").mkdir(parents=True)
+    (prefix / "conda-meta" / "history").touch()
+    env = os.environ.copy()
+    env["CONDA_STANDALONE_ACTIVATION_CACHE"] = str(tmp_path / "cache")
+    # Options after the command of conda run belong to the command, not to conda-standalone
+    process = run_conda(
+        "run",
+        "-p",
+        prefix,
+        sys.executable,
+        "-c",
+        "import sys; print(sys.argv[1:])",
+        "--profile",
+        tmp_path / "profile.out",
+        "--no-rc",
+        check=True,
+        text=True,
+        capture_output=True,
+        env=env,
+        cwd=tmp_path,
+    )
+    assert process.stdout.strip() == str(["--profile", str(tmp_path / "profile.out"), "--no-rc"])
+    assert not (tmp_path / "profile.out").exists()
+
+
+def test_shell_cache(tmp_path: Path):
+    prefix = tmp_path / "env"
+    (prefix / "conda-meta").mkdir(parents=True)
+    (prefix / "conda-meta" / "history").touch()
+    cache_dir = tmp_path / "cache"
+    env = os.environ.copy()
+    env["CONDA_STANDALONE_SHELL_CACHE"] = str(cache_dir)
+    if sys.platform == "win32":
+        shell, script = "shell.powershell", "activated.ps1"
+    else:
+        shell, script = "shell.posix", "activated.sh"
+
+    def conda_shell(*args):
+        process = run_conda(shell, *args, check=True, text=True, capture_output=True, env=env)
+        # Single-file builds extract themselves into a new directory on every run
+        return re.sub(r"_MEI\w+", "_MEI", process.stdout)
+
+    # The first run fills the cache, the second one prints the cached output
+    for args in (("hook",), ("activate", prefix)):
+        output = conda_shell(*args)
+        assert output
+        assert conda_shell(*args) == output
+    assert len(list(cache_dir.glob("*.json"))) == 2
+
+    # New activation scripts invalidate the cache entry
+    activate_d = prefix / "etc" / "conda" / "activate.d"
+    activate_d.mkdir(parents=True)
+    (activate_d / script).touch()
+    assert script in conda_shell("activate", prefix)
+
+
+def test_shell_cache_new_condarc(tmp_path: Path):
+    home = tmp_path / "home"
+    home.mkdir()
+    env = os.environ.copy()
+    env["CONDA_STANDALONE_SHELL_CACHE"] = str(tmp_path / "cache")
+    env["HOME"] = env["USERPROFILE"] = str(home)
+    shell = "shell.powershell" if sys.platform == "win32" else "shell.posix"
+
+    def conda_shell_hook():
+        process = run_conda(shell, "hook", check=True, text=True, capture_output=True, env=env)
+        return process.stdout
+
+    output = conda_shell_hook()
+    assert conda_shell_hook() == output
+    # Configuration files that did not exist when the entry was written invalidate it too,
+    # like the one `conda config --set auto_activate_base false` creates
+    (home / ".condarc").write_text("auto_activate_base: false\n")
+    assert conda_shell_hook() != output
+
+
+def test_log_file_child_processes(tmp_path: Path):
+    log_file = tmp_path / "conda_run.log"
+    process = run_conda(
+        "--log-file",
+        log_file,
+        "run",
+        "--no-capture-output",
+        "-p",
+        sys.prefix,
+        "python",
+        "-c",
+        "import sys; print('to stdout'); print('to stderr', file=sys.stderr)",
+        check=True,
+        text=True,
+        capture_output=True,
+    )
+    assert "to stdout" in process.stdout
+    assert "to stderr" in process.stderr
+    log_text = log_file.read_text()
+    assert "to stdout" in log_text
+    assert "to stderr" in log_text
+
+
+def test_log_file_unchanged_output(tmp_path: Path):
+    log_file = tmp_path / "extract.log"
+    process = run_conda(
+        "constructor",
+        "--log-file",
+        log_file,
+        "extract",
+        "--help",
+        check=True,
+        text=True,
+        capture_output=True,
+    )
+    assert process.stdout
+    assert log_file.read_text() == process.stdout
@@ -0,0 +1,185 @@
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import pytest
+from utils import CONDA_EXE, run_conda
+
+HERE = Path(__file__).parent
+
+
+@pytest.fixture
+def server(tmp_path: Path):
+    connection_file = tmp_path / "server.json"
+    process = subprocess.Popen(
+        [CONDA_EXE, "constructor", "server", "--connection-file", connection_file]
+    )
+    try:
+        for _ in range(300):
+            if connection_file.exists() or process.poll() is not None:
+                break
+            time.sleep(0.1)
+        assert connection_file.exists(), "The server did not start."
+        yield connection_file
+        run_conda(
+            "constructor", "server", "--connection-file", connection_file, "--stop", check=True
+        )
+        assert process.wait(timeout=30) == 0
+        assert not connection_file.exists()
+    finally:
+        if process.poll() is None:
+            process.kill()
+
+
+def test_server(tmp_path: Path, server: Path):
+    env = os.environ.copy()
+    env["CONDA_STANDALONE_SERVER"] = str(server)
+    for channel in ("first-channel", "second-channel"):
+        # The environment of the client is used and the configuration is reset
+        env["CONDA_CHANNELS"] = channel
+        process = run_conda(
+            "config",
+            "--show",
+            "channels",
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        assert channel in process.stdout
+        assert ("second" if channel.startswith("first") else "first") not in process.stdout
+
+    # Relative paths are resolved against the working directory of the client
+    (tmp_path / "pkgs").mkdir()
+    run_conda(
+        "constructor",
+        "extract",
+        "--prefix",
+        ".",
+        "--conda-pkgs",
+        env=env,
+        cwd=tmp_path,
+        check=True,
+    )
+
+    # Commands that read stdin run in the client, because the server has no stdin
+    tarball = HERE / "data" / "futures-compat-1.0-py3_0.tar.bz2"
+    (tmp_path / "tarball").mkdir()
+    run_conda(
+        "constructor",
+        "extract",
+        "--prefix",
+        tmp_path / "tarball",
+        "--tar-from-stdin",
+        env=env,
+        input=tarball.read_bytes(),
+        check=True,
+    )
+    assert (tmp_path / "tarball" / "info" / "index.json").exists()
+
+    process = run_conda("constructor", "not-a-subcommand", env=env, capture_output=True, text=True)
+    assert process.returncode == 2
+    assert "invalid choice" in process.stderr
+
+
+def test_server_unreachable(tmp_path: Path):
+    env = os.environ.copy()
+    env["CONDA_STANDALONE_SERVER"] = str(tmp_path / "missing.json")
+    process = run_conda("--version", env=env, capture_output=True, text=True, check=True)
+    assert process.stdout.startswith("conda ")
+
+
+def test_server_idle_timeout(tmp_path: Path):
+    connection_file = tmp_path / "server.json"
+    run_conda(
+        "constructor",
+        "server",
+        "--connection-file",
+        connection_file,
+        "--idle-timeout",
+        "1",
+        timeout=60,
+        check=True,
+    )
+    assert not connection_file.exists()
+
+
+def test_server_idle_timeout_long_command(tmp_path: Path):
+    connection_file = tmp_path / "server.json"
+    process = subprocess.Popen(
+        [
+            CONDA_EXE,
+            "constructor",
+            "server",
+            "--connection-file",
+            connection_file,
+            "--idle-timeout",
+            "2",
+        ]
+    )
+    try:
+        for _ in range(300):
+            if connection_file.exists() or process.poll() is not None:
+                break
+            time.sleep(0.1)
+        assert connection_file.exists(), "The server did not start."
+        prefix = tmp_path / "env"
+        (prefix / "conda-meta").mkdir(parents=True)
+        (prefix / "conda-meta" / "history").touch()
+        env = os.environ.copy()
+        env["CONDA_STANDALONE_SERVER"] = str(connection_file)
+        env["CONDA_STANDALONE_ACTIVATION_CACHE"] = str(tmp_path / "cache")
+        parent_pids = []
+        # The server must not shut down while a command runs for longer than the timeout
+        for sleep in (5, 0):
+            client = run_conda(
+                "run",
+                "-p",
+                prefix,
+                sys.executable,
+                "-c",
+                f"import os, time; time.sleep({sleep}); print(os.getppid())",
+                env=env,
+                capture_output=True,
+                text=True,
+                check=True,
+            )
+            parent_pids.append(int(client.stdout))
+        assert parent_pids[0] == parent_pids[1], "The second command did not run in the server."
+        # Idle again after the command
+        assert process.wait(timeout=30) == 0
+        assert not connection_file.exists()
+    finally:
+        if process.poll() is None:
+            process.kill()
+
+
+@pytest.mark.parametrize(
+    "argv,expected",
+    (
+        ("constructor extract --prefix . --tar-from-stdin", True),
+        ("--extract-tarball --prefix .", True),
+        ("constructor extract --prefix . --conda-pkgs --pkgs-from-stdin", True),
+        ("constructor extract --prefix . --conda-pkgs --urls-from -", True),
+        ("constructor extract --prefix . --conda-pkgs --urls-from=-", True),
+        ("constructor extract --prefix . --conda-pkgs --urls-from urls.txt", False),
+        ("constructor batch", True),
+        ("constructor batch --report report.json -", True),
+        ("constructor batch script.txt --report report.json", False),
+        ("constructor extract --prefix . --conda-pkgs", False),
+    ),
+)
+def test_server_reads_stdin(argv: str, expected: bool):
+    process = run_conda(
+        "python",
+        "-c",
+        "import sys; from conda_constructor.server import reads_stdin; "
+        "print(reads_stdin(sys.argv[1:]))",
+        *argv.split(),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    assert process.stdout.strip() == str(expected)
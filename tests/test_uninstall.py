@@ -88,8 +88,11 @@ def run_uninstaller(
     remove_config_files: str | None = None,
     remove_user_data: bool = False,
     needs_sudo: bool = False,
+    single_transaction: bool = False,
 ) -> subprocess.CompletedProcess:
     args = ["--prefix", str(prefix)]
+    if single_transaction:
+        args.append("--single-transaction")
     if remove_caches:
         args.append("--remove-caches")
     if remove_config_files:
@@ -122,6 +125,22 @@ def test_uninstallation(
         assert str(base_env) not in environments and str(second_env) in environments
 
 
+def test_uninstallation_single_transaction(
+    mock_system_paths: dict[str, Path],
+    tmp_env: TmpEnvFixture,
+):
+    environments_txt = mock_system_paths["home"] / ".conda" / "environments.txt"
+    with tmp_env(shallow=False) as base_env:
+        nested_env = base_env / "envs" / "nested"
+        run_conda("create", "-y", "-p", str(nested_env), check=True)
+        environments = environments_txt.read_text().splitlines()
+        assert str(base_env) in environments and str(nested_env) in environments
+        run_uninstaller(base_env, single_transaction=True)
+        assert not base_env.exists()
+        environments = environments_txt.read_text().splitlines()
+        assert str(base_env) not in environments and str(nested_env) not in environments
+
+
 def test_uninstallation_frozen_environment(
     tmp_env: TmpEnvFixture,
 ):
@@ -513,9 +532,13 @@ def test_delete_self(
             assert unexpected_files == []
 
 
+@pytest.mark.parametrize(
+    "single_transaction", (False, True), ids=("conda remove", "single transaction")
+)
 def test_uninstallation_default_environment(
     mock_system_paths: dict[str, Path],
     tmp_env: TmpEnvFixture,
+    single_transaction: bool,
 ):
     environments_txt = mock_system_paths["home"] / ".conda" / "environments.txt"
     yaml = YAML()
@@ -546,7 +569,7 @@ def test_uninstallation_default_environment(
         with condarc_full_path_extra.open(mode="w") as crc:
             yaml.dump(config_full_path_extra, crc)
 
-        proc = run_uninstaller(base_env)
+        proc = run_uninstaller(base_env, single_transaction=single_transaction)
 
         environments = environments_txt.read_text().splitlines()
         assert not base_env.exists()
@@ -583,3 +606,91 @@ def test_uninstallation_uninstall_active_environment(
         with pytest.raises(subprocess.SubprocessError):
             run_uninstaller(dummy_env)
         assert dummy_env.exists()
+
+
+def test_find_prefixes(tmp_path: Path):
+    installation = tmp_path / "installation"
+    expected = [
+        installation,
+        installation / "envs" / "env",
+        installation / "custom" / "env",
+        installation / "envs" / "env" / "envs" / "nested",
+    ]
+    # Environment files inside directories managed by conda are not environments
+    ignored = [
+        installation / "pkgs" / "package" / "info" / "env",
+        installation / "lib" / "python3.13" / "site-packages" / "env",
+    ]
+    for prefix in (*expected, *ignored):
+        (prefix / "conda-meta").mkdir(parents=True)
+        (prefix / "conda-meta" / "history").touch()
+    process = run_conda(
+        "python",
+        "-c",
+        "import sys; from pathlib import Path; "
+        "from conda_constructor.uninstall import _find_prefixes; "
+        "print(*_find_prefixes(Path(sys.argv[1])), sep='\\n')",
+        installation,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    found = [Path(line) for line in process.stdout.splitlines()]
+    assert found == sorted(
+        (prefix.resolve() for prefix in expected), key=lambda x: (len(x.parts), x)
+    )
+
+
+def test_nesting_parents(tmp_path: Path):
+    installation = tmp_path / "installation"
+    prefixes = [
+        installation,
+        installation / "envs" / "env",
+        installation / "envs" / "other",
+        installation / "envs" / "env" / "envs" / "nested",
+    ]
+    process = run_conda(
+        "python",
+        "-c",
+        "import sys; from pathlib import Path; "
+        "from conda_constructor.uninstall import _nesting_parents; "
+        "parents = _nesting_parents([Path(arg) for arg in sys.argv[1:]]); "
+        "print(*(f'{child}\\t{parent}' for child, parent in parents.items()), sep='\\n')",
+        *prefixes,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    parents = dict(line.split("\t") for line in process.stdout.splitlines())
+    assert parents == {
+        str(prefixes[1]): str(prefixes[0]),
+        str(prefixes[2]): str(prefixes[0]),
+        str(prefixes[3]): str(prefixes[1]),
+    }
+
+
+def test_allow_removal(tmp_path: Path, monkeypatch: MonkeyPatch):
+    root_prefix = tmp_path / "root"
+    default_env = tmp_path / "default"
+    monkeypatch.setenv("CONDA_ROOT_PREFIX", str(root_prefix))
+    monkeypatch.delenv("CONDA_DEFAULT_ACTIVATION_ENV", raising=False)
+    process = run_conda(
+        "python",
+        "-c",
+        "import os, sys; from pathlib import Path; "
+        "from conda_constructor.uninstall import _allow_removal; "
+        "names = ('CONDA_ROOT_PREFIX', 'CONDA_DEFAULT_ACTIVATION_ENV'); "
+        "prefixes = [Path(arg) for arg in sys.argv[1:]]\n"
+        "with _allow_removal(prefixes, prefixes[0], prefixes[1]):\n"
+        "    print(*(os.environ.get(name) for name in names))\n"
+        "print(*(os.environ.get(name) for name in names))",
+        root_prefix,
+        default_env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    during, after = process.stdout.splitlines()
+    root_during, default_during = during.split(" ", 1)
+    assert root_during == "None" and default_during != "None"
+    assert after == f"{root_prefix} None"